@@ -0,0 +1,78 @@
+"""
+Micro-benchmark for the D2 API payload decoder.
+
+    PYTHONPATH=src python bench/bench_decoder.py [--number N]
+
+Every fixture in bench/fixtures is first checked against expected.json, so a
+faster decoder that answers wrongly fails here. Then each one is timed two
+ways: the plain stdlib json + in-order layout scan the client used before,
+and ZoneDecoder.decode (fast JSON backend when installed, remembered layout).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import timeit
+from pathlib import Path
+from typing import Any, Optional
+
+from services.d2_api import CURRENT_LAYOUTS, JSON_BACKEND, NEXT_LAYOUTS, TerrorZone, ZoneDecoder
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+
+
+def _scan(payload: Any) -> Optional[TerrorZone]:
+    if not isinstance(payload, dict):
+        return None
+    for layout in CURRENT_LAYOUTS:
+        tz = layout.match(payload)
+        if tz is not None:
+            break
+    else:
+        return None
+    for layout in NEXT_LAYOUTS:
+        upcoming = layout.match(payload)
+        if upcoming is not None:
+            return TerrorZone(name=tz.name, act=tz.act, next=upcoming)
+    return tz
+
+
+def _check(name: str, tz: Optional[TerrorZone], expected: dict) -> list[str]:
+    if tz is None:
+        return [f"{name}: no zone decoded"]
+    got = {"name": tz.name, "act": tz.act, "next": tz.next.name if tz.next else None}
+    return [f"{name}: {k} = {got[k]!r}, expected {v!r}" for k, v in expected.items() if got[k] != v]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=20000, help="decodes per fixture and variant")
+    args = parser.parse_args()
+
+    expected = json.loads((FIXTURES / "expected.json").read_text(encoding="utf-8"))
+    fixtures = {name: (FIXTURES / name).read_bytes() for name in sorted(expected)}
+
+    errors: list[str] = []
+    for name, raw in fixtures.items():
+        errors += _check(name, ZoneDecoder().decode(raw), expected[name])
+        errors += _check(f"{name} (scan)", _scan(json.loads(raw)), expected[name])
+    if errors:
+        print("\n".join(errors), file=sys.stderr)
+        return 1
+
+    print(f"json backend: {JSON_BACKEND}, {args.number} decodes per cell")
+    print(f"{'fixture':<36} {'baseline us':>12} {'decoder us':>12} {'speedup':>8}")
+    for name, raw in fixtures.items():
+        decoder = ZoneDecoder()
+        baseline = timeit.timeit(lambda: _scan(json.loads(raw)), number=args.number)
+        fast = timeit.timeit(lambda: decoder.decode(raw), number=args.number)
+        print(
+            f"{name:<36} {baseline / args.number * 1e6:>12.2f} {fast / args.number * 1e6:>12.2f} "
+            f"{baseline / fast:>7.2f}x"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+"""
+Micro-benchmark for the inline keyboards under menu traffic.
+
+    PYTHONPATH=src python bench/bench_keyboards.py [--number N] [--users U]
+
+Replays a mix of menu callbacks (main menu, acts, location pickers with
+per-user selections, notification and schedule screens) two ways: building
+every keyboard on each tap, as bot.keyboards did before, and through the
+precomputed / memoised keyboards. Every keyboard is first checked to render
+the same markup both ways. Reported per variant: CPU time per callback and
+bytes allocated per callback (tracemalloc).
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import timeit
+import tracemalloc
+from typing import Callable, Iterable
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from bot import keyboards
+from constants.locations import ACT1, ACT2, ACT3, ACT4, ACT5, codes_for_act, name_by_code
+
+ACTS = {1: ACT1, 2: ACT2, 3: ACT3, 4: ACT4, 5: ACT5}
+
+
+# ---- Per-tap builders, as they were before precomputation ----
+
+def _nav(first: str) -> list[InlineKeyboardButton]:
+    return [
+        InlineKeyboardButton(first, callback_data="menu:open"),
+        InlineKeyboardButton("Close", callback_data="close"),
+    ]
+
+
+def old_main_menu() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("Current terror zone", callback_data="menu:current")],
+        [InlineKeyboardButton("Choose locations", callback_data="menu:choose")],
+        [InlineKeyboardButton("My locations list", callback_data="menu:list")],
+        [InlineKeyboardButton("Notification settings", callback_data="menu:notif")],
+        [InlineKeyboardButton("Close", callback_data="close")],
+    ])
+
+
+def old_acts() -> InlineKeyboardMarkup:
+    rows = [[InlineKeyboardButton(keyboards.ACT_TITLES_UI.get(a, a), callback_data=f"act:{i}")] for i, a in ACTS.items()]
+    rows.append(_nav("Menu"))
+    return InlineKeyboardMarkup(rows)
+
+
+def old_locations(act_number: int, selected_codes: Iterable[str]) -> InlineKeyboardMarkup:
+    selected = set(str(c) for c in selected_codes)
+    rows: list[list[InlineKeyboardButton]] = []
+    buf: list[InlineKeyboardButton] = []
+    for code in codes_for_act(ACTS[act_number]):
+        checked = "✅ " if code in selected else "▫ "
+        buf.append(InlineKeyboardButton(f"{checked}{name_by_code(code)}", callback_data=f"loc:{code}:toggle"))
+        if len(buf) == 2:
+            rows.append(buf)
+            buf = []
+    if buf:
+        rows.append(buf)
+    rows.append(_nav("Back"))
+    return InlineKeyboardMarkup(rows)
+
+
+def old_notifications(enabled: bool) -> InlineKeyboardMarkup:
+    first = ("Turn off notifications", "notif:off") if enabled else ("Turn on notifications", "notif:on")
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(first[0], callback_data=first[1])],
+        [InlineKeyboardButton("Time schedule (UTC)", callback_data="notif:window")],
+        _nav("Menu"),
+    ])
+
+
+def old_window_presets() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("24/7", callback_data="window:set:0-24"),
+         InlineKeyboardButton("07–21", callback_data="window:set:7-21")],
+        [InlineKeyboardButton("Custom", callback_data="schedule:custom")],
+        _nav("Back"),
+    ])
+
+
+def old_hours(kind: str) -> InlineKeyboardMarkup:
+    rows = [
+        [InlineKeyboardButton(f"{h:02d}", callback_data=f"cust:{kind}:{h:02d}") for h in range(r, r + 6)]
+        for r in range(0, 24, 6)
+    ]
+    rows.append(_nav("Back"))
+    return InlineKeyboardMarkup(rows)
+
+
+OLD = {
+    "main": old_main_menu, "acts": old_acts, "locations": old_locations,
+    "notifications": old_notifications, "presets": old_window_presets, "hours": old_hours,
+}
+NEW = {
+    "main": keyboards.main_menu_inline, "acts": keyboards.acts_inline_keyboard,
+    "locations": keyboards.locations_inline_keyboard, "notifications": keyboards.notifications_inline_keyboard,
+    "presets": keyboards.window_presets_keyboard, "hours": keyboards.hours_keyboard,
+}
+
+
+# ---- Workload ----
+
+def make_workload(users: int, taps: int, seed: int = 1) -> list[tuple[str, tuple]]:
+    """Callbacks weighted roughly like real menu use: mostly location toggles."""
+    rng = random.Random(seed)
+    all_codes = [c for a in ACTS.values() for c in codes_for_act(a)]
+    selections = [frozenset(rng.sample(all_codes, k=rng.randint(0, 6))) for _ in range(users)]
+    kinds = ["main", "acts", "locations", "notifications", "presets", "hours"]
+    weights = [10, 10, 60, 8, 6, 6]
+    calls: list[tuple[str, tuple]] = []
+    for kind in rng.choices(kinds, weights, k=taps):
+        if kind == "locations":
+            args: tuple = (rng.randint(1, 5), selections[rng.randrange(users)])
+        elif kind == "notifications":
+            args = (rng.random() < 0.8,)
+        elif kind == "hours":
+            args = (rng.choice(("start", "end")),)
+        else:
+            args = ()
+        calls.append((kind, args))
+    return calls
+
+
+def run(builders: dict[str, Callable], calls: list[tuple[str, tuple]]) -> None:
+    for kind, args in calls:
+        builders[kind](*args)
+
+
+def allocated_per_call(builders: dict[str, Callable], calls: list[tuple[str, tuple]]) -> float:
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        kept = [builders[kind](*args) for kind, args in calls]
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    del kept
+    grown = sum(stat.size_diff for stat in after.compare_to(before, "filename") if stat.size_diff > 0)
+    return grown / len(calls)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=20000, help="callbacks per timed run")
+    parser.add_argument("--users", type=int, default=5000, help="distinct location selections")
+    args = parser.parse_args()
+
+    calls = make_workload(args.users, args.number)
+    mismatches = [
+        f"{kind}{args!r}" for kind, args in calls[:2000]
+        if OLD[kind](*args).to_dict() != NEW[kind](*args).to_dict()
+    ]
+    if mismatches:
+        print("keyboards differ:\n" + "\n".join(mismatches[:20]), file=sys.stderr)
+        return 1
+
+    run(NEW, calls)  # warm the memo caches, as a long-running bot would have them
+    old_s = min(timeit.repeat(lambda: run(OLD, calls), number=1, repeat=3))
+    new_s = min(timeit.repeat(lambda: run(NEW, calls), number=1, repeat=3))
+    old_b = allocated_per_call(OLD, calls)
+    new_b = allocated_per_call(NEW, calls)
+
+    info = keyboards._locations_keyboard.cache_info()
+    print(f"{args.number} callbacks, {args.users} distinct selections; location cache {info.currsize}/{info.maxsize}")
+    print(f"{'variant':<12} {'us/callback':>12} {'bytes/callback':>15}")
+    print(f"{'per-tap':<12} {old_s / args.number * 1e6:>12.2f} {old_b:>15.0f}")
+    print(f"{'memoised':<12} {new_s / args.number * 1e6:>12.2f} {new_b:>15.0f}")
+    print(f"speedup {old_s / new_s:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
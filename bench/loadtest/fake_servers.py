@@ -0,0 +1,212 @@
+"""
+Local stand-ins for the Telegram Bot API and the terror-zone endpoint.
+
+Both run on a small asyncio HTTP/1.1 server (keep-alive, Content-Length
+bodies only), which is all httpx needs, so the harness has no dependencies
+beyond the bot's own.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+from urllib.parse import parse_qsl, urlsplit
+
+Response = tuple[int, dict, dict[str, str]]
+Handler = Callable[[str, str, dict[str, str], bytes], Awaitable[Response]]
+
+_REASONS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 403: "Forbidden", 404: "Not Found", 429: "Too Many Requests"}
+
+
+class MiniHTTPServer:
+    def __init__(self, handler: Handler, *, host: str = "127.0.0.1", port: int = 0) -> None:
+        self._handler = handler
+        self._host = host
+        self._port = port
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: dict[asyncio.Task, asyncio.StreamWriter] = {}
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._serve, self._host, self._port, backlog=1024)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            # Close keep-alive connections so their handlers return instead of
+            # being cancelled when the loop shuts down.
+            for writer in self._connections.values():
+                writer.close()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method, target, _ = line.decode("latin-1").split(" ", 2)
+                headers: dict[str, str] = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    k, _, v = h.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                body = await reader.readexactly(int(headers.get("content-length", "0") or 0))
+
+                status, payload, extra = await self._handler(method, target, headers, body)
+                raw = json.dumps(payload).encode() if status != 304 else b""
+                head = [f"HTTP/1.1 {status} {_REASONS.get(status, 'Unknown')}", f"Content-Length: {len(raw)}"]
+                if raw:
+                    head.append("Content-Type: application/json")
+                head += [f"{k}: {v}" for k, v in extra.items()]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + raw)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self._connections.pop(task, None)
+            writer.close()
+
+
+def _parse_body(headers: dict[str, str], body: bytes) -> dict:
+    if not body:
+        return {}
+    if headers.get("content-type", "").startswith("application/json"):
+        return json.loads(body)
+    return dict(parse_qsl(body.decode()))
+
+
+# ---------------------------- Telegram Bot API -----------------------------------
+
+@dataclass
+class TelegramLimits:
+    # Telegram's documented soft limits: ~30 messages/s per bot, 1/s per chat.
+    global_per_second: float = 30.0
+    per_chat_seconds: float = 1.0
+    retry_after: int = 1
+    # Chats that answer 403 "bot was blocked by the user".
+    blocked: frozenset[int] = frozenset()
+
+
+@dataclass
+class TelegramRecorder:
+    delivered: dict[int, int] = field(default_factory=dict)  # chat_id -> messages
+    first_delivery: Optional[float] = None
+    last_delivery: Optional[float] = None
+    throttled: int = 0
+    forbidden: int = 0
+
+    @property
+    def total(self) -> int:
+        return sum(self.delivered.values())
+
+    def reset(self) -> None:
+        self.delivered.clear()
+        self.first_delivery = self.last_delivery = None
+        self.throttled = self.forbidden = 0
+
+
+class FakeTelegram:
+    """Answers getMe and sendMessage, applying ``limits`` and recording deliveries."""
+
+    def __init__(self, limits: Optional[TelegramLimits] = None) -> None:
+        self.limits = limits or TelegramLimits()
+        self.recorder = TelegramRecorder()
+        self.server = MiniHTTPServer(self._handle)
+        self._tokens = self.limits.global_per_second
+        self._refilled = time.monotonic()
+        self._chat_next: dict[int, float] = {}
+        self._message_id = 0
+
+    @property
+    def base_url(self) -> str:
+        return f"{self.server.base_url}/bot"
+
+    def _take_global(self, now: float) -> bool:
+        rate = self.limits.global_per_second
+        self._tokens = min(rate, self._tokens + (now - self._refilled) * rate)
+        self._refilled = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    async def _handle(self, method: str, target: str, headers: dict[str, str], body: bytes) -> Response:
+        api_method = urlsplit(target).path.rsplit("/", 1)[-1]
+        params = _parse_body(headers, body)
+        now = time.monotonic()
+
+        if api_method == "getMe":
+            return 200, {"ok": True, "result": {
+                "id": 1, "is_bot": True, "first_name": "Load test", "username": "loadtest_bot",
+                "can_join_groups": False, "can_read_all_group_messages": False, "supports_inline_queries": False,
+            }}, {}
+        if api_method != "sendMessage":
+            return 200, {"ok": True, "result": True}, {}
+
+        chat_id = int(params["chat_id"])
+        if chat_id in self.limits.blocked:
+            self.recorder.forbidden += 1
+            return 403, {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"}, {}
+        if now < self._chat_next.get(chat_id, 0.0) or not self._take_global(now):
+            self.recorder.throttled += 1
+            wait = self.limits.retry_after
+            return 429, {
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {wait}",
+                "parameters": {"retry_after": wait},
+            }, {}
+
+        self._chat_next[chat_id] = now + self.limits.per_chat_seconds
+        rec = self.recorder
+        rec.delivered[chat_id] = rec.delivered.get(chat_id, 0) + 1
+        rec.first_delivery = rec.first_delivery or now
+        rec.last_delivery = now
+        self._message_id += 1
+        return 200, {"ok": True, "result": {
+            "message_id": self._message_id, "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"}, "text": params.get("text", ""),
+        }}, {}
+
+
+# ---------------------------- Terror-zone endpoint -------------------------------
+
+class FakeZoneApi:
+    """
+    Serves ``{"terrorZone": {"zone": ..., "act": ...}}``. The zone comes
+    from ``script`` (one entry per request, the last one repeating) or is
+    set directly with ``set_zone``.
+    """
+
+    def __init__(self, script: Optional[list[str]] = None) -> None:
+        self.script = list(script or ["Unknown"])
+        self.requests = 0
+        self.server = MiniHTTPServer(self._handle)
+
+    @property
+    def url(self) -> str:
+        return f"{self.server.base_url}/api/terror-zone"
+
+    def set_zone(self, name: str) -> None:
+        self.script = [name]
+
+    async def _handle(self, method: str, target: str, headers: dict[str, str], body: bytes) -> Response:
+        zone = self.script[min(self.requests, len(self.script) - 1)]
+        self.requests += 1
+        etag = f'"{zone}"'
+        if headers.get("if-none-match") == etag:
+            return 304, {}, {"ETag": etag}
+        return 200, {"terrorZone": {"zone": zone, "act": "act1"}, "providedBy": "loadtest"}, {"ETag": etag}
@@ -0,0 +1,188 @@
+"""
+End-to-end load test against local stand-ins for Telegram and the zone API.
+
+    PYTHONPATH=src python bench/loadtest/run.py --dsn postgresql+asyncpg://... \\
+        --sizes 1000,10000,100000,1000000 --tg-rate 30
+
+For every size the database is re-seeded (everything in it is replaced, so
+point --dsn at a scratch database), the application is built with
+``build_application`` exactly as in production, and one ``check_and_notify``
+run is timed until the last notification is delivered, with the regular
+outbox job picking up retries. Reported per size:
+
+  * recipients  - outbox rows queued for the hour
+  * first/last  - seconds from the job start to the first / last delivery
+  * throughput  - deliveries per second over that span
+  * db time     - total time spent in SQL statements, and their count
+
+At Telegram's real rate (--tg-rate 30) a million subscribers take hours;
+raise --tg-rate (the bot's BROADCAST_RATE_PER_SECOND follows it unless
+--bot-rate is given) to measure the bot rather than the rate limit.
+Results of a reference run at both rates are in RESULTS.md.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+
+from sqlalchemy import event, func, select
+
+from fake_servers import FakeTelegram, FakeZoneApi, TelegramLimits
+from seed import FIRST_USER_ID, seed
+
+
+@dataclass
+class SqlTimer:
+    seconds: float = 0.0
+    statements: int = 0
+
+    def attach(self, sync_engine) -> None:
+        @event.listens_for(sync_engine, "before_cursor_execute")
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("loadtest_started", []).append(time.perf_counter())
+
+        @event.listens_for(sync_engine, "after_cursor_execute")
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            self.seconds += time.perf_counter() - conn.info["loadtest_started"].pop()
+            self.statements += 1
+
+
+@dataclass
+class Result:
+    size: int
+    seed_seconds: float
+    recipients: int
+    delivered: int
+    first: float
+    last: float
+    throttled: int
+    forbidden: int
+    sql: SqlTimer
+
+    def row(self) -> str:
+        span = max(self.last, 1e-9)
+        return (
+            f"{self.size:>9} {self.seed_seconds:>7.1f} {self.recipients:>10} {self.delivered:>10} "
+            f"{self.first:>8.2f} {self.last:>8.2f} {self.delivered / span:>10.0f} "
+            f"{self.throttled:>9} {self.forbidden:>9} {self.sql.seconds:>8.2f} {self.sql.statements:>7}"
+        )
+
+
+HEADER = (
+    f"{'size':>9} {'seed s':>7} {'recipients':>10} {'delivered':>10} "
+    f"{'first s':>8} {'last s':>8} {'msg/s':>10} {'throttled':>9} {'forbidden':>9} {'db s':>8} {'stmts':>7}"
+)
+
+
+async def _outstanding(session_factory) -> int:
+    from db.dal import OUTBOX_PENDING, OUTBOX_SENDING, NotificationOutbox as o
+
+    async with session_factory() as session:
+        q = select(func.count()).select_from(o).where(o.status.in_((OUTBOX_PENDING, OUTBOX_SENDING)))
+        return int((await session.execute(q)).scalar_one())
+
+
+async def _queued(session_factory) -> int:
+    from db.dal import NotificationOutbox as o
+
+    async with session_factory() as session:
+        return int((await session.execute(select(func.count()).select_from(o))).scalar_one())
+
+
+async def run_size(args, size: int, telegram: FakeTelegram, zone_api: FakeZoneApi, zone_name: str) -> Result:
+    from bot.app import build_application, check_and_notify, outbox_job
+    from db.dal import create_engine
+
+    engine = create_engine(args.dsn)
+    try:
+        seed_seconds = await seed(engine, size, locations_per_user=args.locations_per_user)
+    finally:
+        await engine.dispose()
+
+    rng = random.Random(size)
+    blocked = int(size * args.blocked_ratio)
+    telegram.limits.blocked = frozenset(FIRST_USER_ID + i for i in rng.sample(range(size), blocked))
+    telegram.recorder.reset()
+    zone_api.set_zone(zone_name)
+
+    app = await build_application()
+    sql = SqlTimer()
+    sql.attach(app.bot_data["engine"].sync_engine)
+    await app.initialize()
+    context = SimpleNamespace(application=app)
+    try:
+        started = time.monotonic()
+        await check_and_notify(context)
+        deadline = started + args.timeout
+        while await _outstanding(app.bot_data["session_factory"]) and time.monotonic() < deadline:
+            await asyncio.sleep(1.0)
+            await outbox_job(context)
+        recipients = await _queued(app.bot_data["session_factory"])
+    finally:
+        await app.shutdown()
+
+    rec = telegram.recorder
+    return Result(
+        size=size,
+        seed_seconds=seed_seconds,
+        recipients=recipients,
+        delivered=rec.total,
+        first=(rec.first_delivery - started) if rec.first_delivery else 0.0,
+        last=(rec.last_delivery - started) if rec.last_delivery else 0.0,
+        throttled=rec.throttled,
+        forbidden=rec.forbidden,
+        sql=sql,
+    )
+
+
+async def amain() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dsn", default=os.getenv("DB_DSN"), help="scratch database; defaults to $DB_DSN")
+    parser.add_argument("--sizes", default="1000,10000", help="comma-separated subscriber counts")
+    parser.add_argument("--locations-per-user", type=int, default=3)
+    parser.add_argument("--blocked-ratio", type=float, default=0.01)
+    parser.add_argument("--tg-rate", type=float, default=30.0, help="fake Telegram messages/s before 429")
+    parser.add_argument("--bot-rate", type=int, default=None, help="BROADCAST_RATE_PER_SECOND (default: --tg-rate)")
+    parser.add_argument("--zone", default="1.1", help="location code announced by the fake zone API")
+    parser.add_argument("--timeout", type=float, default=3600.0, help="seconds to wait for the last delivery")
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("--dsn or DB_DSN is required")
+
+    from constants.locations import name_by_code
+
+    zone_name = name_by_code(args.zone)
+    telegram = FakeTelegram(TelegramLimits(global_per_second=args.tg_rate))
+    zone_api = FakeZoneApi([zone_name])
+    await telegram.server.start()
+    await zone_api.server.start()
+
+    # build_application reads everything from the environment.
+    os.environ.update({
+        "BOT_TOKEN": "1:loadtest",
+        "D2_API_TOKEN": "loadtest",
+        "D2_API_URL": zone_api.url,
+        "TELEGRAM_API_BASE_URL": telegram.base_url,
+        "DB_DSN": args.dsn,
+        "BROADCAST_RATE_PER_SECOND": str(args.bot_rate or int(args.tg_rate)),
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+    })
+
+    print(HEADER)
+    try:
+        for size in (int(x) for x in args.sizes.split(",") if x.strip()):
+            print((await run_size(args, size, telegram, zone_api, zone_name)).row(), flush=True)
+    finally:
+        await telegram.server.stop()
+        await zone_api.server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(amain()))
@@ -0,0 +1,114 @@
+"""
+Fills the database with synthetic subscribers for load tests.
+
+    PYTHONPATH=src python bench/loadtest/seed.py --dsn postgresql://... --users 100000
+
+Existing users, subscriptions, outbox rows, broadcast runs and senders are deleted
+first. Generation is deterministic for a given --seed.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import time
+from typing import Iterator
+
+from sqlalchemy import insert, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from constants.locations import LOCATION_BITS
+from db.dal import ALL_HOURS_MASK, User, UserLocation, create_engine, window_hours_mask
+from db.migrations import migrate
+
+# Far above real Telegram ids of the people running the test.
+FIRST_USER_ID = 9_000_000_000
+CHUNK = 10_000
+
+
+def generate_users(
+    count: int,
+    *,
+    locations_per_user: int = 3,
+    enabled_ratio: float = 0.9,
+    all_day_ratio: float = 0.7,
+    seed: int = 1,
+) -> Iterator[tuple[dict, list[str]]]:
+    """Yields (users row, location codes) pairs."""
+    rng = random.Random(seed)
+    codes = list(LOCATION_BITS)
+    for i in range(count):
+        picked = rng.sample(codes, k=min(locations_per_user, len(codes)))
+        if rng.random() < all_day_ratio:
+            start, end, hours = 0, 24, ALL_HOURS_MASK
+        else:
+            start = rng.randrange(24)
+            end = (start + rng.randrange(4, 20)) % 24
+            hours = window_hours_mask(start, end)
+        yield {
+            "user_id": FIRST_USER_ID + i,
+            "notifications_enabled": rng.random() < enabled_ratio,
+            "allowed_start_hour": start,
+            "allowed_end_hour": end,
+            "hours_mask": hours,
+            "location_mask": sum(1 << LOCATION_BITS[c] for c in picked),
+        }, picked
+
+
+async def seed(engine: AsyncEngine, count: int, **kwargs) -> float:
+    """Replaces all subscribers with ``count`` generated ones; returns seconds taken."""
+    started = time.perf_counter()
+    await migrate(engine)
+    async with engine.begin() as conn:
+        await conn.execute(text("TRUNCATE notification_outbox, broadcast_runs, broadcast_senders, user_locations, users"))
+
+    users: list[dict] = []
+    links: list[dict] = []
+
+    async def flush() -> None:
+        async with engine.begin() as conn:
+            if users:
+                await conn.execute(insert(User), users)
+            if links:
+                await conn.execute(insert(UserLocation), links)
+        users.clear()
+        links.clear()
+
+    for row, codes in generate_users(count, **kwargs):
+        users.append(row)
+        links.extend({"user_id": row["user_id"], "location_code": c} for c in codes)
+        if len(users) >= CHUNK:
+            await flush()
+    await flush()
+
+    async with engine.begin() as conn:
+        await conn.execute(text("ANALYZE users"))
+        await conn.execute(text("ANALYZE user_locations"))
+    return time.perf_counter() - started
+
+
+async def amain() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dsn", default=os.getenv("DB_DSN"), help="defaults to $DB_DSN")
+    parser.add_argument("--users", type=int, required=True)
+    parser.add_argument("--locations-per-user", type=int, default=3)
+    parser.add_argument("--enabled-ratio", type=float, default=0.9)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("--dsn or DB_DSN is required")
+
+    engine = create_engine(args.dsn)
+    try:
+        took = await seed(
+            engine, args.users,
+            locations_per_user=args.locations_per_user, enabled_ratio=args.enabled_ratio, seed=args.seed,
+        )
+    finally:
+        await engine.dispose()
+    print(f"Seeded {args.users} users in {took:.1f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(amain())
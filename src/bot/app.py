@@ -3,18 +3,32 @@ from __future__ import annotations
 import asyncio
 import logging
 from datetime import datetime, timedelta, timezone
+from typing import Optional
 
 from telegram import Update
 from telegram.ext import Application, ApplicationBuilder, CommandHandler, ContextTypes, JobQueue
 
 from utils.config import get_settings
 from db.dal import (
-    create_engine, create_session_factory, ensure_schema,
-    upsert_user, set_notifications_enabled, set_notification_window, users_to_notify_for_location,
+    create_engine, create_session_factory, pool_stats, prewarm_pool,
+    upsert_user, set_notifications_enabled, set_notification_window,
+    iter_users_to_notify_for_location, enqueue_outbox_batch,
+    start_broadcast_run, finish_broadcast_enqueue, release_staged_outbox, unfinished_broadcast_run,
+    SUBSCRIPTION_INDEX_KEY, USER_SETTINGS_CACHE_KEY, READ_REPLICA_KEY,
 )
-from services.d2_api import D2ApiClient, D2ApiError, D2ParseError
+from db.migrations import migrate
+from db.replica import ReplicaRouter
+from services.d2_api import D2ApiClient, D2ApiError, D2ParseError, TerrorZone
+from services.zone_state import ZoneStateService
+from services.subscription_index import SubscriptionIndex, build_subscription_index, verify_subscription_index
+from services.user_settings_cache import UserSettingsCache
 from constants.locations import code_by_name, name_by_code
+from bot.broadcast import Broadcaster
+from bot.ledger import DeliveryLedger
+from bot.outbox import drain_outbox
+from bot.zone_poller import ZonePoller
 from bot.keyboards import main_menu_inline
+from bot.callback_router import CallbackRouter
 from bot.handlers import register_handlers
 
 
@@ -68,11 +82,13 @@ async def stop_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 
 async def current(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    client: D2ApiClient = context.application.bot_data["d2_client"]
+    zone_state: ZoneStateService = context.application.bot_data["zone_state"]
     try:
-        tz = await client.get_current_terror_zone()
+        tz, outdated = await zone_state.get_or_last_known()
         code = code_by_name(tz.name)
         text = f"Current zone: {name_by_code(code)}" if code else f"Current zone (from API): {tz.name}"
+        if outdated:
+            text += "\n(last known zone; the zone service is unavailable right now)"
         await context.bot.send_message(chat_id=update.effective_chat.id, text=text)
     except (D2ApiError, D2ParseError) as e:
         log.warning("Failed to fetch current zone: %s", e)
@@ -129,47 +145,165 @@ async def set_window_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 # ----------------------------- Scheduler job ---------------------------------
 
 async def check_and_notify(context: ContextTypes.DEFAULT_TYPE) -> None:
-    from datetime import datetime, timedelta, timezone
-
     store = context.application.bot_data
-    client: D2ApiClient = store["d2_client"]
+    zone_state: ZoneStateService = store["zone_state"]
 
     now = datetime.now(timezone.utc)
-    bypass = now.minute <= 5
-    tz = None
 
-    if not bypass:
-        cached = store.get("tz_cache")
-        ts = store.get("tz_cache_ts")
-        if cached is not None and ts is not None and (now - ts) <= timedelta(minutes=10):
-            tz = cached
+    try:
+        tz = await zone_state.get_fresh()
+        log.debug("Zone state: %s", zone_state.stats.as_log_str())
+        log.debug("Upstream providers: %s", context.application.bot_data["d2_client"].stats_as_log_str())
+    except (D2ApiError, D2ParseError) as e:
+        logging.getLogger("bot.app").warning("Scheduled job: failed to fetch zone: %s", e)
+        return
+
+    await _notify_zone(store, tz, now)
+
+
+async def boundary_poll_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    poller: ZonePoller = context.application.bot_data["zone_poller"]
+    await poller.run_hour()
+
+
+async def catch_up_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    # Finishes this hour's broadcast if the previous process died while
+    # enqueueing it. Hours that never started a broadcast are left alone:
+    # a restart mid-hour must not alert everyone for a zone already running.
+    store = context.application.bot_data
+    now = datetime.now(timezone.utc)
+    async with store["session_factory"]() as session:
+        code = await unfinished_broadcast_run(session, now_utc=now)
+    if code is not None:
+        log.info("Resuming unfinished broadcast for zone %s", code)
+        await _notify_code(store, code, now)
+
+
+async def _notify_zone(store: dict, tz: TerrorZone, now: datetime) -> None:
+    code = code_by_name(tz.name)
+    if not code:
+        logging.getLogger("bot.app").warning("Unknown terror zone from API: %r", tz.name)
+        return
+    await _notify_code(store, code, now)
 
+
+async def _notify_code(store: dict, code: str, now: datetime) -> None:
+    # Recipients are enqueued page by page while the drain is already
+    # sending the first pages, so the first alert doesn't wait for the
+    # whole recipient scan.
+    producer = asyncio.create_task(_enqueue_zone(store, code, now))
     try:
-        if tz is None:
-            tz = await client.get_current_terror_zone()
-            store["tz_cache"] = tz
-            store["tz_cache_ts"] = now
+        await _drain(store, producer=producer)
+    finally:
+        queued = await producer
+    if queued:
+        logging.getLogger("bot.app").info("Queued %d notifications for zone %s", queued, code)
 
-        code = code_by_name(tz.name)
-        if not code:
-            logging.getLogger("bot.app").warning("Unknown terror zone from API: %r", tz.name)
-            return
 
-        async with store["session_factory"]() as session:
-            user_ids = await users_to_notify_for_location(session, code, now_utc=now)
+async def outbox_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    # Picks up sends left over by a restart and retries whose backoff has elapsed.
+    try:
+        await _drain(context.application.bot_data)
+    except Exception as e:
+        log.warning("Outbox drain failed: %s", e)
+
+
+async def _drain(store: dict, *, producer: Optional[asyncio.Task] = None):
+    settings = store["settings"]
+    return await drain_outbox(
+        store["session_factory"],
+        store["broadcaster"],
+        batch_size=settings.outbox_batch_size,
+        max_attempts=settings.outbox_max_attempts,
+        producer=producer,
+        ledger=store["delivery_ledger"],
+        rate_budget=settings.broadcast_rate_per_second,
+    )
 
-        if not user_ids:
-            return
 
-        text = f"Zone active now: {name_by_code(code)}"
-        for uid in user_ids:
-            try:
-                await context.bot.send_message(chat_id=uid, text=text)
-            except Exception as e:
-                logging.getLogger("bot.app").warning("Failed to send message to %s: %s", uid, e)
+async def _enqueue_zone(store: dict, code: str, now: datetime) -> int:
+    async with store["session_factory"]() as session:
+        await start_broadcast_run(session, code, now_utc=now)
+        # Rows staged before the hour go out first; the scan below only adds
+        # users who subscribed since (the rest conflict and are skipped).
+        queued = await release_staged_outbox(session, code, now_utc=now)
+        if queued:
+            logging.getLogger("bot.app").info("Released %d staged notifications for zone %s", queued, code)
+        queued += await _enqueue_recipients(store, session, code, now)
+        await finish_broadcast_enqueue(session, queued, now_utc=now)
+    return queued
+
+
+async def _enqueue_recipients(store: dict, session, code: str, now: datetime, *, staged: bool = False) -> int:
+    settings = store["settings"]
+    queued = 0
+    index: Optional[SubscriptionIndex] = store.get("subscription_index")
+    if index is not None:
+        user_ids = index.recipients(code, now.hour)
+        step = settings.recipient_batch_size
+        for i in range(0, len(user_ids), step):
+            queued += await enqueue_outbox_batch(session, code, user_ids[i:i + step], now_utc=now, staged=staged)
+    else:
+        async for batch in iter_users_to_notify_for_location(
+            session, code, now_utc=now, batch_size=settings.recipient_batch_size
+        ):
+            queued += await enqueue_outbox_batch(session, code, batch, now_utc=now, staged=staged)
+    return queued
+
+
+async def _stage_zone(store: dict, tz: TerrorZone, boundary: datetime) -> None:
+    # Resolve and write the next hour's recipients while the current hour
+    # is still running, so the boundary only has to flip their status.
+    code = code_by_name(tz.name)
+    if not code:
+        logging.getLogger("bot.app").warning("Unknown upcoming terror zone from API: %r", tz.name)
+        return
+    async with store["session_factory"]() as session:
+        staged = await _enqueue_recipients(store, session, code, boundary, staged=True)
+    logging.getLogger("bot.app").info("Staged %d notifications for upcoming zone %s", staged, code)
 
-    except (D2ApiError, D2ParseError) as e:
-        logging.getLogger("bot.app").warning("Scheduled job: failed to fetch zone: %s", e)
+
+async def check_subscription_index(context: ContextTypes.DEFAULT_TYPE) -> None:
+    store = context.application.bot_data
+    index: Optional[SubscriptionIndex] = store.get("subscription_index")
+    if index is None:
+        return
+    try:
+        await verify_subscription_index(store["session_factory"], index)
+    except Exception as e:
+        log.warning("Subscription index check failed: %s", e)
+
+
+async def log_pool_stats(context: ContextTypes.DEFAULT_TYPE) -> None:
+    store = context.application.bot_data
+    stats = pool_stats(store["engine"])
+    if stats is not None:
+        log.info("DB pool: %s", stats.as_log_str())
+    router: Optional[ReplicaRouter] = store.get("read_replica")
+    if router is not None:
+        replica_pool = pool_stats(router.engine)
+        log.info(
+            "Read replica: %s; pool: %s",
+            router.stats.as_log_str(), replica_pool.as_log_str() if replica_pool else "n/a",
+        )
+
+
+async def check_replica_lag(context: ContextTypes.DEFAULT_TYPE) -> None:
+    router: Optional[ReplicaRouter] = context.application.bot_data.get("read_replica")
+    if router is not None:
+        await router.refresh()
+
+
+async def log_callback_stats(context: ContextTypes.DEFAULT_TYPE) -> None:
+    router: Optional[CallbackRouter] = context.application.bot_data.get("callback_router")
+    if router is not None and router.stats:
+        log.info("Callback routes: %s", router.stats_as_log_str())
+
+
+async def log_user_settings_cache(context: ContextTypes.DEFAULT_TYPE) -> None:
+    cache: Optional[UserSettingsCache] = context.application.bot_data.get("user_settings_cache")
+    if cache is not None:
+        log.info("User settings cache: entries=%d %s", len(cache), cache.stats.as_log_str())
 
 
 # ----------------------------- App bootstrap ---------------------------------
@@ -179,10 +313,40 @@ async def build_application() -> Application:
     _setup_logging()
     log.info("Starting application...")
 
-    engine = create_engine(settings.effective_db_dsn)
-    await ensure_schema(engine)
+    engine = create_engine(settings.effective_db_dsn, **settings.db_engine_options())
+    await migrate(engine)
+    try:
+        warmed = await prewarm_pool(engine, settings.db_pool_prewarm)
+        log.info("Pre-warmed %d database connections", warmed)
+    except Exception as e:
+        log.warning("Connection pool pre-warm failed: %s", e)
     session_factory = create_session_factory(engine)
 
+    session_info: dict = {}
+    subscription_index: Optional[SubscriptionIndex] = None
+    if settings.subscription_index_enabled:
+        subscription_index = await build_subscription_index(session_factory)
+        session_info[SUBSCRIPTION_INDEX_KEY] = subscription_index
+    user_settings_cache: Optional[UserSettingsCache] = None
+    if settings.user_settings_cache_size > 0:
+        user_settings_cache = UserSettingsCache(
+            max_entries=settings.user_settings_cache_size,
+            ttl_seconds=settings.user_settings_cache_ttl_seconds,
+        )
+        session_info[USER_SETTINGS_CACHE_KEY] = user_settings_cache
+    read_replica: Optional[ReplicaRouter] = None
+    if settings.db_replica_dsn:
+        read_replica = ReplicaRouter(
+            create_engine(settings.db_replica_dsn, **settings.db_engine_options()),
+            primary=engine,
+            max_lag_seconds=settings.db_replica_max_lag_seconds,
+        )
+        lag = await read_replica.refresh()
+        log.info("Read replica configured, lag %s", f"{lag:.2f}s" if lag is not None else "unknown")
+        session_info[READ_REPLICA_KEY] = read_replica
+    if session_info:
+        session_factory.configure(info=session_info)
+
     d2_client = D2ApiClient(settings=settings)
 
     async def _on_shutdown(app: Application) -> None:
@@ -193,22 +357,33 @@ async def build_application() -> Application:
             log.warning("D2 client close error: %s", e)
         try:
             await engine.dispose()
+            if read_replica is not None:
+                await read_replica.engine.dispose()
         except Exception as e:
             log.warning("Engine dispose error: %s", e)
 
     jq = JobQueue()
-    app = (
-        ApplicationBuilder()
-        .token(settings.bot_token)
-        .job_queue(jq)
-        .post_shutdown(_on_shutdown)
-        .build()
-    )
+    builder = ApplicationBuilder().token(settings.bot_token).job_queue(jq).post_shutdown(_on_shutdown)
+    if settings.telegram_api_base_url:
+        builder = builder.base_url(settings.telegram_api_base_url)
+    app = builder.build()
 
     app.bot_data["settings"] = settings
     app.bot_data["session_factory"] = session_factory
     app.bot_data["engine"] = engine
     app.bot_data["d2_client"] = d2_client
+    zone_state = ZoneStateService(d2_client)
+    app.bot_data["zone_state"] = zone_state
+    app.bot_data["subscription_index"] = subscription_index
+    app.bot_data["user_settings_cache"] = user_settings_cache
+    app.bot_data["read_replica"] = read_replica
+    app.bot_data["delivery_ledger"] = DeliveryLedger()
+    app.bot_data["broadcaster"] = Broadcaster(
+        app.bot,
+        workers=settings.broadcast_workers,
+        rate_per_second=settings.broadcast_rate_per_second,
+        max_retries=settings.broadcast_max_retries,
+    )
 
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("menu", menu_cmd))
@@ -221,14 +396,80 @@ async def build_application() -> Application:
     register_handlers(app)
 
     # Periodic job
-    first_run = _next_aligned_run_utc(settings.notify_align_minute)
+    if settings.notify_poll_enabled:
+        # Starts a minute before each hour to record the outgoing zone, then
+        # polls from the boundary until the rotation shows up upstream.
+        async def _on_zone_change(tz: TerrorZone, now: datetime) -> None:
+            await _notify_zone(app.bot_data, tz, now)
+
+        async def _on_upcoming_zone(tz: TerrorZone, boundary: datetime) -> None:
+            await _stage_zone(app.bot_data, tz, boundary)
+
+        app.bot_data["zone_poller"] = ZonePoller(
+            zone_state,
+            _on_zone_change,
+            initial_interval=settings.notify_poll_initial_seconds,
+            max_interval=settings.notify_poll_max_seconds,
+            deadline=timedelta(minutes=settings.notify_poll_deadline_minutes),
+            unpredicted_deadline=timedelta(minutes=settings.notify_poll_unpredicted_deadline_minutes),
+            on_upcoming=_on_upcoming_zone if settings.notify_prestage_enabled else None,
+        )
+        first_run = _next_aligned_run_utc(59)
+        app.job_queue.run_repeating(
+            boundary_poll_job,
+            interval=3600,
+            first=first_run,
+            name="boundary_poll",
+        )
+    else:
+        first_run = _next_aligned_run_utc(settings.notify_align_minute)
+        app.job_queue.run_repeating(
+            check_and_notify,
+            interval=settings.notify_interval_seconds,
+            first=first_run,
+            name="check_and_notify",
+        )
+    log.info("Job scheduled: first run at %s (UTC)", first_run.isoformat())
+
+    if subscription_index is not None:
+        app.job_queue.run_repeating(
+            check_subscription_index,
+            interval=settings.subscription_index_check_seconds,
+            first=settings.subscription_index_check_seconds,
+            name="check_subscription_index",
+        )
+
+    if settings.db_pool_stats_log_seconds:
+        app.job_queue.run_repeating(
+            log_pool_stats,
+            interval=settings.db_pool_stats_log_seconds,
+            first=settings.db_pool_stats_log_seconds,
+            name="log_pool_stats",
+        )
+
+    if read_replica is not None:
+        app.job_queue.run_repeating(
+            check_replica_lag,
+            interval=settings.db_replica_check_seconds,
+            first=settings.db_replica_check_seconds,
+            name="check_replica_lag",
+        )
+
+    if user_settings_cache is not None:
+        app.job_queue.run_repeating(log_user_settings_cache, interval=900, first=900, name="log_user_settings_cache")
+    app.job_queue.run_repeating(log_callback_stats, interval=900, first=900, name="log_callback_stats")
+
+    # Catch-up run: if the previous process died while enqueueing this hour's
+    # alert, enqueue the rest. Users who already have an outbox row are skipped.
+    app.job_queue.run_once(catch_up_job, when=5, name="broadcast_catchup")
+
+    # Outbox drain: the first run resumes anything left pending by a previous process.
     app.job_queue.run_repeating(
-        check_and_notify,
-        interval=settings.notify_interval_seconds,
-        first=first_run,
-        name="check_and_notify",
+        outbox_job,
+        interval=settings.outbox_drain_interval_seconds,
+        first=1,
+        name="drain_outbox",
     )
-    log.info("Job scheduled: first run at %s (UTC)", first_run.isoformat())
 
     return app
 
@@ -0,0 +1,287 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable, Iterable, Optional
+
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+log = logging.getLogger("bot.broadcast")
+
+# Telegram allows roughly one message per second to the same chat.
+PER_CHAT_INTERVAL_SECONDS = 1.0
+
+# Per-recipient outcomes passed to the optional ``on_result`` callback.
+OUTCOME_SENT = "sent"
+OUTCOME_RETRY = "retry"      # transient failure, worth trying again later
+OUTCOME_FAILED = "failed"    # permanent failure for this message (e.g. rejected text)
+OUTCOME_UNREACHABLE = "unreachable"  # the chat itself is gone: bot blocked, account deleted, ...
+
+# Lower-cased fragments of Telegram BadRequest messages that mean the chat
+# can never be delivered to. Forbidden always means that.
+_UNREACHABLE_MARKERS = (
+    "chat not found",
+    "user not found",
+    "user is deactivated",
+    "bot was blocked",
+    "bot was kicked",
+    "peer_id_invalid",
+)
+
+ResultCallback = Callable[[int, str], None]
+
+
+# ---------------------------- Public datatypes ---------------------------------
+
+@dataclass
+class BroadcastReport:
+    total: int = 0
+    sent: int = 0
+    failed: int = 0
+    unreachable: int = 0
+    throttled: int = 0
+    wall_seconds: float = 0.0
+
+    def merge(self, other: "BroadcastReport") -> None:
+        self.total += other.total
+        self.sent += other.sent
+        self.failed += other.failed
+        self.unreachable += other.unreachable
+        self.throttled += other.throttled
+        self.wall_seconds += other.wall_seconds
+
+    def as_log_str(self) -> str:
+        return (
+            f"total={self.total} sent={self.sent} failed={self.failed} "
+            f"unreachable={self.unreachable} throttled={self.throttled} wall={self.wall_seconds:.2f}s"
+        )
+
+
+# ---------------------------- Rate limiting ------------------------------------
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self._rate = float(rate)
+        self._capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        # The lock keeps waiters FIFO: whoever sleeps first gets the next token.
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self._tokens) / self._rate)
+
+    def drain(self) -> None:
+        self._refill()
+        self._tokens = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    def set_rate(self, rate: float) -> None:
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self._refill()
+        self._rate = float(rate)
+        self._capacity = float(rate)
+        self._tokens = min(self._tokens, self._capacity)
+
+
+class PerChatLimiter:
+    def __init__(self, interval: float = PER_CHAT_INTERVAL_SECONDS, *, max_entries: int = 100_000) -> None:
+        self._interval = interval
+        self._max_entries = max_entries
+        self._next_at: dict[int, float] = {}
+
+    async def wait(self, chat_id: int) -> None:
+        now = time.monotonic()
+        if len(self._next_at) >= self._max_entries:
+            self._prune(now)
+        next_at = self._next_at.get(chat_id, 0.0)
+        self._next_at[chat_id] = max(now, next_at) + self._interval
+        if next_at > now:
+            await asyncio.sleep(next_at - now)
+
+    def _prune(self, now: float) -> None:
+        self._next_at = {cid: t for cid, t in self._next_at.items() if t > now}
+
+
+# ---------------------------- Broadcaster --------------------------------------
+
+class Broadcaster:
+    """
+    Fans a single text out to many chats with a bounded worker pool.
+
+    All workers share one token bucket (global Telegram limit) and one per-chat
+    limiter. A RetryAfter from Telegram pauses the whole pool until the
+    requested time has passed; the affected message is then retried.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        *,
+        workers: int = 16,
+        rate_per_second: float = 30.0,
+        max_retries: int = 3,
+    ) -> None:
+        self._bot = bot
+        self._workers = max(1, int(workers))
+        self._max_retries = max(0, int(max_retries))
+        self._bucket = TokenBucket(rate_per_second)
+        self._per_chat = PerChatLimiter()
+        self._paused_until = 0.0
+
+    @property
+    def rate_per_second(self) -> float:
+        return self._bucket.rate
+
+    def set_rate(self, rate_per_second: float) -> None:
+        """Changes the send rate, e.g. when the token's budget is split between more processes."""
+        self._bucket.set_rate(rate_per_second)
+
+    async def broadcast(
+        self,
+        chat_ids: Iterable[int],
+        text: str,
+        *,
+        on_result: Optional[ResultCallback] = None,
+    ) -> BroadcastReport:
+        report = BroadcastReport()
+        started = time.monotonic()
+        queue: asyncio.Queue[Optional[int]] = asyncio.Queue(maxsize=self._workers * 4)
+
+        workers = [
+            asyncio.create_task(self._worker(queue, text, report, on_result), name=f"broadcast-{i}")
+            for i in range(self._workers)
+        ]
+        try:
+            for chat_id in chat_ids:
+                report.total += 1
+                await queue.put(int(chat_id))
+            await queue.join()
+        except BaseException:
+            # Cancelled or failed mid-way: the queue may be full, so stop the
+            # workers directly instead of queueing sentinels behind the backlog.
+            for task in workers:
+                task.cancel()
+            raise
+        else:
+            for _ in workers:
+                queue.put_nowait(None)
+        finally:
+            await asyncio.gather(*workers, return_exceptions=True)
+            report.wall_seconds = time.monotonic() - started
+        return report
+
+    # -------- internals --------
+
+    async def _worker(
+        self,
+        queue: asyncio.Queue[Optional[int]],
+        text: str,
+        report: BroadcastReport,
+        on_result: Optional[ResultCallback],
+    ) -> None:
+        while True:
+            item = await queue.get()
+            try:
+                if item is None:
+                    return
+                attempt = 0
+                while True:
+                    outcome = await self._send_one(item, text, attempt, report)
+                    if outcome is not None:
+                        break
+                    attempt += 1
+                if on_result is not None:
+                    on_result(item, outcome)
+            finally:
+                queue.task_done()
+
+    async def _send_one(self, chat_id: int, text: str, attempt: int, report: BroadcastReport) -> Optional[str]:
+        """Returns the final outcome, or None when the message should be retried right away."""
+        await self._wait_resume()
+        await self._per_chat.wait(chat_id)
+        await self._bucket.acquire()
+        await self._wait_resume()
+
+        try:
+            await self._bot.send_message(chat_id=chat_id, text=text)
+        except RetryAfter as e:
+            report.throttled += 1
+            self._pause(_retry_after_seconds(e))
+            if attempt < self._max_retries:
+                return None
+            report.failed += 1
+            log.warning("Giving up on %s after RetryAfter: %s", chat_id, e)
+            return OUTCOME_RETRY
+        except (Forbidden, BadRequest) as e:
+            if is_unreachable_error(e):
+                report.unreachable += 1
+                log.debug("Chat %s is not reachable: %s", chat_id, e)
+                return OUTCOME_UNREACHABLE
+            report.failed += 1
+            log.warning("Telegram rejected message to %s: %s", chat_id, e)
+            return OUTCOME_FAILED
+        except (TimedOut, NetworkError) as e:
+            if attempt < self._max_retries:
+                await asyncio.sleep(0.5 * (2 ** attempt))
+                return None
+            report.failed += 1
+            log.warning("Failed to send message to %s after %d attempts: %s", chat_id, attempt + 1, e)
+            return OUTCOME_RETRY
+        except Exception as e:
+            report.failed += 1
+            log.warning("Failed to send message to %s: %s", chat_id, e)
+            return OUTCOME_RETRY
+        report.sent += 1
+        return OUTCOME_SENT
+
+    def _pause(self, seconds: float) -> None:
+        until = time.monotonic() + max(0.0, seconds)
+        if until > self._paused_until:
+            log.warning("Telegram flood control: pausing broadcast for %.1fs", seconds)
+            self._paused_until = until
+        self._bucket.drain()
+
+    async def _wait_resume(self) -> None:
+        while True:
+            delay = self._paused_until - time.monotonic()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+
+def is_unreachable_error(err: Exception) -> bool:
+    if isinstance(err, Forbidden):
+        return True
+    if isinstance(err, BadRequest):
+        msg = str(err).lower()
+        return any(marker in msg for marker in _UNREACHABLE_MARKERS)
+    return False
+
+
+def _retry_after_seconds(err: RetryAfter) -> float:
+    value = err.retry_after
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return float(value)
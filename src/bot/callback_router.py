@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import time
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open.
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+@dataclass(frozen=True, slots=True)
+class CallbackData:
+    """``callback_data`` split once: the route it matched and the parts after it."""
+
+    raw: str
+    route: str
+    args: tuple[str, ...] = ()
+
+    def arg(self, index: int) -> Optional[str]:
+        return self.args[index] if index < len(self.args) else None
+
+    def int_arg(self, index: int) -> Optional[int]:
+        try:
+            return int(self.args[index])
+        except (IndexError, ValueError):
+            return None
+
+
+CallbackHandler = Callable[[Update, ContextTypes.DEFAULT_TYPE, CallbackData], Awaitable[None]]
+
+
+@dataclass
+class RouteStats:
+    calls: int = 0
+    errors: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+    buckets: list[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS_MS) + 1))
+
+    def record(self, seconds: float, *, failed: bool) -> None:
+        self.calls += 1
+        self.errors += failed
+        self.total_seconds += seconds
+        if seconds > self.max_seconds:
+            self.max_seconds = seconds
+        self.buckets[bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)] += 1
+
+    def as_log_str(self) -> str:
+        avg_ms = self.total_seconds / self.calls * 1000 if self.calls else 0.0
+        bounds = [f"<={b}" for b in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}"]
+        hist = " ".join(f"{b}:{n}" for b, n in zip(bounds, self.buckets) if n)
+        return (
+            f"calls={self.calls} errors={self.errors} avg_ms={avg_ms:.1f} "
+            f"max_ms={self.max_seconds * 1000:.1f} hist_ms=[{hist}]"
+        )
+
+
+class CallbackRouter:
+    """
+    Dispatches inline-button callbacks by ``callback_data``.
+
+    Routes are registered by exact value (``"menu:open"``) or by prefix of
+    ``:``-separated parts (``"window:set"`` matches ``"window:set:7-21"``
+    with args ``("7-21",)``). An exact match wins, then the longest prefix;
+    lookups are dict hits, one per part at most. Calls and latency are
+    recorded per route.
+    """
+
+    def __init__(self) -> None:
+        self._exact: dict[str, tuple[str, CallbackHandler]] = {}
+        self._prefix: dict[tuple[str, ...], tuple[str, CallbackHandler]] = {}
+        self._fallback: Optional[CallbackHandler] = None
+        self.stats: dict[str, RouteStats] = {}
+
+    # -------- registration --------
+
+    def exact(self, *keys: str) -> Callable[[CallbackHandler], CallbackHandler]:
+        """Registers a handler for one or more exact values; stats go under the first."""
+        def register(handler: CallbackHandler) -> CallbackHandler:
+            for key in keys:
+                self._add(self._exact, key, (keys[0], handler))
+            return handler
+        return register
+
+    def prefix(self, key: str) -> Callable[[CallbackHandler], CallbackHandler]:
+        def register(handler: CallbackHandler) -> CallbackHandler:
+            self._add(self._prefix, tuple(key.split(":")), (key + ":*", handler))
+            return handler
+        return register
+
+    def fallback(self, handler: CallbackHandler) -> CallbackHandler:
+        self._fallback = handler
+        return handler
+
+    @staticmethod
+    def _add(table: dict, key, entry: tuple[str, CallbackHandler]) -> None:
+        if key in table:
+            raise ValueError(f"Callback route {key!r} registered twice")
+        table[key] = entry
+
+    # -------- dispatch --------
+
+    def resolve(self, raw: str) -> tuple[Optional[CallbackHandler], CallbackData]:
+        entry = self._exact.get(raw)
+        if entry is not None:
+            return entry[1], CallbackData(raw, entry[0])
+        parts = tuple(raw.split(":"))
+        for n in range(len(parts) - 1, 0, -1):
+            entry = self._prefix.get(parts[:n])
+            if entry is not None:
+                return entry[1], CallbackData(raw, entry[0], parts[n:])
+        return self._fallback, CallbackData(raw, "unknown", parts)
+
+    async def dispatch(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        if update.callback_query is None:
+            return
+        handler, cb = self.resolve(update.callback_query.data or "")
+        if handler is None:
+            return
+        started = time.perf_counter()
+        failed = True
+        try:
+            await handler(update, context, cb)
+            failed = False
+        finally:
+            stats = self.stats.get(cb.route)
+            if stats is None:
+                stats = self.stats[cb.route] = RouteStats()
+            stats.record(time.perf_counter() - started, failed=failed)
+
+    def stats_as_log_str(self) -> str:
+        # Slowest routes (by total time spent) first.
+        ranked = sorted(self.stats.items(), key=lambda kv: kv[1].total_seconds, reverse=True)
+        return "; ".join(f"{route}: {s.as_log_str()}" for route, s in ranked)
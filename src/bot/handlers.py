@@ -1,50 +1,45 @@
 from __future__ import annotations
 
 import logging
+import time
 from typing import Optional
 
-from telegram import Update, ReplyKeyboardRemove, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update, ReplyKeyboardRemove
 from telegram.ext import (
     Application,
     CallbackQueryHandler,
     ContextTypes,
     MessageHandler,
+    TypeHandler,
     filters,
 )
 
+from bot.callback_router import CallbackData, CallbackRouter
 from bot.keyboards import (
     acts_inline_keyboard,
+    hours_keyboard,
     locations_inline_keyboard,
     main_menu_inline,
     menu_nav_markup,
     notifications_inline_keyboard,
     selected_locations_inline_keyboard,
+    window_presets_keyboard,
 )
 from constants.locations import code_by_name, name_by_code
 from db.dal import (
-    add_location, get_user, get_user_locations,
-    remove_location, set_notification_window, set_notifications_enabled,
+    get_user_locations, get_user_settings, mark_user_reachable,
+    set_notification_window, set_notifications_enabled, toggle_location,
 )
-from services.d2_api import D2ApiClient, D2ApiError, D2ParseError
+from services.d2_api import D2ApiError, D2ParseError
+from services.zone_state import ZoneStateService
 
 log = logging.getLogger("bot.handlers")
 
-# ----------------------------- Utilities -------------------------------------
-
-def _parse_act(data: str) -> Optional[int]:
-    try:
-        return int(data.split(":", 1)[1])
-    except Exception:
-        return None
-
-
-def _parse_loc_toggle(data: str) -> Optional[str]:
-    try:
-        _, code, action = data.split(":")
-        return code if action == "toggle" else None
-    except Exception:
-        return None
+# How long a user is trusted to be reachable after we last cleared their
+# unreachable flag, before another incoming update re-checks it in the DB.
+_REACHABLE_RECHECK_SECONDS = 600
 
+# ----------------------------- Utilities -------------------------------------
 
 def _code_to_act_num(code: str) -> Optional[int]:
     try:
@@ -53,11 +48,9 @@ def _code_to_act_num(code: str) -> Optional[int]:
         return None
 
 
-def _parse_window_set(data: str) -> Optional[tuple[int, int]]:
+def _parse_window_range(rng: str) -> Optional[tuple[int, int]]:
+    # "7-21" -> (7, 21)
     try:
-        _, action, rng = data.split(":")
-        if action != "set":
-            return None
         s_raw, e_raw = rng.split("-")
         s, e = int(s_raw), int(e_raw)
         if not (0 <= s <= 24 and 0 <= e <= 24):
@@ -67,31 +60,30 @@ def _parse_window_set(data: str) -> Optional[tuple[int, int]]:
         return None
 
 
-def _window_presets_keyboard():
-    rows = [
-        [InlineKeyboardButton("24/7", callback_data="window:set:0-24"),
-         InlineKeyboardButton("07–21", callback_data="window:set:7-21")],
-        [InlineKeyboardButton("Custom", callback_data="schedule:custom")],
-        [InlineKeyboardButton("Back", callback_data="menu:open"),
-         InlineKeyboardButton("Close", callback_data="close")],
-    ]
-    return InlineKeyboardMarkup(rows)
-
-
-def _hours_keyboard(kind: str) -> "InlineKeyboardMarkup":
-    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
-    rows: list[list[InlineKeyboardButton]] = []
-    buf: list[InlineKeyboardButton] = []
-    for h in range(24):
-        label = f"{h:02d}"
-        buf.append(InlineKeyboardButton(label, callback_data=f"cust:{kind}:{h:02d}"))
-        if len(buf) == 6:
-            rows.append(buf); buf = []
-    if buf:
-        rows.append(buf)
-    rows.append([InlineKeyboardButton("Back", callback_data="menu:open"),
-                 InlineKeyboardButton("Close", callback_data="close")])
-    return InlineKeyboardMarkup(rows)
+# ----------------------------- Activity tracking -----------------------------
+
+
+async def on_any_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # Any update from a user proves the chat is deliverable again (they
+    # unblocked the bot or came back), so lift a previous unreachable mark.
+    user = update.effective_user
+    if user is None:
+        return
+    seen: dict[int, float] = context.application.bot_data.setdefault("reachable_seen", {})
+    now = time.monotonic()
+    if now - seen.get(user.id, float("-inf")) < _REACHABLE_RECHECK_SECONDS:
+        return
+    if len(seen) >= 100_000:
+        cutoff = now - _REACHABLE_RECHECK_SECONDS
+        for uid in [uid for uid, ts in seen.items() if ts < cutoff]:
+            del seen[uid]
+    seen[user.id] = now
+    try:
+        async with context.application.bot_data["session_factory"]() as session:
+            if await mark_user_reachable(session, user.id):
+                log.info("User %s is reachable again", user.id)
+    except Exception as e:
+        log.warning("Failed to update reachability for %s: %s", user.id, e)
 
 # ----------------------------- Fallback for old reply buttons -----------------
 
@@ -109,323 +101,247 @@ async def on_any_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
 
 # ----------------------------- Callback handling -----------------------------
 
-async def on_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if update.callback_query is None:
-        return
-    cq = update.callback_query
-    data = cq.data or ""
-    session_factory = context.application.bot_data["session_factory"]
+router = CallbackRouter()
 
-    if data == "noop":
-        await cq.answer()
-        return
 
-    # -------- Notifications toggle (explicit handling) --------
-    if data in ("notif:on", "notifications:on"):
-        if update.effective_user is None:
-            await cq.answer(); return
-        async with session_factory() as session:
-            await set_notifications_enabled(session, update.effective_user.id, True)
-            user = await get_user(session, update.effective_user.id)
-            enabled = bool(user.notifications_enabled) if user else True
-        await cq.edit_message_text("Notifications turned on.", reply_markup=notifications_inline_keyboard(enabled))
-        await cq.answer(); return
+@router.exact("noop")
+async def _noop(update: Update, context: ContextTypes.DEFAULT_TYPE, cb: CallbackData) -> None:
+    await update.callback_query.answer()
 
-    if data in ("notif:off", "notifications:off"):
-        if update.effective_user is None:
-            await cq.answer(); return
-        async with session_factory() as session:
-            await set_notifications_enabled(session, update.effective_user.id, False)
-            user = await get_user(session, update.effective_user.id)
-            enabled = bool(user.notifications_enabled) if user else False
-        await cq.edit_message_text("Notifications turned off.", reply_markup=notifications_inline_keyboard(enabled))
-        await cq.answer(); return
 
-    # -------- Main menu navigation --------
-    if data == "menu:open":
-        await cq.edit_message_text("Main menu:", reply_markup=main_menu_inline())
-        await cq.answer(); return
+# -------- Notifications toggle (explicit handling) --------
 
-    if data == "menu:current":
-        try:
-            tz = await _get_current_zone_cached(context)
-            code = code_by_name(tz.name)
-            text = f"Current terror zone: {name_by_code(code)}" if code else f"Current terror zone (from API): {tz.name}"
-        except (D2ApiError, D2ParseError) as e:
-            log.warning("Failed to fetch current zone: %s", e)
-            text = "Couldn't get the current terror zone. Please try again later."
-        await cq.edit_message_text(text, reply_markup=menu_nav_markup())
+@router.exact("notif:on", "notifications:on")
+async def _notif_on(update: Update, context: ContextTypes.DEFAULT_TYPE, cb: CallbackData) -> None:
+    cq = update.callback_query
+    if update.effective_user is None:
         await cq.answer(); return
+    async with context.application.bot_data["session_factory"]() as session:
+        await set_notifications_enabled(session, update.effective_user.id, True)
+    await cq.edit_message_text("Notifications turned on.", reply_markup=notifications_inline_keyboard(True))
+    await cq.answer()
 
-    if data == "menu:choose":
-        await cq.edit_message_text("Choose an Act:", reply_markup=acts_inline_keyboard())
-        await cq.answer(); return
 
-    if data == "menu:list":
-        if update.effective_user is None:
-            await cq.answer(); return
-        async with session_factory() as session:
-            selected = await get_user_locations(session, update.effective_user.id)
-        if not selected:
-            await cq.edit_message_text("You haven't selected any locations yet.", reply_markup=menu_nav_markup())
-            await cq.answer(); return
-        await cq.edit_message_text("Your selected locations:", reply_markup=selected_locations_inline_keyboard(selected))
+@router.exact("notif:off", "notifications:off")
+async def _notif_off(update: Update, context: ContextTypes.DEFAULT_TYPE, cb: CallbackData) -> None:
+    cq = update.callback_query
+    if update.effective_user is None:
         await cq.answer(); return
+    async with context.application.bot_data["session_factory"]() as session:
+        await set_notifications_enabled(session, update.effective_user.id, False)
+    await cq.edit_message_text("Notifications turned off.", reply_markup=notifications_inline_keyboard(False))
+    await cq.answer()
 
-    if data == "menu:notif":
-        if update.effective_user is None:
-            await cq.answer(); return
-        async with session_factory() as session:
-            user = await get_user(session, update.effective_user.id)
-            enabled = bool(user.notifications_enabled) if user else False
-        await cq.edit_message_text("Notification settings:", reply_markup=notifications_inline_keyboard(enabled))
-        await cq.answer(); return
 
-    if data == "menu:schedule":
-        if update.effective_user is None:
-            await cq.answer(); return
-        async with session_factory() as session:
-            user = await get_user(session, update.effective_user.id)
-        start, end, enabled = _extract_window_from_user(user) if user else (0, 24, False)
-        text = (
-            "Pick a UTC time schedule preset\n"
-            f"Current window (UTC): {start:02d}–{end:02d}"
-        )
-        if not enabled:
-            text += "\nNotifications are currently OFF."
-        await cq.edit_message_text(text, reply_markup=_window_presets_keyboard())
-        await cq.answer()
-        return
+# -------- Main menu navigation --------
+
+@router.exact("menu:open")
+async def _menu_open(update: Update, context: ContextTypes.DEFAULT_TYPE, cb: CallbackData) -> None:
+    cq = update.callback_query
+    await cq.edit_message_text("Main menu:", reply_markup=main_menu_inline())
+    await cq.answer()
+
+
+@router.exact("menu:current")
+async def _menu_current(update: Update, context: ContextTypes.DEFAULT_TYPE, cb: CallbackData) -> None:
+    cq = update.callback_query
+    try:
+        zone_state: ZoneStateService = context.application.bot_data["zone_state"]
+        tz, outdated = await zone_state.get_or_last_known()
+        code = code_by_name(tz.name)
+        text = f"Current terror zone: {name_by_code(code)}" if code else f"Current terror zone (from API): {tz.name}"
+        if outdated:
+            text += "\n(last known zone; the zone service is unavailable right now)"
+    except (D2ApiError, D2ParseError) as e:
+        log.warning("Failed to fetch current zone: %s", e)
+        text = "Couldn't get the current terror zone. Please try again later."
+    await cq.edit_message_text(text, reply_markup=menu_nav_markup())
+    await cq.answer()
+
+
+@router.exact("menu:choose", "back:acts")
+async def _menu_choose(update: Update, context: ContextTypes.DEFAULT_TYPE, cb: CallbackData) -> None:
+    cq = update.callback_query
+    await cq.edit_message_text("Choose an Act:", reply_markup=acts_inline_keyboard())
+    await cq.answer()
 
-    # -------- Schedule (presets & custom) --------
-    if data == "notif:window":
-        if update.effective_user is None:
-            await cq.answer(); return
-        async with session_factory() as session:
-            user = await get_user(session, update.effective_user.id)
-        start, end, enabled = _extract_window_from_user(user) if user else (0, 24, False)
-        text = (
-            "Pick a UTC time schedule preset\n"
-            f"Current window (UTC): {start:02d}–{end:02d}"
-        )
-        if not enabled:
-            text += "\nNotifications are currently OFF."
-        await cq.edit_message_text(text, reply_markup=_window_presets_keyboard())
-        await cq.answer(); return
 
-    if data.startswith("window:set:"):
-        if update.effective_user is None:
-            await cq.answer("No user", show_alert=False); return
-        parsed = _parse_window_set(data)
-        if not parsed:
-            await cq.answer("Invalid window format", show_alert=False); return
-        s, e = parsed
-        async with session_factory() as session:
-            await set_notification_window(session, update.effective_user.id, s, e)
-        await cq.edit_message_text(f"Notification window (UTC) set to: {s:02d}-{e:02d}")
+@router.exact("menu:list")
+async def _menu_list(update: Update, context: ContextTypes.DEFAULT_TYPE, cb: CallbackData) -> None:
+    cq = update.callback_query
+    if update.effective_user is None:
+        await cq.answer(); return
+    async with context.application.bot_data["session_factory"]() as session:
+        selected = await get_user_locations(session, update.effective_user.id)
+    if not selected:
+        await cq.edit_message_text("You haven't selected any locations yet.", reply_markup=menu_nav_markup())
         await cq.answer(); return
+    await cq.edit_message_text("Your selected locations:", reply_markup=selected_locations_inline_keyboard(selected))
+    await cq.answer()
 
-    if data == "schedule:custom":
-        await cq.edit_message_text("Select start hour (UTC):", reply_markup=_hours_keyboard("start"))
+
+@router.exact("menu:notif", "back:notif")
+async def _menu_notif(update: Update, context: ContextTypes.DEFAULT_TYPE, cb: CallbackData) -> None:
+    cq = update.callback_query
+    if update.effective_user is None:
         await cq.answer(); return
+    async with context.application.bot_data["session_factory"]() as session:
+        user = await get_user_settings(session, update.effective_user.id)
+    enabled = user.notifications_enabled if user else False
+    title = "Notifications:" if cb.raw == "back:notif" else "Notification settings:"
+    await cq.edit_message_text(title, reply_markup=notifications_inline_keyboard(enabled))
+    await cq.answer()
 
-    if data.startswith("cust:start:"):
-        try:
-            start = int(data.split(":")[2])
-        except Exception:
-            await cq.answer("Invalid hour", show_alert=False); return
-        context.user_data["cust_start_hour"] = start
-        await cq.edit_message_text("Select end hour (UTC):", reply_markup=_hours_keyboard("end"))
+
+# -------- Schedule (presets & custom) --------
+
+@router.exact("menu:schedule", "notif:window")
+async def _schedule(update: Update, context: ContextTypes.DEFAULT_TYPE, cb: CallbackData) -> None:
+    cq = update.callback_query
+    if update.effective_user is None:
         await cq.answer(); return
+    async with context.application.bot_data["session_factory"]() as session:
+        user = await get_user_settings(session, update.effective_user.id)
+    if user is not None:
+        start, end, enabled = user.allowed_start_hour, user.allowed_end_hour, user.notifications_enabled
+    else:
+        start, end, enabled = 0, 24, False
+    text = (
+        "Pick a UTC time schedule preset\n"
+        f"Current window (UTC): {start:02d}–{end:02d}"
+    )
+    if not enabled:
+        text += "\nNotifications are currently OFF."
+    await cq.edit_message_text(text, reply_markup=window_presets_keyboard())
+    await cq.answer()
+
+
+@router.prefix("window:set")
+async def _window_set(update: Update, context: ContextTypes.DEFAULT_TYPE, cb: CallbackData) -> None:
+    cq = update.callback_query
+    if update.effective_user is None:
+        await cq.answer("No user", show_alert=False); return
+    parsed = _parse_window_range(cb.arg(0) or "") if len(cb.args) == 1 else None
+    if not parsed:
+        await cq.answer("Invalid window format", show_alert=False); return
+    s, e = parsed
+    async with context.application.bot_data["session_factory"]() as session:
+        await set_notification_window(session, update.effective_user.id, s, e)
+    await cq.edit_message_text(f"Notification window (UTC) set to: {s:02d}-{e:02d}")
+    await cq.answer()
+
+
+@router.exact("schedule:custom")
+async def _schedule_custom(update: Update, context: ContextTypes.DEFAULT_TYPE, cb: CallbackData) -> None:
+    cq = update.callback_query
+    await cq.edit_message_text("Select start hour (UTC):", reply_markup=hours_keyboard("start"))
+    await cq.answer()
 
-    if data.startswith("cust:end:"):
-        if update.effective_user is None:
-            await cq.answer("No user", show_alert=False); return
-        try:
-            end = int(data.split(":")[2])
-        except Exception:
-            await cq.answer("Invalid hour", show_alert=False); return
-        start = context.user_data.get("cust_start_hour")
-        if start is None:
-            await cq.edit_message_text(
-                "Pick a UTC time schedule preset:",
-                reply_markup=_window_presets_keyboard(),
-            )
-            await cq.answer(); return
-
-        if not (0 <= start <= 23 and 0 <= end <= 23) or start > end:
-            await cq.edit_message_text(
-                "Invalid range. Start must be ≤ end (e.g., 07–21) or equal for a single hour (e.g., 07–07). "
-                "No changes saved.",
-                reply_markup=_window_presets_keyboard(),
-            )
-            context.user_data.pop("cust_start_hour", None)
-            await cq.answer(); return
-
-        async with session_factory() as session:
-            await set_notification_window(session, update.effective_user.id, int(start), int(end))
 
-        context.user_data.pop("cust_start_hour", None)
-        await cq.edit_message_text(f"Notification window (UTC) set to: {int(start):02d}-{int(end):02d}")
+@router.prefix("cust:start")
+async def _custom_start(update: Update, context: ContextTypes.DEFAULT_TYPE, cb: CallbackData) -> None:
+    cq = update.callback_query
+    start = cb.int_arg(0)
+    if start is None:
+        await cq.answer("Invalid hour", show_alert=False); return
+    context.user_data["cust_start_hour"] = start
+    await cq.edit_message_text("Select end hour (UTC):", reply_markup=hours_keyboard("end"))
+    await cq.answer()
+
+
+@router.prefix("cust:end")
+async def _custom_end(update: Update, context: ContextTypes.DEFAULT_TYPE, cb: CallbackData) -> None:
+    cq = update.callback_query
+    if update.effective_user is None:
+        await cq.answer("No user", show_alert=False); return
+    end = cb.int_arg(0)
+    if end is None:
+        await cq.answer("Invalid hour", show_alert=False); return
+    start = context.user_data.get("cust_start_hour")
+    if start is None:
+        await cq.edit_message_text(
+            "Pick a UTC time schedule preset:",
+            reply_markup=window_presets_keyboard(),
+        )
         await cq.answer(); return
 
-    # -------- Acts & locations --------
-    if data.startswith("act:"):
-        act_num = _parse_act(data)
-        if act_num is None:
-            await cq.answer("Unknown act", show_alert=False); return
-        selected = set()
-        if update.effective_user:
-            async with session_factory() as session:
-                selected = await get_user_locations(session, update.effective_user.id)
+    if not (0 <= start <= 23 and 0 <= end <= 23) or start > end:
         await cq.edit_message_text(
-            text=f"Select locations (Act {act_num}):",
-            reply_markup=locations_inline_keyboard(act_num, selected),
+            "Invalid range. Start must be ≤ end (e.g., 07–21) or equal for a single hour (e.g., 07–07). "
+            "No changes saved.",
+            reply_markup=window_presets_keyboard(),
         )
+        context.user_data.pop("cust_start_hour", None)
         await cq.answer(); return
 
-    if data.startswith("loc:"):
-        code = _parse_loc_toggle(data)
-        if code is None or update.effective_user is None:
-            await cq.answer("Data error", show_alert=False); return
-        async with session_factory() as session:
-            inserted = await add_location(session, update.effective_user.id, code)
-            if not inserted:
-                await remove_location(session, update.effective_user.id, code)
+    async with context.application.bot_data["session_factory"]() as session:
+        await set_notification_window(session, update.effective_user.id, int(start), int(end))
+
+    context.user_data.pop("cust_start_hour", None)
+    await cq.edit_message_text(f"Notification window (UTC) set to: {int(start):02d}-{int(end):02d}")
+    await cq.answer()
+
+
+# -------- Acts & locations --------
+
+@router.prefix("act")
+async def _act(update: Update, context: ContextTypes.DEFAULT_TYPE, cb: CallbackData) -> None:
+    cq = update.callback_query
+    act_num = cb.int_arg(0)
+    if act_num is None:
+        await cq.answer("Unknown act", show_alert=False); return
+    selected = set()
+    if update.effective_user:
+        async with context.application.bot_data["session_factory"]() as session:
             selected = await get_user_locations(session, update.effective_user.id)
-        act_num = _code_to_act_num(code)
-        if act_num is None:
-            await cq.edit_message_text("Choose an Act:", reply_markup=acts_inline_keyboard())
-        else:
-            await cq.edit_message_text(
-                text=f"Select locations (Act {act_num}):",
-                reply_markup=locations_inline_keyboard(act_num, selected),
-            )
-        await cq.answer("Added" if inserted else "Removed", show_alert=False); return
-
-    # -------- Navigation & misc --------
-    if data == "back:acts":
-        await cq.edit_message_text("Choose an Act:", reply_markup=acts_inline_keyboard())
-        await cq.answer(); return
+    await cq.edit_message_text(
+        text=f"Select locations (Act {act_num}):",
+        reply_markup=locations_inline_keyboard(act_num, selected),
+    )
+    await cq.answer()
 
-    if data == "back:notif":
-        if update.effective_user is None:
-            await cq.answer(); return
-        async with session_factory() as session:
-            user = await get_user(session, update.effective_user.id)
-            enabled = bool(user.notifications_enabled) if user else False
-        await cq.edit_message_text("Notifications:", reply_markup=notifications_inline_keyboard(enabled))
-        await cq.answer(); return
 
-    if data == "close":
-        try:
-            await cq.message.delete()
-        except Exception:
-            try:
-                await cq.edit_message_text("Closed.")
-            except Exception:
-                pass
-        await cq.answer(); return
+@router.prefix("loc")
+async def _location_toggle(update: Update, context: ContextTypes.DEFAULT_TYPE, cb: CallbackData) -> None:
+    cq = update.callback_query
+    code = cb.arg(0) if cb.args[1:] == ("toggle",) else None
+    if code is None or update.effective_user is None:
+        await cq.answer("Data error", show_alert=False); return
+    async with context.application.bot_data["session_factory"]() as session:
+        inserted, selected = await toggle_location(session, update.effective_user.id, code)
+    act_num = _code_to_act_num(code)
+    if act_num is None:
+        await cq.edit_message_text("Choose an Act:", reply_markup=acts_inline_keyboard())
+    else:
+        await cq.edit_message_text(
+            text=f"Select locations (Act {act_num}):",
+            reply_markup=locations_inline_keyboard(act_num, selected),
+        )
+    await cq.answer("Added" if inserted else "Removed", show_alert=False)
 
-    await cq.answer("Unknown action", show_alert=False)
 
+# -------- Navigation & misc --------
 
-def _extract_window_from_user(user) -> tuple[int, int, bool]:
-    """
-    Возвращает (start_hour, end_hour, notifications_enabled) из ORM-объекта User,
-    не используя sqlalchemy.inspection.inspect. Интроспектим доступные атрибуты.
-    """
-    names: list[str]
+@router.exact("close")
+async def _close(update: Update, context: ContextTypes.DEFAULT_TYPE, cb: CallbackData) -> None:
+    cq = update.callback_query
     try:
-        names = [attr.key for attr in getattr(user, "__mapper__").attrs]
+        await cq.message.delete()
     except Exception:
-        names = [n for n in dir(user) if not n.startswith("_")]
-
-    values: dict[str, object] = {}
-    for name in names:
         try:
-            values[name] = getattr(user, name)
+            await cq.edit_message_text("Closed.")
         except Exception:
-            continue
-
-    enabled = bool(values.get("notifications_enabled", False))
-
-    numeric: dict[str, int] = {}
-    for k, v in values.items():
-        if isinstance(v, int) and 0 <= v <= 24:
-            numeric[k] = int(v)
-
-    def pick_start_end(kind: str) -> int | None:
-        is_end = (kind == "end")
-        keywords_primary = ("end", "to") if is_end else ("start", "from")
-        best_key: str | None = None
-        best_score = 10**9
-
-        for k, val in numeric.items():
-            lk = k.lower()
-            if not any(w in lk for w in keywords_primary):
-                continue
-            score = 0
-            if "hour" in lk: score -= 2
-            if "window" in lk: score -= 2
-            if "notify" in lk or "notif" in lk or "notification" in lk: score -= 1
-            if "utc" in lk: score -= 1
-            score += len(lk) // 10
-            if score < best_score:
-                best_score = score
-                best_key = k
-
-        return numeric.get(best_key) if best_key is not None else None
-
-    start = pick_start_end("start")
-    end = pick_start_end("end")
-
-    if start is None or end is None:
-        def weight(k: str) -> int:
-            lk = k.lower()
-            w = 0
-            if "start" in lk or "from" in lk: w -= 3
-            if "end" in lk or "to" in lk: w -= 3
-            if "hour" in lk: w -= 2
-            if "window" in lk: w -= 2
-            if "notify" in lk or "notif" in lk or "notification" in lk: w -= 1
-            if "utc" in lk: w -= 1
-            return w
-
-        ordered = sorted(numeric.keys(), key=weight)
-        cand_start = next((k for k in ordered if any(s in k.lower() for s in ("start", "from"))), None)
-        cand_end = next((k for k in ordered if any(e in k.lower() for e in ("end", "to")) and k != cand_start), None)
-        if cand_start is not None and cand_end is not None:
-            start = numeric[cand_start]
-            end = numeric[cand_end]
-
-    if start is None or end is None:
-        raise LookupError("Cannot determine notification window fields on User")
-
-    return int(start), int(end), enabled
-
-
-async def _get_current_zone_cached(context: ContextTypes.DEFAULT_TYPE):
-    from datetime import datetime, timedelta, timezone
-
-    store = context.application.bot_data
-    client: D2ApiClient = store["d2_client"]
-    now = datetime.now(timezone.utc)
-
-    bypass = now.minute < 5
-
-    if not bypass:
-        cached = store.get("tz_cache")
-        ts = store.get("tz_cache_ts")
-        if cached is not None and ts is not None and (now - ts) <= timedelta(minutes=10):
-            return cached
-
-    tz = await client.get_current_terror_zone()
-    store["tz_cache"] = tz
-    store["tz_cache_ts"] = now
-    return tz
+            pass
+    await cq.answer()
+
+
+@router.fallback
+async def _unknown(update: Update, context: ContextTypes.DEFAULT_TYPE, cb: CallbackData) -> None:
+    await update.callback_query.answer("Unknown action", show_alert=False)
 
 
 def register_handlers(app: Application) -> None:
+    app.add_handler(TypeHandler(Update, on_any_update), group=-1)
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, on_any_text))
-    app.add_handler(CallbackQueryHandler(on_callback))
+    app.add_handler(CallbackQueryHandler(router.dispatch))
+    app.bot_data["callback_router"] = router
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from functools import lru_cache
 from typing import Iterable, Sequence
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
@@ -17,9 +18,27 @@ ACT_TITLES_UI = {
     ACT5: "Act V",
 }
 
+# Everything below is built once: keyboards that never change are module
+# constants, selection-dependent ones are assembled from shared, prebuilt
+# buttons and memoised by selection bitmask. Telegram objects are immutable,
+# so handing the same instance to every callback is safe.
+
+_NAV_BUTTONS = (
+    InlineKeyboardButton("Menu", callback_data="menu:open"),
+    InlineKeyboardButton("Close", callback_data="close"),
+)
+_BACK_CLOSE_BUTTONS = (
+    InlineKeyboardButton("Back", callback_data="menu:open"),
+    InlineKeyboardButton("Close", callback_data="close"),
+)
+
+# Bounds the memoised selection-dependent keyboards (Act I alone has 2**12 subsets).
+KEYBOARD_CACHE_SIZE = 1024
+
+
 # ----------------------------- Main inline menu ------------------------------
 
-def main_menu_inline() -> InlineKeyboardMarkup:
+def _build_main_menu() -> InlineKeyboardMarkup:
     rows = [
         [InlineKeyboardButton("Current terror zone", callback_data="menu:current")],
         [InlineKeyboardButton("Choose locations", callback_data="menu:choose")],
@@ -30,65 +49,87 @@ def main_menu_inline() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(rows)
 
 
+def _build_menu_nav() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([_NAV_BUTTONS])
+
+
+_MAIN_MENU = _build_main_menu()
+_MENU_NAV = _build_menu_nav()
+
+
+def main_menu_inline() -> InlineKeyboardMarkup:
+    return _MAIN_MENU
+
+
 def menu_nav_markup() -> InlineKeyboardMarkup:
-    row = [
-        InlineKeyboardButton("Menu", callback_data="menu:open"),
-        InlineKeyboardButton("Close", callback_data="close"),
-    ]
-    return InlineKeyboardMarkup([row])
+    return _MENU_NAV
 
 
 # ----------------------------- Inline sub-menus ------------------------------
 
-def acts_inline_keyboard() -> InlineKeyboardMarkup:
+_ACTS = {1: ACT1, 2: ACT2, 3: ACT3, 4: ACT4, 5: ACT5}
+
+
+def _build_acts() -> InlineKeyboardMarkup:
     rows: list[list[InlineKeyboardButton]] = []
-    for idx, act in enumerate((ACT1, ACT2, ACT3, ACT4, ACT5), start=1):
+    for idx, act in _ACTS.items():
         title = ACT_TITLES_UI.get(act, act)
         rows.append([InlineKeyboardButton(title, callback_data=f"act:{idx}")])
-    rows.append([
-        InlineKeyboardButton("Menu", callback_data="menu:open"),
-        InlineKeyboardButton("Close", callback_data="close"),
-    ])
+    rows.append(_NAV_BUTTONS)
     return InlineKeyboardMarkup(rows)
 
 
-def locations_inline_keyboard(act_number: int, selected_codes: Iterable[str]) -> InlineKeyboardMarkup:
-    act_map = {1: ACT1, 2: ACT2, 3: ACT3, 4: ACT4, 5: ACT5}
-    act_title = act_map.get(act_number)
-    if not act_title:
-        return InlineKeyboardMarkup([[InlineKeyboardButton("Back", callback_data="back:acts")]])
+_ACTS_KEYBOARD = _build_acts()
 
-    selected = set(str(c) for c in selected_codes)
-    codes: Sequence[str] = codes_for_act(act_title)
 
-    rows: list[list[InlineKeyboardButton]] = []
-    buf: list[InlineKeyboardButton] = []
-    for code in codes:
-        checked = "✅ " if code in selected else "▫ "
-        label = f"{checked}{name_by_code(code)}"
-        btn = InlineKeyboardButton(label, callback_data=f"loc:{code}:toggle")
-        buf.append(btn)
-        if len(buf) == 2:
-            rows.append(buf)
-            buf = []
-    if buf:
-        rows.append(buf)
+def acts_inline_keyboard() -> InlineKeyboardMarkup:
+    return _ACTS_KEYBOARD
 
-    rows.append([
-        InlineKeyboardButton("Back", callback_data="menu:open"),
-        InlineKeyboardButton("Close", callback_data="close"),
-    ])
-    return InlineKeyboardMarkup(rows)
 
+def _pairs(buttons: Sequence[InlineKeyboardButton]) -> list[Sequence[InlineKeyboardButton]]:
+    return [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
 
-def selected_locations_inline_keyboard(selected_codes: Iterable[str]) -> InlineKeyboardMarkup:
+
+# Per act: its codes in display order, and (unchecked, checked) buttons for each.
+_ACT_CODES: dict[int, tuple[str, ...]] = {n: tuple(codes_for_act(act)) for n, act in _ACTS.items()}
+_TOGGLE_BUTTONS: dict[str, tuple[InlineKeyboardButton, InlineKeyboardButton]] = {
+    code: (
+        InlineKeyboardButton(f"▫ {name_by_code(code)}", callback_data=f"loc:{code}:toggle"),
+        InlineKeyboardButton(f"✅ {name_by_code(code)}", callback_data=f"loc:{code}:toggle"),
+    )
+    for codes in _ACT_CODES.values()
+    for code in codes
+}
+_NO_ACT_KEYBOARD = InlineKeyboardMarkup([[InlineKeyboardButton("Back", callback_data="back:acts")]])
+
+
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def _locations_keyboard(act_number: int, mask: int) -> InlineKeyboardMarkup:
+    codes = _ACT_CODES[act_number]
+    buttons = [_TOGGLE_BUTTONS[code][(mask >> i) & 1] for i, code in enumerate(codes)]
+    return InlineKeyboardMarkup([*_pairs(buttons), _BACK_CLOSE_BUTTONS])
+
+
+def locations_inline_keyboard(act_number: int, selected_codes: Iterable[str]) -> InlineKeyboardMarkup:
+    codes = _ACT_CODES.get(act_number)
+    if codes is None:
+        return _NO_ACT_KEYBOARD
+    selected = selected_codes if isinstance(selected_codes, (set, frozenset)) else set(selected_codes)
+    # Bit i set when the act's i-th location is selected; other acts don't matter.
+    mask = 0
+    for i, code in enumerate(codes):
+        if code in selected:
+            mask |= 1 << i
+    return _locations_keyboard(act_number, mask)
+
+
+def _build_selected_locations_keyboard(selected_codes: Iterable[str]) -> InlineKeyboardMarkup:
     selected = set(str(c) for c in selected_codes)
 
-    act_order = [(1, ACT1), (2, ACT2), (3, ACT3), (4, ACT4), (5, ACT5)]
     rows: list[list[InlineKeyboardButton]] = []
 
     any_act = False
-    for _, act_title in act_order:
+    for act_title in _ACTS.values():
         act_codes = [c for c in codes_for_act(act_title) if c in selected]
         if not act_codes:
             continue
@@ -109,22 +150,72 @@ def selected_locations_inline_keyboard(selected_codes: Iterable[str]) -> InlineK
     if not any_act:
         return InlineKeyboardMarkup([[InlineKeyboardButton("Menu", callback_data="menu:open")]])
 
-    rows.append([
-        InlineKeyboardButton("Back", callback_data="menu:open"),
-        InlineKeyboardButton("Close", callback_data="close"),
-    ])
+    rows.append(_BACK_CLOSE_BUTTONS)
     return InlineKeyboardMarkup(rows)
 
 
-def notifications_inline_keyboard(enabled: bool) -> InlineKeyboardMarkup:
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def _selected_locations_keyboard(selected: frozenset[str]) -> InlineKeyboardMarkup:
+    return _build_selected_locations_keyboard(selected)
+
+
+def selected_locations_inline_keyboard(selected_codes: Iterable[str]) -> InlineKeyboardMarkup:
+    # Codes outside the known acts aren't shown, so they don't split the cache.
+    return _selected_locations_keyboard(frozenset(c for c in selected_codes if c in _TOGGLE_BUTTONS))
+
+
+def _build_notifications_keyboard(enabled: bool) -> InlineKeyboardMarkup:
     rows: list[list[InlineKeyboardButton]] = []
     if enabled:
         rows.append([InlineKeyboardButton("Turn off notifications", callback_data="notif:off")])
     else:
         rows.append([InlineKeyboardButton("Turn on notifications", callback_data="notif:on")])
     rows.append([InlineKeyboardButton("Time schedule (UTC)", callback_data="notif:window")])
-    rows.append([
-        InlineKeyboardButton("Menu", callback_data="menu:open"),
-        InlineKeyboardButton("Close", callback_data="close"),
-    ])
+    rows.append(_NAV_BUTTONS)
+    return InlineKeyboardMarkup(rows)
+
+
+_NOTIFICATIONS = {True: _build_notifications_keyboard(True), False: _build_notifications_keyboard(False)}
+
+
+def notifications_inline_keyboard(enabled: bool) -> InlineKeyboardMarkup:
+    return _NOTIFICATIONS[bool(enabled)]
+
+
+# ----------------------------- Schedule --------------------------------------
+
+def _build_window_presets() -> InlineKeyboardMarkup:
+    rows = [
+        [InlineKeyboardButton("24/7", callback_data="window:set:0-24"),
+         InlineKeyboardButton("07–21", callback_data="window:set:7-21")],
+        [InlineKeyboardButton("Custom", callback_data="schedule:custom")],
+        _BACK_CLOSE_BUTTONS,
+    ]
+    return InlineKeyboardMarkup(rows)
+
+
+def _build_hours_keyboard(kind: str) -> InlineKeyboardMarkup:
+    rows: list[list[InlineKeyboardButton]] = []
+    buf: list[InlineKeyboardButton] = []
+    for h in range(24):
+        label = f"{h:02d}"
+        buf.append(InlineKeyboardButton(label, callback_data=f"cust:{kind}:{h:02d}"))
+        if len(buf) == 6:
+            rows.append(buf); buf = []
+    if buf:
+        rows.append(buf)
+    rows.append(_BACK_CLOSE_BUTTONS)
     return InlineKeyboardMarkup(rows)
+
+
+_WINDOW_PRESETS = _build_window_presets()
+_HOURS = {kind: _build_hours_keyboard(kind) for kind in ("start", "end")}
+
+
+def window_presets_keyboard() -> InlineKeyboardMarkup:
+    return _WINDOW_PRESETS
+
+
+def hours_keyboard(kind: str) -> InlineKeyboardMarkup:
+    markup = _HOURS.get(kind)
+    return markup if markup is not None else _build_hours_keyboard(kind)
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+
+@dataclass
+class LedgerStats:
+    hits: int = 0
+    db_hits: int = 0
+    misses: int = 0
+
+    def as_log_str(self) -> str:
+        return f"hits={self.hits} db_hits={self.db_hits} misses={self.misses}"
+
+
+class DeliveryLedger:
+    """
+    Last delivered alert per user, as a packed ``db.dal.delivery_key`` int.
+
+    The outbox already holds one row per (zone-hour, user). This ledger
+    covers the remaining gap: a claim lease that expires while its sender is
+    still working (e.g. stretched by a long RetryAfter pause) makes the row
+    claimable again. Looking claimed rows up here before sending filters
+    such duplicates before they use rate-limit budget. The users.last_delivered_key
+    column is the DB-backed fallback for other processes.
+    """
+
+    def __init__(self, *, max_entries: int = 1_000_000) -> None:
+        self._max_entries = max_entries
+        self._last: dict[int, int] = {}
+        self.stats = LedgerStats()
+
+    def delivered(self, user_id: int, key: int) -> bool:
+        if self._last.get(user_id) == key:
+            self.stats.hits += 1
+            return True
+        self.stats.misses += 1
+        return False
+
+    def record(self, user_id: int, key: int) -> None:
+        if len(self._last) >= self._max_entries and user_id not in self._last:
+            self._evict(key)
+        self._last[user_id] = key
+
+    def _evict(self, current_key: int) -> None:
+        # Older deliveries can no longer collide with a current claim.
+        self._last = {uid: k for uid, k in self._last.items() if k >= current_key}
+        if len(self._last) >= self._max_entries:
+            self._last.clear()
@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bot.broadcast import Broadcaster, BroadcastReport, OUTCOME_FAILED, OUTCOME_SENT, OUTCOME_UNREACHABLE
+from bot.ledger import DeliveryLedger
+from constants.locations import name_by_code
+from db.dal import (
+    claim_outbox_batch, complete_broadcast_runs, delivery_key, expire_stale_outbox, extend_outbox_lease,
+    users_with_delivery, mark_outbox_failed, mark_outbox_retry, mark_outbox_sent, mark_users_unreachable,
+    purge_finished_outbox, record_broadcast_progress, register_broadcast_sender, OutboxItem, OUTBOX_LEASE_SECONDS,
+)
+
+log = logging.getLogger("bot.outbox")
+
+# How often a batch in flight writes back its outcomes and renews its lease.
+HEARTBEAT_SECONDS = 5.0
+# Identifies this process in broadcast_senders; a sender that hasn't been
+# seen for SENDER_LIVE_SECONDS no longer takes a share of the rate budget.
+SENDER_ID = f"{socket.gethostname()}:{os.getpid()}"
+SENDER_LIVE_SECONDS = 90
+
+
+def zone_alert_text(code: str) -> str:
+    return f"Zone active now: {name_by_code(code)}"
+
+
+async def drain_outbox(
+    session_factory: async_sessionmaker[AsyncSession],
+    broadcaster: Broadcaster,
+    *,
+    batch_size: int,
+    max_attempts: int,
+    producer: Optional[asyncio.Task] = None,
+    ledger: Optional[DeliveryLedger] = None,
+    rate_budget: Optional[float] = None,
+) -> BroadcastReport:
+    """
+    Claims due outbox rows batch by batch and sends them until none are left.
+
+    Safe to run from any number of processes at once: rows are claimed with
+    FOR UPDATE SKIP LOCKED, so every worker gets a disjoint share. While a
+    batch is going out, outcomes are written back every few seconds and the
+    lease of the rows not sent yet is renewed, so a slow batch is never
+    re-claimed by another worker. Each worker adds its counts to the shared
+    broadcast_runs row of the zone-hour; whichever worker finds the hour
+    fully drained marks it complete.
+
+    With ``producer`` set (the task still enqueueing recipients), an empty
+    claim only ends the drain once the producer has finished. With ``ledger``
+    set, rows already delivered are marked sent without sending again. With
+    ``rate_budget`` set (messages per second for the bot token), the budget
+    is split evenly between the processes currently sending.
+    """
+    total = BroadcastReport()
+
+    if rate_budget is not None:
+        await _share_rate(session_factory, broadcaster, rate_budget)
+    async with session_factory() as session:
+        expired = await expire_stale_outbox(session)
+        purged = await purge_finished_outbox(session)
+    if expired:
+        log.info("Outbox: expired %d notifications from past hours", expired)
+    if purged:
+        log.info("Outbox: deleted %d finished notifications from past hours", purged)
+
+    while True:
+        # No more than half a lease's worth of sends per claim, so even a
+        # missed renewal leaves the batch time to finish.
+        limit = min(batch_size, max(1, int(broadcaster.rate_per_second * OUTBOX_LEASE_SECONDS / 2)))
+        async with session_factory() as session:
+            batch = await claim_outbox_batch(session, limit)
+        if not batch:
+            if producer is None or producer.done():
+                break
+            # More recipients are still being enqueued; wait for the next page.
+            await asyncio.wait({producer}, timeout=0.2)
+            continue
+
+        results = _BatchResults(batch)
+        keys = {item.id: delivery_key(item.zone_hour, item.location_code) for item in batch}
+        if ledger is not None:
+            for item_id in await _skip_delivered(session_factory, ledger, batch, keys):
+                results.done(item_id, results.sent)
+
+        groups: dict[tuple[datetime, str], dict[int, int]] = {}
+        for item in batch:
+            if item.id in results.unsent:
+                groups.setdefault((item.zone_hour, item.location_code), {})[item.user_id] = item.id
+
+        batch_done = asyncio.Event()
+        heartbeat = asyncio.create_task(
+            _heartbeat(session_factory, broadcaster, results, batch_done, max_attempts, rate_budget)
+        )
+        try:
+            for (zone_hour, code), row_ids in groups.items():
+                def _on_result(uid: int, outcome: str, row_ids: dict[int, int] = row_ids) -> None:
+                    row_id = row_ids[uid]
+                    if outcome == OUTCOME_SENT:
+                        results.done(row_id, results.sent)
+                        results.delivered.append((uid, keys[row_id]))
+                        if ledger is not None:
+                            ledger.record(uid, keys[row_id])
+                    elif outcome == OUTCOME_UNREACHABLE:
+                        results.done(row_id, results.failed)
+                        results.unreachable_users.append(uid)
+                    elif outcome == OUTCOME_FAILED:
+                        results.done(row_id, results.failed)
+                    else:
+                        results.done(row_id, results.retry)
+
+                report = await broadcaster.broadcast(list(row_ids), zone_alert_text(code), on_result=_on_result)
+                results.progress.append((zone_hour, code, report))
+                total.merge(report)
+        finally:
+            # Let a flush in progress finish rather than cancel it half-written.
+            batch_done.set()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+            await results.flush(session_factory, max_attempts)
+
+    if total.total:
+        log.info("Outbox drained: %s", total.as_log_str())
+        if ledger is not None:
+            log.info("Delivery ledger: %s", ledger.stats.as_log_str())
+
+    async with session_factory() as session:
+        for run in await complete_broadcast_runs(session):
+            log.info(
+                "Broadcast %s zone %s complete: sent=%d failed=%d throttled=%d in %.1fs",
+                run.zone_hour.isoformat(), run.location_code,
+                run.sent, run.failed, run.throttled, run.wall_seconds,
+            )
+    return total
+
+
+class _BatchResults:
+    """Outcomes of a claimed batch not yet written back, and the rows still unsent."""
+
+    def __init__(self, batch: list[OutboxItem]) -> None:
+        self.unsent: dict[int, OutboxItem] = {item.id: item for item in batch}
+        self.sent: list[int] = []
+        self.failed: list[int] = []
+        self.retry: list[int] = []
+        self.unreachable_users: list[int] = []
+        self.delivered: list[tuple[int, int]] = []
+        self.progress: list[tuple[datetime, str, BroadcastReport]] = []
+
+    def done(self, row_id: int, outcome: list[int]) -> None:
+        outcome.append(row_id)
+        self.unsent.pop(row_id, None)
+
+    async def flush(self, session_factory: async_sessionmaker[AsyncSession], max_attempts: int) -> None:
+        # Take the lists before the first await; results arriving meanwhile
+        # go into fresh ones for the next flush.
+        sent, self.sent = self.sent, []
+        failed, self.failed = self.failed, []
+        retry, self.retry = self.retry, []
+        unreachable_users, self.unreachable_users = self.unreachable_users, []
+        delivered, self.delivered = self.delivered, []
+        progress, self.progress = self.progress, []
+        if not (sent or failed or retry or unreachable_users or progress):
+            return
+        try:
+            async with session_factory() as session:
+                await mark_outbox_sent(session, sent, delivered=delivered)
+                await mark_outbox_failed(session, failed)
+                await mark_outbox_retry(session, retry, max_attempts=max_attempts)
+                pruned = await mark_users_unreachable(session, unreachable_users)
+                if pruned:
+                    log.info("Outbox: marked %d users unreachable", pruned)
+                for zone_hour, code, report in progress:
+                    await record_broadcast_progress(
+                        session, zone_hour, code,
+                        sent=report.sent, failed=report.failed + report.unreachable, throttled=report.throttled,
+                    )
+        except BaseException:
+            # Keep them for the next flush; the status updates are idempotent.
+            self.sent[:0] = sent
+            self.failed[:0] = failed
+            self.retry[:0] = retry
+            self.unreachable_users[:0] = unreachable_users
+            self.delivered[:0] = delivered
+            self.progress[:0] = progress
+            raise
+
+
+async def _heartbeat(
+    session_factory: async_sessionmaker[AsyncSession],
+    broadcaster: Broadcaster,
+    results: _BatchResults,
+    batch_done: asyncio.Event,
+    max_attempts: int,
+    rate_budget: Optional[float],
+) -> None:
+    """Until the batch is done: writes back outcomes, renews the lease of unsent rows, re-splits the rate."""
+    while True:
+        try:
+            await asyncio.wait_for(batch_done.wait(), timeout=HEARTBEAT_SECONDS)
+            return
+        except asyncio.TimeoutError:
+            pass
+        try:
+            await results.flush(session_factory, max_attempts)
+            async with session_factory() as session:
+                await extend_outbox_lease(session, list(results.unsent.values()))
+            if rate_budget is not None:
+                await _share_rate(session_factory, broadcaster, rate_budget)
+        except Exception as e:
+            log.warning("Outbox heartbeat failed: %s", e)
+
+
+async def _share_rate(
+    session_factory: async_sessionmaker[AsyncSession], broadcaster: Broadcaster, rate_budget: float
+) -> None:
+    async with session_factory() as session:
+        senders = await register_broadcast_sender(session, SENDER_ID, live_seconds=SENDER_LIVE_SECONDS)
+    rate = rate_budget / max(1, senders)
+    if rate != broadcaster.rate_per_second:
+        log.info("Broadcast rate %.1f/s (%d senders sharing %.0f/s)", rate, senders, rate_budget)
+        broadcaster.set_rate(rate)
+
+
+async def _skip_delivered(
+    session_factory: async_sessionmaker[AsyncSession],
+    ledger: DeliveryLedger,
+    batch: list[OutboxItem],
+    keys: dict[int, int],
+) -> list[int]:
+    """Returns the ids of rows in ``batch`` that were already delivered."""
+    sent: list[int] = []
+    recheck: list[OutboxItem] = []
+    for item in batch:
+        if ledger.delivered(item.user_id, keys[item.id]):
+            sent.append(item.id)
+        elif item.attempts > 1:
+            # Only a re-claimed row can have been sent by someone else.
+            recheck.append(item)
+
+    if recheck:
+        async with session_factory() as session:
+            done = await users_with_delivery(session, [(i.user_id, keys[i.id]) for i in recheck])
+        for item in recheck:
+            if item.user_id in done:
+                ledger.stats.db_hits += 1
+                ledger.record(item.user_id, keys[item.id])
+                sent.append(item.id)
+    return sent
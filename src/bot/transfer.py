@@ -0,0 +1,284 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from typing import AsyncIterator, Optional
+from urllib.parse import urlsplit
+
+import asyncpg
+
+from db.dal import User, UserLocation, create_engine
+from db.migrations import migrate
+
+log = logging.getLogger("bot.transfer")
+
+# Bulk copy of subscribers between databases:
+#
+#   python -m bot.transfer export DIR [--batch-size 100000]
+#   python -m bot.transfer import DIR
+#
+# The database comes from --dsn, else $DB_DSN, else the bot's settings.
+#
+# DIR holds one pair of gzipped CSV files per batch of users (ordered by
+# user_id) plus manifest.json. Both directions stream through COPY, one batch
+# per transaction, so memory use doesn't depend on the number of rows. An
+# interrupted export continues after the last finished batch when run
+# again; an interrupted import skips the batches recorded in
+# import-progress.json for the same target database.
+#
+# Importing a batch replaces those users' rows and their location
+# selections; other users in the target are left alone. A running bot picks
+# the imported subscriptions up at its next subscription index check.
+
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+IMPORT_PROGRESS = "import-progress.json"
+COPY_BLOCK = 1 << 20
+
+USERS_COLUMNS = [c.name for c in User.__table__.columns]
+LOCATIONS_COLUMNS = [c.name for c in UserLocation.__table__.columns]
+
+
+def _asyncpg_dsn(dsn: str) -> str:
+    return dsn.replace("postgresql+asyncpg://", "postgresql://", 1)
+
+
+def _target_name(dsn: str) -> str:
+    # host:port/dbname, without credentials.
+    parts = urlsplit(_asyncpg_dsn(dsn))
+    return f"{parts.hostname}:{parts.port or 5432}{parts.path}"
+
+
+def _copy_count(status: str) -> int:
+    # "COPY 1234"
+    return int(status.rsplit(" ", 1)[-1])
+
+
+def _write_json(path: Path, data: dict) -> None:
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(data, indent=1), encoding="utf-8")
+    tmp.replace(path)
+
+
+# ----------------------------- Export ----------------------------------------
+
+async def _copy_out(conn: asyncpg.Connection, query: str, args: tuple, path: Path) -> int:
+    tmp = path.with_name(path.name + ".part")
+    with gzip.open(tmp, "wb", compresslevel=6) as out:
+        async def write(data: bytes) -> None:
+            out.write(data)
+
+        status = await conn.copy_from_query(query, *args, output=write, format="csv")
+    tmp.replace(path)
+    return _copy_count(status)
+
+
+async def export(dsn: str, directory: Path, *, batch_size: int) -> None:
+    directory.mkdir(parents=True, exist_ok=True)
+    manifest_path = directory / MANIFEST
+    if manifest_path.exists():
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+        if manifest.get("complete"):
+            raise SystemExit(f"{directory} already holds a complete export")
+        log.info("Resuming export after %d batches", len(manifest["chunks"]))
+    else:
+        manifest = {
+            "format": FORMAT_VERSION,
+            "users_columns": USERS_COLUMNS,
+            "locations_columns": LOCATIONS_COLUMNS,
+            "chunks": [],
+            "complete": False,
+        }
+
+    users_cols = ", ".join(manifest["users_columns"])
+    locations_cols = ", ".join(manifest["locations_columns"])
+    conn = await asyncpg.connect(_asyncpg_dsn(dsn))
+    try:
+        lower = manifest["chunks"][-1]["last_user_id"] if manifest["chunks"] else -(1 << 63)
+        while True:
+            started = time.perf_counter()
+            upper = await conn.fetchval(
+                "SELECT max(user_id) FROM (SELECT user_id FROM users WHERE user_id > $1 ORDER BY user_id LIMIT $2) s",
+                lower, batch_size,
+            )
+            if upper is None:
+                break
+            name = f"{len(manifest['chunks']) + 1:06d}"
+            # Both queries in one snapshot, so every exported location has its user.
+            async with conn.transaction(isolation="repeatable_read", readonly=True):
+                users = await _copy_out(
+                    conn,
+                    f"SELECT {users_cols} FROM users WHERE user_id > $1 AND user_id <= $2 ORDER BY user_id",
+                    (lower, upper), directory / f"users-{name}.csv.gz",
+                )
+                locations = await _copy_out(
+                    conn,
+                    f"SELECT {locations_cols} FROM user_locations WHERE user_id > $1 AND user_id <= $2"
+                    " ORDER BY user_id, location_code",
+                    (lower, upper), directory / f"locations-{name}.csv.gz",
+                )
+            manifest["chunks"].append({
+                "name": name, "after_user_id": lower, "last_user_id": upper,
+                "users": users, "locations": locations,
+            })
+            _write_json(manifest_path, manifest)
+            took = time.perf_counter() - started
+            log.info("Batch %s: %d users, %d locations in %.2fs", name, users, locations, took)
+            lower = upper
+    finally:
+        await conn.close()
+
+    manifest["complete"] = True
+    _write_json(manifest_path, manifest)
+    total = sum(c["users"] for c in manifest["chunks"])
+    log.info("Exported %d users in %d batches to %s", total, len(manifest["chunks"]), directory)
+
+
+# ----------------------------- Import ----------------------------------------
+
+async def _gunzip(path: Path) -> AsyncIterator[bytes]:
+    with gzip.open(path, "rb") as f:
+        while block := f.read(COPY_BLOCK):
+            yield block
+
+
+def _checked_columns(manifest: dict, key: str, known: list[str]) -> list[str]:
+    # Column names end up in SQL text: only accept ones the schema has.
+    cols = list(manifest[key])
+    unknown = [c for c in cols if c not in known]
+    if unknown:
+        raise SystemExit(f"Export has columns this schema doesn't know: {', '.join(unknown)}")
+    return cols
+
+
+async def _import_chunk(
+    conn: asyncpg.Connection, directory: Path, name: str, users_cols: list[str], locations_cols: list[str]
+) -> tuple[int, int]:
+    cols = ", ".join(users_cols)
+    updates = ", ".join(f"{c} = excluded.{c}" for c in users_cols if c != "user_id")
+    async with conn.transaction():
+        await conn.execute(
+            "CREATE TEMP TABLE import_users (LIKE users INCLUDING DEFAULTS) ON COMMIT DROP;"
+            "CREATE TEMP TABLE import_locations (LIKE user_locations) ON COMMIT DROP"
+        )
+        await conn.copy_to_table(
+            "import_users", source=_gunzip(directory / f"users-{name}.csv.gz"), columns=users_cols, format="csv"
+        )
+        await conn.copy_to_table(
+            "import_locations", source=_gunzip(directory / f"locations-{name}.csv.gz"),
+            columns=locations_cols, format="csv",
+        )
+        users = await conn.execute(
+            f"INSERT INTO users ({cols}) SELECT {cols} FROM import_users "
+            f"ON CONFLICT (user_id) DO UPDATE SET {updates}"
+        )
+        await conn.execute("DELETE FROM user_locations WHERE user_id IN (SELECT user_id FROM import_users)")
+        locations = await conn.execute(
+            "INSERT INTO user_locations (user_id, location_code) "
+            "SELECT user_id, location_code FROM import_locations ON CONFLICT DO NOTHING"
+        )
+    return _copy_count(users), _copy_count(locations)
+
+
+async def import_(dsn: str, directory: Path, *, restart: bool = False) -> None:
+    manifest_path = directory / MANIFEST
+    if not manifest_path.exists():
+        raise SystemExit(f"No {MANIFEST} in {directory}")
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    if manifest.get("format") != FORMAT_VERSION:
+        raise SystemExit(f"Unsupported export format {manifest.get('format')!r}")
+    if not manifest.get("complete"):
+        raise SystemExit(f"{directory} holds an unfinished export; run the export again to complete it")
+    users_cols = _checked_columns(manifest, "users_columns", USERS_COLUMNS)
+    locations_cols = _checked_columns(manifest, "locations_columns", LOCATIONS_COLUMNS)
+
+    engine = create_engine(dsn)
+    try:
+        await migrate(engine)
+    finally:
+        await engine.dispose()
+
+    target = _target_name(dsn)
+    progress_path = directory / IMPORT_PROGRESS
+    progress = {"target": target, "done": []}
+    if progress_path.exists() and not restart:
+        saved = json.loads(progress_path.read_text(encoding="utf-8"))
+        if saved.get("target") == target:
+            progress = saved
+            log.info("Resuming import, %d batches already done", len(progress["done"]))
+    done = set(progress["done"])
+
+    conn = await asyncpg.connect(_asyncpg_dsn(dsn))
+    try:
+        for chunk in manifest["chunks"]:
+            name = chunk["name"]
+            if name in done:
+                continue
+            started = time.perf_counter()
+            users, locations = await _import_chunk(conn, directory, name, users_cols, locations_cols)
+            progress["done"].append(name)
+            _write_json(progress_path, progress)
+            took = time.perf_counter() - started
+            log.info("Batch %s: %d users, %d locations in %.2fs", name, users, locations, took)
+        await conn.execute("ANALYZE users; ANALYZE user_locations")
+    finally:
+        await conn.close()
+
+    total = sum(c["users"] for c in manifest["chunks"])
+    log.info("Imported %d users from %s into %s", total, directory, target)
+
+
+# ----------------------------- CLI -------------------------------------------
+
+def _default_dsn() -> Optional[str]:
+    dsn = os.getenv("DB_DSN")
+    if dsn:
+        return dsn
+    try:
+        from utils.config import get_settings
+
+        return get_settings().effective_db_dsn
+    except RuntimeError:
+        return None
+
+
+def _setup_logging() -> None:
+    # Settings may not load here (no BOT_TOKEN on a migration host), so the
+    # level comes straight from the environment.
+    lvl = getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO)
+    logging.basicConfig(level=lvl, format="%(asctime)s %(levelname)s [%(name)s] %(message)s")
+
+
+def main() -> int:
+    _setup_logging()
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--dsn", default=None, help="database; defaults to $DB_DSN or the bot settings")
+    parser = argparse.ArgumentParser(prog="python -m bot.transfer", description="Bulk export/import of subscribers.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    exp = sub.add_parser("export", parents=[common], help="write users and their locations to DIR")
+    exp.add_argument("directory", type=Path)
+    exp.add_argument("--batch-size", type=int, default=100_000, help="users per batch")
+    imp = sub.add_parser("import", parents=[common], help="load an export from DIR")
+    imp.add_argument("directory", type=Path)
+    imp.add_argument("--restart", action="store_true", help="ignore import-progress.json and load every batch")
+    args = parser.parse_args()
+
+    dsn = args.dsn or _default_dsn()
+    if not dsn:
+        parser.error("--dsn, DB_DSN or the bot settings are required")
+    if args.command == "export":
+        asyncio.run(export(dsn, args.directory, batch_size=max(1, args.batch_size)))
+    else:
+        asyncio.run(import_(dsn, args.directory, restart=args.restart))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import signal
+
+from telegram import Bot
+from telegram.request import HTTPXRequest
+
+from utils.config import get_settings
+from db.dal import create_engine, create_session_factory, pool_stats, prewarm_pool
+from bot.broadcast import Broadcaster
+from bot.ledger import DeliveryLedger
+from bot.outbox import drain_outbox
+
+log = logging.getLogger("bot.worker")
+
+# Send-only worker: `python -m bot.worker`. Run any number of these next to
+# `bot.app`; each one claims disjoint outbox batches (FOR UPDATE SKIP LOCKED)
+# and sends them, so fan-out scales with the number of workers. The app
+# process stays responsible for polling updates and enqueueing each hour.
+#
+# Telegram's flood limit is per bot token, not per process:
+# BROADCAST_RATE_PER_SECOND is the budget for the token, split evenly between
+# the processes currently sending (see broadcast_senders).
+
+
+def _setup_logging() -> None:
+    settings = get_settings()
+    lvl = getattr(logging, settings.log_level.upper(), logging.INFO)
+    logging.basicConfig(level=lvl, format="%(asctime)s %(levelname)s [%(name)s] %(message)s")
+
+
+async def amain() -> None:
+    settings = get_settings()
+    _setup_logging()
+    log.info("Starting broadcast worker...")
+
+    engine = create_engine(settings.effective_db_dsn, **settings.db_engine_options())
+    session_factory = create_session_factory(engine)
+    try:
+        await prewarm_pool(engine, settings.db_pool_prewarm)
+    except Exception as e:
+        log.warning("Connection pool pre-warm failed: %s", e)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+
+    request = HTTPXRequest(connection_pool_size=max(1, settings.broadcast_workers))
+    try:
+        bot_kwargs = {"base_url": settings.telegram_api_base_url} if settings.telegram_api_base_url else {}
+        async with Bot(settings.bot_token, request=request, **bot_kwargs) as bot:
+            broadcaster = Broadcaster(
+                bot,
+                workers=settings.broadcast_workers,
+                rate_per_second=settings.broadcast_rate_per_second,
+                max_retries=settings.broadcast_max_retries,
+            )
+            ledger = DeliveryLedger()
+            stats_due = loop.time() + settings.db_pool_stats_log_seconds
+            while not stop.is_set():
+                if settings.db_pool_stats_log_seconds and loop.time() >= stats_due:
+                    stats_due = loop.time() + settings.db_pool_stats_log_seconds
+                    stats = pool_stats(engine)
+                    if stats is not None:
+                        log.info("DB pool: %s", stats.as_log_str())
+                try:
+                    await drain_outbox(
+                        session_factory,
+                        broadcaster,
+                        batch_size=settings.outbox_batch_size,
+                        max_attempts=settings.outbox_max_attempts,
+                        ledger=ledger,
+                        rate_budget=settings.broadcast_rate_per_second,
+                    )
+                except Exception as e:
+                    log.warning("Outbox drain failed: %s", e)
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=settings.worker_poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+    finally:
+        log.info("Shutting down...")
+        await engine.dispose()
+
+
+def main() -> None:
+    asyncio.run(amain())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Optional
+
+from services.d2_api import D2ApiError, D2ParseError, TerrorZone
+from services.zone_state import ZoneStateService
+
+log = logging.getLogger("bot.zone_poller")
+
+OnZoneChange = Callable[[TerrorZone, datetime], Awaitable[None]]
+OnUpcomingZone = Callable[[TerrorZone, datetime], Awaitable[None]]
+
+
+@dataclass
+class PollStats:
+    hours: int = 0
+    detected: int = 0
+    timed_out: int = 0
+    upstream_calls: int = 0
+    last_latency_seconds: Optional[float] = None
+    last_upstream_calls: int = 0
+    predicted: int = 0
+    prediction_hits: int = 0
+
+    def as_log_str(self) -> str:
+        latency = "n/a" if self.last_latency_seconds is None else f"{self.last_latency_seconds:.1f}s"
+        return (
+            f"hours={self.hours} detected={self.detected} timed_out={self.timed_out} "
+            f"upstream_calls={self.upstream_calls} last_latency={latency} "
+            f"last_calls={self.last_upstream_calls} "
+            f"predicted={self.predicted} prediction_hits={self.prediction_hits}"
+        )
+
+
+class ZonePoller:
+    """
+    Detects the hourly zone rotation instead of assuming when it happens.
+
+    ``run_hour`` is started shortly before the hour boundary. It records the
+    outgoing zone, then from the boundary on polls the upstream on a short,
+    backing-off interval until the reported zone differs from it or matches
+    the announced next zone (which covers a zone repeating), and calls
+    ``on_change`` right away. If neither happens within ``deadline``, the
+    current zone is notified anyway; without an announced next zone a repeat
+    can't be told from a slow upstream, so ``unpredicted_deadline`` applies.
+
+    When the pre-boundary response announces the next zone, ``on_upcoming``
+    is started with it and the boundary time, so recipients can be staged
+    while waiting. It gets until the change is detected and is cancelled
+    after that.
+    """
+
+    def __init__(
+        self,
+        zone_state: ZoneStateService,
+        on_change: OnZoneChange,
+        *,
+        initial_interval: float = 5.0,
+        max_interval: float = 60.0,
+        backoff: float = 1.5,
+        deadline: timedelta = timedelta(minutes=15),
+        unpredicted_deadline: timedelta = timedelta(minutes=3),
+        on_upcoming: Optional[OnUpcomingZone] = None,
+    ) -> None:
+        self._zone_state = zone_state
+        self._on_change = on_change
+        self._on_upcoming = on_upcoming
+        self._initial = initial_interval
+        self._max = max_interval
+        self._backoff = backoff
+        self._deadline = deadline
+        self._unpredicted_deadline = unpredicted_deadline
+        self.stats = PollStats()
+
+    async def run_hour(self) -> None:
+        # Nearest hour boundary: the job is meant to start just before it, but a
+        # late start must not push the detection to the next hour.
+        now = datetime.now(timezone.utc)
+        boundary = (now + timedelta(minutes=30)).replace(minute=0, second=0, microsecond=0)
+        calls = 0
+
+        baseline: Optional[TerrorZone]
+        try:
+            calls += 1
+            baseline = await self._zone_state.refresh()
+        except (D2ApiError, D2ParseError) as e:
+            log.warning("Pre-boundary zone fetch failed: %s", e)
+            baseline = self._zone_state.peek()
+
+        staging: Optional[asyncio.Task] = None
+        if self._on_upcoming is not None and baseline is not None and baseline.next is not None:
+            staging = asyncio.create_task(self._stage(baseline.next, boundary), name="zone-poller-stage")
+
+        try:
+            zone, now = await self._poll(boundary, baseline, calls)
+        finally:
+            if staging is not None and not staging.done():
+                log.info("Staging for %r not finished at the change; cancelling", baseline.next.name)
+                staging.cancel()
+        if zone is None:
+            return
+
+        if baseline is not None and baseline.next is not None:
+            self.stats.predicted += 1
+            if zone.name == baseline.next.name:
+                self.stats.prediction_hits += 1
+        await self._on_change(zone, now)
+
+    async def _poll(
+        self, boundary: datetime, baseline: Optional[TerrorZone], calls: int
+    ) -> tuple[Optional[TerrorZone], datetime]:
+        wait = (boundary - datetime.now(timezone.utc)).total_seconds()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+        predicted = baseline.next if baseline is not None else None
+        deadline = self._deadline if predicted is not None else self._unpredicted_deadline
+        interval = self._initial
+        zone: Optional[TerrorZone] = None
+        while True:
+            try:
+                calls += 1
+                zone = await self._zone_state.refresh()
+            except (D2ApiError, D2ParseError) as e:
+                log.warning("Boundary zone poll failed: %s", e)
+                zone = None
+
+            now = datetime.now(timezone.utc)
+            if zone is not None and (
+                baseline is None or zone.name != baseline.name
+                or (predicted is not None and zone.name == predicted.name)
+            ):
+                self._record(now - boundary, calls, detected=True)
+                break
+            if now - boundary >= deadline:
+                self._record(now - boundary, calls, detected=False)
+                if zone is None:
+                    log.warning("No zone from upstream %s after the hour; skipping", deadline)
+                    return None, now
+                log.info("Zone still %r after %s; notifying anyway", zone.name, deadline)
+                break
+            await asyncio.sleep(interval)
+            interval = min(interval * self._backoff, self._max)
+        return zone, now
+
+    async def _stage(self, upcoming: TerrorZone, boundary: datetime) -> None:
+        try:
+            await self._on_upcoming(upcoming, boundary)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.warning("Staging for upcoming zone %r failed: %s", upcoming.name, e)
+
+    def _record(self, latency: timedelta, calls: int, *, detected: bool) -> None:
+        st = self.stats
+        st.hours += 1
+        st.upstream_calls += calls
+        st.last_upstream_calls = calls
+        st.last_latency_seconds = latency.total_seconds()
+        if detected:
+            st.detected += 1
+        else:
+            st.timed_out += 1
+        log.info("Zone rotation poll: %s", st.as_log_str())
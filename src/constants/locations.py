@@ -50,6 +50,47 @@ CODES_TO_NAME: Dict[str, str] = {
     "5.7": "Worldstone Keep, Throne of Destruction, and Worldstone Chamber",
 }
 
+# Stable bit positions for users.location_mask (a BIGINT, so at most 63 codes).
+# Append new codes with the next free bit; never renumber existing ones.
+LOCATION_BITS: Dict[str, int] = {
+    "1.1": 0,
+    "1.2": 1,
+    "1.3": 2,
+    "1.4": 3,
+    "1.5": 4,
+    "1.6": 5,
+    "1.7": 6,
+    "1.8": 7,
+    "1.9": 8,
+    "1.10": 9,
+    "1.11": 10,
+    "1.12": 11,
+    "2.1": 12,
+    "2.2": 13,
+    "2.3": 14,
+    "2.4": 15,
+    "2.5": 16,
+    "2.6": 17,
+    "2.7": 18,
+    "2.8": 19,
+    "3.1": 20,
+    "3.2": 21,
+    "3.3": 22,
+    "3.4": 23,
+    "3.5": 24,
+    "3.6": 25,
+    "4.1": 26,
+    "4.2": 27,
+    "4.3": 28,
+    "5.1": 29,
+    "5.2": 30,
+    "5.3": 31,
+    "5.4": 32,
+    "5.5": 33,
+    "5.6": 34,
+    "5.7": 35,
+}
+
 def _code_key(code: str) -> Tuple[int, int]:
     a, b = code.split(".")
     return int(a), int(b)
@@ -91,3 +132,9 @@ def name_by_code(code: str) -> str:
 
 def code_by_name(name: str) -> Optional[str]:
     return EN_TO_CODE.get(normalize_name(name))
+
+def location_bit(code: str) -> Optional[int]:
+    return LOCATION_BITS.get(code)
+
+def codes_from_mask(mask: int) -> Tuple[str, ...]:
+    return tuple(code for code, bit in LOCATION_BITS.items() if mask >> bit & 1)
@@ -1,7 +1,10 @@
 from __future__ import annotations
 
-from datetime import datetime, timezone
-from typing import Optional
+import asyncio
+import time
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Iterable, Optional
 
 from sqlalchemy import (
     BigInteger,
@@ -10,23 +13,37 @@ from sqlalchemy import (
     DateTime,
     ForeignKey,
     Index,
+    Integer,
     SmallInteger,
     String,
     UniqueConstraint,
     and_,
+    case,
+    literal_column,
     or_,
     select,
     delete,
+    update,
     func,
     text,
+    tuple_,
 )
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import DBAPIError, TimeoutError as SATimeoutError
 from sqlalchemy.ext.asyncio import (
+    AsyncConnection,
     AsyncEngine,
     AsyncSession,
     async_sessionmaker,
     create_async_engine,
 )
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from constants.locations import codes_from_mask, location_bit
+
+
+ALL_HOURS_MASK = (1 << 24) - 1
 
 
 class Base(DeclarativeBase):
@@ -41,12 +58,29 @@ class User(Base):
     allowed_start_hour: Mapped[int] = mapped_column(SmallInteger, nullable=False, server_default=text("0"))
     allowed_end_hour: Mapped[int] = mapped_column(SmallInteger, nullable=False, server_default=text("24"))
     language_code: Mapped[str] = mapped_column(String(8), nullable=False, server_default=text("'ru'"))
+    # Denormalised copies of user_locations and the hour window, kept in sync by
+    # the write functions below: bit LOCATION_BITS[code] / bit <hour> is set when
+    # the user is subscribed / may be notified at that UTC hour.
+    location_mask: Mapped[int] = mapped_column(BigInteger, nullable=False, server_default=text("0"))
+    hours_mask: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text(str(ALL_HOURS_MASK)))
+    # Set when Telegram reports the chat as permanently undeliverable (bot
+    # blocked, account deleted, ...); cleared by the next update from the user.
+    unreachable_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    # delivery_key() of the last zone alert delivered to this user.
+    last_delivered_key: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now())
 
     __table_args__ = (
         CheckConstraint("allowed_start_hour >= 0 AND allowed_start_hour <= 24", name="chk_users_start_hour"),
         CheckConstraint("allowed_end_hour >= 0 AND allowed_end_hour <= 24", name="chk_users_end_hour"),
+        # Covering partial index: the recipient query is an index-only scan
+        # with the bitwise tests evaluated on the included columns.
+        Index(
+            "idx_users_recipients", "user_id",
+            postgresql_where=text("notifications_enabled AND unreachable_at IS NULL"),
+            postgresql_include=["location_mask", "hours_mask"],
+        ),
     )
 
     locations: Mapped[list["UserLocation"]] = relationship(
@@ -66,10 +100,118 @@ class UserLocation(Base):
 
     __table_args__ = (
         UniqueConstraint("user_id", "location_code", name="uq_user_location"),
-        Index("idx_user_locations_location", "location_code"),
+        # (location_code, user_id) serves keyset pagination over a zone's recipients.
+        Index("idx_user_locations_location", "location_code", "user_id"),
+    )
+
+
+OUTBOX_PENDING = "pending"
+OUTBOX_SENDING = "sending"
+OUTBOX_SENT = "sent"
+OUTBOX_FAILED = "failed"
+OUTBOX_EXPIRED = "expired"
+# Enqueued ahead of the hour for the announced next zone; not claimable until released.
+OUTBOX_STAGED = "staged"
+
+# A claimed row that is still "sending" after this long is assumed orphaned
+# (process died mid-send) and becomes claimable again. The claiming worker
+# renews the lease of its unsent rows while the batch is going out.
+OUTBOX_LEASE_SECONDS = 120
+OUTBOX_BACKOFF_BASE_SECONDS = 15
+OUTBOX_BACKOFF_MAX_SECONDS = 300
+
+
+class NotificationOutbox(Base):
+    __tablename__ = "notification_outbox"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    zone_hour: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    user_id: Mapped[int] = mapped_column(
+        BigInteger, ForeignKey("users.user_id", ondelete="CASCADE"), nullable=False
+    )
+    location_code: Mapped[str] = mapped_column(String(32), nullable=False)
+    status: Mapped[str] = mapped_column(String(16), nullable=False, server_default=text(f"'{OUTBOX_PENDING}'"))
+    attempts: Mapped[int] = mapped_column(SmallInteger, nullable=False, server_default=text("0"))
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("zone_hour", "user_id", name="uq_outbox_zone_hour_user"),
+        Index("idx_outbox_due", "status", "next_attempt_at"),
     )
 
 
+class BroadcastRun(Base):
+    """One completion record per zone-hour, shared by every worker draining the outbox."""
+
+    __tablename__ = "broadcast_runs"
+
+    zone_hour: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    location_code: Mapped[str] = mapped_column(String(32), nullable=False)
+    queued: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text("0"))
+    sent: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text("0"))
+    failed: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text("0"))
+    throttled: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text("0"))
+    enqueue_done: Mapped[bool] = mapped_column(Boolean, nullable=False, server_default=text("FALSE"))
+    started_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    completed_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
+
+class BroadcastSender(Base):
+    """Processes sending alerts, so they can split the bot token's rate limit between them."""
+
+    __tablename__ = "broadcast_senders"
+
+    sender_id: Mapped[str] = mapped_column(String(128), primary_key=True)
+    seen_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+
+@dataclass(frozen=True)
+class BroadcastRunSummary:
+    zone_hour: datetime
+    location_code: str
+    sent: int
+    failed: int
+    throttled: int
+    wall_seconds: float
+
+
+@dataclass(frozen=True, slots=True)
+class UserSettings:
+    """
+    What the menus show for a user, read by column projection (no ORM
+    entity); cached by services.user_settings_cache.
+    """
+
+    user_id: int
+    notifications_enabled: bool
+    allowed_start_hour: int
+    allowed_end_hour: int
+    language_code: str
+    locations: frozenset[str]
+
+
+@dataclass(frozen=True)
+class OutboxItem:
+    id: int
+    user_id: int
+    location_code: str
+    zone_hour: datetime
+    attempts: int
+
+
+# Session.info key under which an in-process subscription index (see
+# services.subscription_index) can be attached to the session factory.
+# Write functions below keep it in sync after each successful commit.
+SUBSCRIPTION_INDEX_KEY = "subscription_index"
+# Same for the per-user settings cache (services.user_settings_cache).
+USER_SETTINGS_CACHE_KEY = "user_settings_cache"
+# And for a db.replica.ReplicaRouter: the read-only functions marked below
+# send their query to the replica while it is caught up.
+READ_REPLICA_KEY = "read_replica"
+
+
 def _to_asyncpg_dsn(dsn: str) -> str:
     if dsn.startswith("postgresql+asyncpg://"):
         return dsn
@@ -78,17 +220,161 @@ def _to_asyncpg_dsn(dsn: str) -> str:
     return dsn
 
 
-def create_engine(dsn: str) -> AsyncEngine:
-    return create_async_engine(_to_asyncpg_dsn(dsn), pool_pre_ping=True)
+# ----------------------------- Connection pool -------------------------------
+
+@dataclass
+class PoolStats:
+    checkouts: int = 0
+    timeouts: int = 0
+    wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+    # Filled in by pool_stats() at the time of the snapshot.
+    size: int = 0
+    in_use: int = 0
+    idle: int = 0
+    overflow: int = 0
+
+    def as_log_str(self) -> str:
+        avg_ms = self.wait_seconds / self.checkouts * 1000 if self.checkouts else 0.0
+        return (
+            f"size={self.size} in_use={self.in_use} idle={self.idle} overflow={self.overflow} "
+            f"checkouts={self.checkouts} timeouts={self.timeouts} "
+            f"wait_avg_ms={avg_ms:.2f} wait_max_ms={self.max_wait_seconds * 1000:.2f}"
+        )
+
+
+class MeteredQueuePool(AsyncAdaptedQueuePool):
+    """The default asyncio pool, counting checkouts and the time spent waiting for them."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            conn = super().connect()
+        except SATimeoutError:
+            self.stats.timeouts += 1
+            raise
+        waited = time.perf_counter() - started
+        stats = self.stats
+        stats.checkouts += 1
+        stats.wait_seconds += waited
+        if waited > stats.max_wait_seconds:
+            stats.max_wait_seconds = waited
+        return conn
+
+    def recreate(self) -> "MeteredQueuePool":
+        # engine.dispose() swaps in a fresh pool; keep the counters.
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+def create_engine(
+    dsn: str,
+    *,
+    pool_size: int = 10,
+    max_overflow: int = 10,
+    pool_timeout: float = 30,
+    pool_recycle: int = -1,
+    pool_pre_ping: bool = False,
+    statement_cache_size: int = 100,
+) -> AsyncEngine:
+    return create_async_engine(
+        _to_asyncpg_dsn(dsn),
+        poolclass=MeteredQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+        pool_recycle=pool_recycle,
+        pool_pre_ping=pool_pre_ping,
+        connect_args={
+            # SQLAlchemy's prepared-statement LRU and asyncpg's own cache.
+            "prepared_statement_cache_size": statement_cache_size,
+            "statement_cache_size": statement_cache_size,
+        },
+    )
+
+
+def pool_stats(engine: AsyncEngine) -> Optional[PoolStats]:
+    pool = engine.sync_engine.pool
+    if not isinstance(pool, MeteredQueuePool):
+        return None
+    return replace(
+        pool.stats,
+        size=pool.size(),
+        in_use=pool.checkedout(),
+        idle=pool.checkedin(),
+        overflow=max(0, pool.overflow()),
+    )
+
+
+async def prewarm_pool(engine: AsyncEngine, connections: int) -> int:
+    """Opens up to ``connections`` pooled connections ahead of the first real query."""
+    pool = engine.sync_engine.pool
+    count = min(connections, pool.size()) if isinstance(pool, QueuePool) else connections
+    if count <= 0:
+        return 0
+    # Hold them all at once, otherwise the pool just hands back the same one.
+    results = await asyncio.gather(*(engine.connect().start() for _ in range(count)), return_exceptions=True)
+    opened = [r for r in results if isinstance(r, AsyncConnection)]
+    for conn in opened:
+        await conn.close()
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if errors:
+        raise errors[0]
+    return len(opened)
+
+
+def create_session_factory(engine: AsyncEngine, *, info: Optional[dict] = None) -> async_sessionmaker[AsyncSession]:
+    return async_sessionmaker(engine, expire_on_commit=False, info=info)
+
+
+def window_hours_mask(start_hour: int, end_hour: int) -> int:
+    """24-bit mask of UTC hours allowed by a window; mirrors ``_is_hour_allowed_sql``."""
+    if start_hour == end_hour:
+        return (1 << start_hour) if start_hour < 24 else 0
+    if start_hour < end_hour:
+        return sum(1 << h for h in range(start_hour, end_hour))
+    return sum(1 << h for h in range(start_hour, 24)) | sum(1 << h for h in range(0, end_hour))
 
 
-def create_session_factory(engine: AsyncEngine) -> async_sessionmaker[AsyncSession]:
-    return async_sessionmaker(engine, expire_on_commit=False)
+def _subscription_index(session: AsyncSession):
+    return session.info.get(SUBSCRIPTION_INDEX_KEY)
 
 
-async def ensure_schema(engine: AsyncEngine) -> None:
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+def _settings_cache(session: AsyncSession):
+    return session.info.get(USER_SETTINGS_CACHE_KEY)
+
+
+def _replica(session: AsyncSession, user_id: Optional[int] = None):
+    router = session.info.get(READ_REPLICA_KEY)
+    if router is None or not router.usable(user_id):
+        return None
+    return router
+
+
+def _note_user_write(session: AsyncSession, user_id: int) -> None:
+    router = session.info.get(READ_REPLICA_KEY)
+    if router is not None:
+        router.note_write(user_id)
+
+
+_REPLICA_ERRORS = (DBAPIError, OSError, asyncio.TimeoutError)
+
+
+async def _read_rows(session: AsyncSession, stmt, *, user_id: Optional[int] = None) -> list:
+    """Runs a read-only statement on the replica when usable, else on ``session``."""
+    router = _replica(session, user_id)
+    if router is not None:
+        try:
+            async with router.session() as replica:
+                return (await replica.execute(stmt)).all()
+        except _REPLICA_ERRORS as e:
+            router.mark_failed(e)
+    return (await session.execute(stmt)).all()
 
 
 def _is_hour_allowed_sql(hour_param, start_col, end_col):
@@ -102,90 +388,692 @@ def _is_hour_allowed_sql(hour_param, start_col, end_col):
     )
 
 
-async def upsert_user(session: AsyncSession, user_id: int, *, language_code: Optional[str] = None) -> User:
-    user = await session.get(User, user_id)
-    if user is None:
-        user = User(user_id=user_id)
-        session.add(user)
-        await session.flush()
+async def upsert_user(session: AsyncSession, user_id: int, *, language_code: Optional[str] = None) -> None:
+    values: dict = {"user_id": user_id}
+    if language_code:
+        values["language_code"] = language_code
+    q = pg_insert(User).values(**values)
     if language_code:
-        user.language_code = language_code
+        q = q.on_conflict_do_update(
+            index_elements=[User.user_id],
+            set_={"language_code": q.excluded.language_code, "updated_at": func.now()},
+        )
+    else:
+        q = q.on_conflict_do_nothing(index_elements=[User.user_id])
+    await session.execute(q)
     await session.commit()
-    await session.refresh(user)
-    return user
+    _note_user_write(session, user_id)
+    cache = _settings_cache(session)
+    if cache is not None and language_code:
+        cache.update(user_id, language_code=language_code)
 
 
 async def get_user(session: AsyncSession, user_id: int) -> Optional[User]:
     return await session.get(User, user_id)
 
 
-async def set_notifications_enabled(session: AsyncSession, user_id: int, enabled: bool) -> None:
-    user = await session.get(User, user_id)
-    if user is None:
-        user = User(user_id=user_id, notifications_enabled=enabled)
-        session.add(user)
-    else:
-        user.notifications_enabled = enabled
+def _user_settings_select(user_id: int):
+    # One row with the locations aggregated in place of the ORM's second
+    # (selectin) query for User.locations.
+    u = User
+    locations = select(func.array_agg(UserLocation.location_code)).where(
+        UserLocation.user_id == u.user_id
+    ).scalar_subquery()
+    return select(
+        u.user_id, u.notifications_enabled, u.allowed_start_hour, u.allowed_end_hour, u.language_code, locations,
+    ).where(u.user_id == user_id)
+
+
+async def get_user_settings(session: AsyncSession, user_id: int) -> Optional[UserSettings]:
+    """
+    Menu-facing settings of a user, served from the settings cache when
+    attached. Read-only; may be served by the replica.
+    """
+    cache = _settings_cache(session)
+    if cache is not None:
+        cached = cache.get(user_id)
+        if cached is not None:
+            return cached
+        token = cache.load_token()
+    rows = await _read_rows(session, _user_settings_select(user_id), user_id=user_id)
+    if not rows:
+        return None
+    uid, enabled, start, end, language, codes = rows[0]
+    settings = UserSettings(
+        user_id=int(uid),
+        notifications_enabled=bool(enabled),
+        allowed_start_hour=int(start),
+        allowed_end_hour=int(end),
+        language_code=str(language),
+        locations=frozenset(codes or ()),
+    )
+    if cache is not None:
+        cache.put(settings, token=token)
+    return settings
+
+
+async def _upsert_user_fields(session: AsyncSession, user_id: int, **fields) -> None:
+    # One INSERT .. ON CONFLICT instead of get-then-write: a single round trip,
+    # and no lost update when two taps race.
+    q = pg_insert(User).values(user_id=user_id, **fields)
+    q = q.on_conflict_do_update(
+        index_elements=[User.user_id],
+        set_={**{k: getattr(q.excluded, k) for k in fields}, "updated_at": func.now()},
+    )
+    await session.execute(q)
     await session.commit()
+    _note_user_write(session, user_id)
+
+
+async def set_notifications_enabled(session: AsyncSession, user_id: int, enabled: bool) -> None:
+    await _upsert_user_fields(session, user_id, notifications_enabled=enabled)
+    index = _subscription_index(session)
+    if index is not None:
+        index.set_enabled(user_id, enabled)
+    cache = _settings_cache(session)
+    if cache is not None:
+        cache.update(user_id, notifications_enabled=enabled)
 
 
 async def set_notification_window(session: AsyncSession, user_id: int, start_hour: int, end_hour: int) -> None:
     if not (0 <= start_hour <= 24 and 0 <= end_hour <= 24):
         raise ValueError("start_hour and end_hour must be within 0..24")
-    user = await session.get(User, user_id)
-    if user is None:
-        user = User(user_id=user_id, allowed_start_hour=start_hour, allowed_end_hour=end_hour)
-        session.add(user)
-    else:
-        user.allowed_start_hour = start_hour
-        user.allowed_end_hour = end_hour
-    await session.commit()
+    await _upsert_user_fields(
+        session, user_id,
+        allowed_start_hour=start_hour,
+        allowed_end_hour=end_hour,
+        hours_mask=window_hours_mask(start_hour, end_hour),
+    )
+    index = _subscription_index(session)
+    if index is not None:
+        index.set_window(user_id, start_hour, end_hour)
+    cache = _settings_cache(session)
+    if cache is not None:
+        cache.update(user_id, allowed_start_hour=start_hour, allowed_end_hour=end_hour)
 
 
-async def add_location(session: AsyncSession, user_id: int, location_code: str) -> bool:
-    user = await session.get(User, user_id)
-    if user is None:
-        user = User(user_id=user_id)
-        session.add(user)
-        await session.flush()
+# The location writes below are single statements: the users row (created if
+# missing) and its location_mask bit change together with user_locations.
+# Unknown codes have no mask bit and pass 0.
 
-    from sqlalchemy import select
-    exists_q = select(UserLocation).where(
-        UserLocation.user_id == user_id, UserLocation.location_code == location_code
+_ADD_LOCATION_SQL = text("""
+    WITH u AS (
+        INSERT INTO users (user_id, location_mask) VALUES (:user_id, :bit)
+        ON CONFLICT (user_id) DO UPDATE
+            SET location_mask = users.location_mask | excluded.location_mask, updated_at = now()
+        RETURNING user_id
     )
-    exists = (await session.execute(exists_q)).scalar_one_or_none()
-    if exists:
-        return False
+    INSERT INTO user_locations (user_id, location_code)
+    SELECT user_id, :code FROM u
+    ON CONFLICT DO NOTHING
+    RETURNING location_code
+""")
 
-    session.add(UserLocation(user_id=user_id, location_code=location_code))
+_REMOVE_LOCATION_SQL = text("""
+    WITH del AS (
+        DELETE FROM user_locations WHERE user_id = :user_id AND location_code = :code
+        RETURNING user_id
+    )
+    UPDATE users SET location_mask = location_mask & ~CAST(:bit AS BIGINT), updated_at = now()
+    WHERE user_id IN (SELECT user_id FROM del)
+    RETURNING user_id
+""")
+
+# Removes the location if selected, adds it otherwise, and returns the
+# resulting selection; rows flagged ``added`` are the one just inserted.
+# All parts see the same snapshot, so the selection is assembled from the
+# rows before the statement minus ``del`` plus ``ins``.
+_TOGGLE_LOCATION_SQL = text("""
+    WITH del AS (
+        DELETE FROM user_locations WHERE user_id = :user_id AND location_code = :code
+        RETURNING location_code
+    ),
+    u AS (
+        INSERT INTO users (user_id, location_mask) VALUES (:user_id, :bit)
+        ON CONFLICT (user_id) DO UPDATE SET
+            location_mask = CASE WHEN EXISTS (SELECT 1 FROM del)
+                THEN users.location_mask & ~excluded.location_mask
+                ELSE users.location_mask | excluded.location_mask END,
+            updated_at = now()
+        RETURNING user_id
+    ),
+    ins AS (
+        INSERT INTO user_locations (user_id, location_code)
+        SELECT user_id, :code FROM u WHERE NOT EXISTS (SELECT 1 FROM del)
+        ON CONFLICT DO NOTHING
+        RETURNING location_code
+    )
+    SELECT ul.location_code, false AS added FROM user_locations ul
+    WHERE ul.user_id = :user_id AND ul.location_code NOT IN (SELECT location_code FROM del)
+    UNION ALL
+    SELECT location_code, true FROM ins
+""")
+
+
+def _bit_value(location_code: str) -> int:
+    bit = location_bit(location_code)
+    return 0 if bit is None else 1 << bit
+
+
+async def add_location(session: AsyncSession, user_id: int, location_code: str) -> bool:
+    res = await session.execute(
+        _ADD_LOCATION_SQL, {"user_id": user_id, "code": location_code, "bit": _bit_value(location_code)}
+    )
+    inserted = res.first() is not None
     await session.commit()
-    return True
+    _note_user_write(session, user_id)
+    if inserted:
+        index = _subscription_index(session)
+        if index is not None:
+            index.add_location(user_id, location_code)
+        cache = _settings_cache(session)
+        if cache is not None:
+            cache.add_locations(user_id, (location_code,))
+    return inserted
 
 
 async def remove_location(session: AsyncSession, user_id: int, location_code: str) -> bool:
-    q = delete(UserLocation).where(UserLocation.user_id == user_id, UserLocation.location_code == location_code).execution_options(synchronize_session=False)
-    res = await session.execute(q)
+    res = await session.execute(
+        _REMOVE_LOCATION_SQL, {"user_id": user_id, "code": location_code, "bit": _bit_value(location_code)}
+    )
+    removed = res.first() is not None
     await session.commit()
-    return (res.rowcount or 0) > 0
+    _note_user_write(session, user_id)
+    if removed:
+        index = _subscription_index(session)
+        if index is not None:
+            index.remove_location(user_id, location_code)
+        cache = _settings_cache(session)
+        if cache is not None:
+            cache.remove_locations(user_id, (location_code,))
+    return removed
+
+
+async def toggle_location(session: AsyncSession, user_id: int, location_code: str) -> tuple[bool, set[str]]:
+    """Flips one subscription in a single statement; returns (added, selection after the change)."""
+    res = await session.execute(
+        _TOGGLE_LOCATION_SQL, {"user_id": user_id, "code": location_code, "bit": _bit_value(location_code)}
+    )
+    rows = res.all()
+    await session.commit()
+    _note_user_write(session, user_id)
+    added = any(flag for _, flag in rows)
+    selected = {str(code) for code, _ in rows}
+    index = _subscription_index(session)
+    if index is not None:
+        if added:
+            index.add_location(user_id, location_code)
+        else:
+            index.remove_location(user_id, location_code)
+    cache = _settings_cache(session)
+    if cache is not None:
+        cache.update(user_id, locations=frozenset(selected))
+    return added, selected
 
 
 async def get_user_locations(session: AsyncSession, user_id: int) -> set[str]:
+    """Read-only; may be served by the replica."""
+    if _settings_cache(session) is not None:
+        settings = await get_user_settings(session, user_id)
+        return set(settings.locations) if settings is not None else set()
     q = select(UserLocation.location_code).where(UserLocation.user_id == user_id)
-    rows = await session.execute(q)
-    return {str(code) for (code,) in rows.all()}
+    return {str(code) for (code,) in await _read_rows(session, q, user_id=user_id)}
+
+
+def _recipient_conditions(location_code: str, hour: int):
+    u = User
+    bit = location_bit(location_code)
+    if bit is None:
+        # Codes outside the catalogue have no mask bit; match them via the join.
+        l = UserLocation
+        return (
+            u.notifications_enabled.is_(True),
+            u.unreachable_at.is_(None),
+            l.location_code == location_code,
+            _is_hour_allowed_sql(hour, u.allowed_start_hour, u.allowed_end_hour),
+        )
+    # Bare boolean (not "IS true") so the planner matches idx_users_recipients.
+    return (
+        u.notifications_enabled,
+        u.unreachable_at.is_(None),
+        u.location_mask.op("&")(1 << bit) != 0,
+        u.hours_mask.op("&")(1 << hour) != 0,
+    )
+
+
+def _recipients_select(location_code: str, hour: int):
+    u = User
+    q = select(u.user_id)
+    if location_bit(location_code) is None:
+        q = q.join(UserLocation, UserLocation.user_id == u.user_id)
+    return q.where(*_recipient_conditions(location_code, hour))
 
 
 async def users_to_notify_for_location(session: AsyncSession, location_code: str, *, now_utc: Optional[datetime] = None) -> list[int]:
+    """Read-only; may be served by the replica."""
+    if now_utc is None:
+        now_utc = datetime.now(timezone.utc)
+    hour = now_utc.hour
+
+    q = _recipients_select(location_code, hour)
+    return [int(uid) for (uid,) in await _read_rows(session, q)]
+
+
+async def iter_users_to_notify_for_location(
+    session: AsyncSession,
+    location_code: str,
+    *,
+    now_utc: Optional[datetime] = None,
+    batch_size: int = 1000,
+) -> AsyncIterator[list[int]]:
+    """
+    Same recipients as ``users_to_notify_for_location``, yielded in batches of
+    at most ``batch_size`` ids ordered by user_id. Uses keyset pagination, so
+    every page is a short independent query and no cursor is held open.
+    Read-only; pages may be served by the replica.
+    """
     if now_utc is None:
         now_utc = datetime.now(timezone.utc)
     hour = now_utc.hour
 
     u = User
-    l = UserLocation
-    q = select(u.user_id).join(l, l.user_id == u.user_id).where(
-        u.notifications_enabled.is_(True),
-        l.location_code == location_code,
-        _is_hour_allowed_sql(hour, u.allowed_start_hour, u.allowed_end_hour),
+    base = _recipients_select(location_code, hour).order_by(u.user_id).limit(batch_size)
+
+    last_id: Optional[int] = None
+    while True:
+        q = base if last_id is None else base.where(u.user_id > last_id)
+        batch = [int(uid) for (uid,) in await _read_rows(session, q)]
+        if not batch:
+            return
+        yield batch
+        if len(batch) < batch_size:
+            return
+        last_id = batch[-1]
+
+
+async def load_subscription_snapshot(
+    session: AsyncSession, *, batch_size: int = 5000
+) -> tuple[list[tuple[int, bool, bool, int, int]], list[tuple[int, str]]]:
+    """
+    Reads every subscribed user's (user_id, enabled, reachable, start_hour,
+    end_hour) and their (user_id, location_code) pairs, decoded from
+    location_mask in a single pass over ``users``.
+    """
+    u = User
+    q = select(
+        u.user_id, u.notifications_enabled, u.unreachable_at.is_(None),
+        u.allowed_start_hour, u.allowed_end_hour, u.location_mask,
+    ).where(u.location_mask != 0)
+
+    users: list[tuple[int, bool, bool, int, int]] = []
+    locations: list[tuple[int, str]] = []
+    result = await session.stream(q.execution_options(yield_per=batch_size))
+    async for uid, enabled, reachable, start, end, mask in result:
+        uid = int(uid)
+        users.append((uid, bool(enabled), bool(reachable), int(start), int(end)))
+        locations.extend((uid, code) for code in codes_from_mask(int(mask)))
+
+    return users, locations
+
+
+async def mark_users_unreachable(session: AsyncSession, user_ids: Iterable[int]) -> int:
+    id_list = list(user_ids)
+    if not id_list:
+        return 0
+    u = User
+    q = update(u).where(u.user_id.in_(id_list), u.unreachable_at.is_(None)).values(
+        unreachable_at=func.now()
+    ).execution_options(synchronize_session=False)
+    res = await session.execute(q)
+    await session.commit()
+    index = _subscription_index(session)
+    if index is not None:
+        for uid in id_list:
+            index.set_reachable(uid, False)
+    return int(res.rowcount or 0)
+
+
+async def mark_user_reachable(session: AsyncSession, user_id: int) -> bool:
+    u = User
+    q = update(u).where(u.user_id == user_id, u.unreachable_at.is_not(None)).values(
+        unreachable_at=None
+    ).execution_options(synchronize_session=False)
+    res = await session.execute(q)
+    await session.commit()
+    reactivated = (res.rowcount or 0) > 0
+    index = _subscription_index(session)
+    if reactivated and index is not None:
+        index.set_reachable(user_id, True)
+    return reactivated
+
+
+# ----------------------------- Notification outbox ---------------------------
+
+def zone_hour_of(now_utc: datetime) -> datetime:
+    return now_utc.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def delivery_key(zone_hour: datetime, location_code: str) -> int:
+    """Packs (zone-hour, location) into one int: hours since epoch * 64 + location bit."""
+    bit = location_bit(location_code)
+    hours = int(zone_hour.timestamp()) // 3600
+    return hours * 64 + (bit if bit is not None else 63)
+
+
+async def enqueue_outbox_batch(
+    session: AsyncSession,
+    location_code: str,
+    user_ids: Iterable[int],
+    *,
+    now_utc: Optional[datetime] = None,
+    staged: bool = False,
+) -> int:
+    """
+    Writes one pending outbox row per user for the current zone-hour.
+    Users who already have a row for that hour are skipped, so repeated
+    scheduler runs never enqueue twice. With ``staged`` the rows are held
+    back until ``release_staged_outbox``.
+    """
+    if now_utc is None:
+        now_utc = datetime.now(timezone.utc)
+    zone_hour = zone_hour_of(now_utc)
+    status = OUTBOX_STAGED if staged else OUTBOX_PENDING
+    rows = [
+        {"zone_hour": zone_hour, "user_id": int(uid), "location_code": location_code, "status": status}
+        for uid in user_ids
+    ]
+    if not rows:
+        return 0
+    q = pg_insert(NotificationOutbox).values(rows).on_conflict_do_nothing(
+        constraint="uq_outbox_zone_hour_user"
+    )
+    res = await session.execute(q)
+    await session.commit()
+    return int(res.rowcount or 0)
+
+
+async def expire_stale_outbox(session: AsyncSession, *, now_utc: Optional[datetime] = None) -> int:
+    # An alert for an hour that is already over is worse than no alert.
+    if now_utc is None:
+        now_utc = datetime.now(timezone.utc)
+    o = NotificationOutbox
+    q = update(o).where(
+        o.status.in_((OUTBOX_PENDING, OUTBOX_SENDING, OUTBOX_STAGED)),
+        o.zone_hour < zone_hour_of(now_utc),
+    ).values(status=OUTBOX_EXPIRED).execution_options(synchronize_session=False)
+    res = await session.execute(q)
+    await session.commit()
+    return int(res.rowcount or 0)
+
+
+async def purge_finished_outbox(session: AsyncSession, *, now_utc: Optional[datetime] = None) -> int:
+    """
+    Deletes outbox rows of past hours that are done with (sent, failed or
+    expired), and the broadcast_runs rows of past hours that are complete or
+    will never complete (enqueueing died). Returns the number of outbox rows
+    deleted. Run after ``expire_stale_outbox``, which leaves no past-hour row
+    unfinished.
+    """
+    if now_utc is None:
+        now_utc = datetime.now(timezone.utc)
+    zone_hour = zone_hour_of(now_utc)
+    o = NotificationOutbox
+    res = await session.execute(
+        delete(o).where(
+            o.zone_hour < zone_hour,
+            o.status.in_((OUTBOX_SENT, OUTBOX_FAILED, OUTBOX_EXPIRED)),
+        ).execution_options(synchronize_session=False)
+    )
+    r = BroadcastRun
+    await session.execute(
+        delete(r).where(
+            r.zone_hour < zone_hour,
+            or_(r.completed_at.is_not(None), r.enqueue_done.is_(False)),
+        ).execution_options(synchronize_session=False)
     )
+    await session.commit()
+    return int(res.rowcount or 0)
+
+
+async def release_staged_outbox(
+    session: AsyncSession, location_code: str, *, now_utc: Optional[datetime] = None
+) -> int:
+    """
+    Makes the rows staged for this zone-hour claimable if they were staged
+    for ``location_code`` and their user is still a recipient (notifications
+    on, reachable, subscribed, hour allowed); drops the rest, including all
+    of them if the prediction was wrong. Returns the number of rows released.
+    """
+    if now_utc is None:
+        now_utc = datetime.now(timezone.utc)
+    o = NotificationOutbox
+    zone_hour = zone_hour_of(now_utc)
+    still_recipient = _recipients_select(location_code, zone_hour.hour).where(User.user_id == o.user_id).exists()
+    res = await session.execute(
+        update(o).where(
+            o.zone_hour == zone_hour,
+            o.status == OUTBOX_STAGED,
+            o.location_code == location_code,
+            still_recipient,
+        ).values(status=OUTBOX_PENDING, next_attempt_at=func.now()).execution_options(synchronize_session=False)
+    )
+    await session.execute(
+        delete(o).where(
+            o.zone_hour == zone_hour,
+            o.status == OUTBOX_STAGED,
+        ).execution_options(synchronize_session=False)
+    )
+    await session.commit()
+    return int(res.rowcount or 0)
+
+
+def _lease_expiry():
+    return literal_column(f"now() + interval '{OUTBOX_LEASE_SECONDS} seconds'")
+
+
+async def claim_outbox_batch(session: AsyncSession, limit: int) -> list[OutboxItem]:
+    o = NotificationOutbox
+    due = select(o.id).where(
+        o.status.in_((OUTBOX_PENDING, OUTBOX_SENDING)),
+        o.next_attempt_at <= func.now(),
+    ).order_by(o.next_attempt_at).limit(limit).with_for_update(skip_locked=True)
+    q = update(o).where(o.id.in_(due)).values(
+        status=OUTBOX_SENDING,
+        attempts=o.attempts + 1,
+        next_attempt_at=_lease_expiry(),
+    ).returning(
+        o.id, o.user_id, o.location_code, o.zone_hour, o.attempts
+    ).execution_options(synchronize_session=False)
+    rows = (await session.execute(q)).all()
+    await session.commit()
+    return [
+        OutboxItem(id=int(r[0]), user_id=int(r[1]), location_code=str(r[2]), zone_hour=r[3], attempts=int(r[4]))
+        for r in rows
+    ]
+
+
+async def extend_outbox_lease(session: AsyncSession, items: Iterable[OutboxItem]) -> int:
+    """Renews the lease of claimed rows still being sent; rows re-claimed by someone else are left alone."""
+    pairs = [(item.id, item.attempts) for item in items]
+    if not pairs:
+        return 0
+    o = NotificationOutbox
+    q = update(o).where(
+        tuple_(o.id, o.attempts).in_(pairs),
+        o.status == OUTBOX_SENDING,
+    ).values(next_attempt_at=_lease_expiry()).execution_options(synchronize_session=False)
+    res = await session.execute(q)
+    await session.commit()
+    return int(res.rowcount or 0)
+
+
+async def mark_outbox_sent(
+    session: AsyncSession, ids: Iterable[int], *, delivered: Iterable[tuple[int, int]] = ()
+) -> None:
+    """``delivered`` holds (user_id, delivery_key) pairs recorded as each user's last delivery."""
+    params = [{"user_id": uid, "last_delivered_key": key} for uid, key in delivered]
+    if params:
+        await session.execute(update(User), params)
+    await _set_outbox_status(session, ids, OUTBOX_SENT)
+
+
+async def users_with_delivery(session: AsyncSession, pairs: Iterable[tuple[int, int]]) -> set[int]:
+    """Of the given (user_id, delivery_key) pairs, returns users whose last delivery is that key."""
+    pair_list = list(pairs)
+    if not pair_list:
+        return set()
+    u = User
+    q = select(u.user_id).where(tuple_(u.user_id, u.last_delivered_key).in_(pair_list))
     rows = await session.execute(q)
-    return [int(uid) for (uid,) in rows.all()]
+    return {int(uid) for (uid,) in rows.all()}
+
+
+async def mark_outbox_failed(session: AsyncSession, ids: Iterable[int]) -> None:
+    await _set_outbox_status(session, ids, OUTBOX_FAILED)
+
+
+async def mark_outbox_retry(session: AsyncSession, ids: Iterable[int], *, max_attempts: int) -> None:
+    id_list = list(ids)
+    if not id_list:
+        return
+    o = NotificationOutbox
+    backoff = literal_column(
+        f"now() + least(interval '{OUTBOX_BACKOFF_BASE_SECONDS} seconds' * power(2, attempts - 1), "
+        f"interval '{OUTBOX_BACKOFF_MAX_SECONDS} seconds')"
+    )
+    q = update(o).where(o.id.in_(id_list)).values(
+        status=case((o.attempts >= max_attempts, OUTBOX_FAILED), else_=OUTBOX_PENDING),
+        next_attempt_at=backoff,
+    ).execution_options(synchronize_session=False)
+    await session.execute(q)
+    await session.commit()
+
+
+async def _set_outbox_status(session: AsyncSession, ids: Iterable[int], status: str) -> None:
+    id_list = list(ids)
+    if not id_list:
+        return
+    o = NotificationOutbox
+    q = update(o).where(o.id.in_(id_list)).values(status=status).execution_options(synchronize_session=False)
+    await session.execute(q)
+    await session.commit()
+
+
+# ----------------------------- Broadcast senders -----------------------------
+
+async def register_broadcast_sender(session: AsyncSession, sender_id: str, *, live_seconds: int) -> int:
+    """
+    Records that ``sender_id`` is alive and returns how many senders were
+    seen within the last ``live_seconds`` (including this one).
+    """
+    s = BroadcastSender
+    await session.execute(
+        delete(s).where(s.seen_at < func.now() - timedelta(seconds=live_seconds))
+        .execution_options(synchronize_session=False)
+    )
+    q = pg_insert(s).values(sender_id=sender_id)
+    q = q.on_conflict_do_update(index_elements=[s.sender_id], set_={"seen_at": func.now()})
+    await session.execute(q)
+    count = (await session.execute(select(func.count()).select_from(s))).scalar_one()
+    await session.commit()
+    return int(count)
+
+
+# ----------------------------- Broadcast runs --------------------------------
+
+async def start_broadcast_run(session: AsyncSession, location_code: str, *, now_utc: Optional[datetime] = None) -> None:
+    if now_utc is None:
+        now_utc = datetime.now(timezone.utc)
+    q = pg_insert(BroadcastRun).values(
+        zone_hour=zone_hour_of(now_utc), location_code=location_code
+    ).on_conflict_do_nothing(index_elements=["zone_hour"])
+    await session.execute(q)
+    await session.commit()
+
+
+async def unfinished_broadcast_run(session: AsyncSession, *, now_utc: Optional[datetime] = None) -> Optional[str]:
+    """
+    Location code of this zone-hour's broadcast if it was started but its
+    recipients were never all enqueued, else None. A run that is only
+    waiting for its outbox to drain needs no catch-up.
+    """
+    if now_utc is None:
+        now_utc = datetime.now(timezone.utc)
+    r = BroadcastRun
+    q = select(r.location_code).where(
+        r.zone_hour == zone_hour_of(now_utc),
+        r.completed_at.is_(None),
+        r.enqueue_done.is_(False),
+    )
+    return (await session.execute(q)).scalar_one_or_none()
+
+
+async def finish_broadcast_enqueue(
+    session: AsyncSession, queued: int, *, now_utc: Optional[datetime] = None
+) -> None:
+    if now_utc is None:
+        now_utc = datetime.now(timezone.utc)
+    r = BroadcastRun
+    q = update(r).where(r.zone_hour == zone_hour_of(now_utc)).values(
+        queued=r.queued + queued, enqueue_done=True
+    ).execution_options(synchronize_session=False)
+    await session.execute(q)
+    await session.commit()
+
+
+async def record_broadcast_progress(
+    session: AsyncSession,
+    zone_hour: datetime,
+    location_code: str,
+    *,
+    sent: int,
+    failed: int,
+    throttled: int,
+) -> None:
+    # Upsert, so rows enqueued before broadcast_runs existed still get a record.
+    r = BroadcastRun
+    q = pg_insert(r).values(
+        zone_hour=zone_hour, location_code=location_code,
+        sent=sent, failed=failed, throttled=throttled, enqueue_done=True,
+    )
+    q = q.on_conflict_do_update(
+        index_elements=["zone_hour"],
+        set_={
+            "sent": r.sent + q.excluded.sent,
+            "failed": r.failed + q.excluded.failed,
+            "throttled": r.throttled + q.excluded.throttled,
+        },
+    )
+    await session.execute(q)
+    await session.commit()
+
+
+async def complete_broadcast_runs(session: AsyncSession) -> list[BroadcastRunSummary]:
+    """
+    Marks complete every run whose recipients are all enqueued and none of
+    whose outbox rows are still pending or in flight. Each run is returned
+    exactly once, to whichever worker completed it.
+    """
+    r = BroadcastRun
+    o = NotificationOutbox
+    outstanding = select(o.id).where(
+        o.zone_hour == r.zone_hour,
+        o.status.in_((OUTBOX_PENDING, OUTBOX_SENDING)),
+    ).exists()
+    q = update(r).where(
+        r.completed_at.is_(None),
+        r.enqueue_done.is_(True),
+        ~outstanding,
+    ).values(completed_at=func.now()).returning(
+        r.zone_hour, r.location_code, r.sent, r.failed, r.throttled,
+        func.extract("epoch", func.now() - r.started_at),
+    ).execution_options(synchronize_session=False)
+    rows = (await session.execute(q)).all()
+    await session.commit()
+    return [
+        BroadcastRunSummary(
+            zone_hour=row[0], location_code=str(row[1]),
+            sent=int(row[2]), failed=int(row[3]), throttled=int(row[4]), wall_seconds=float(row[5]),
+        )
+        for row in rows
+    ]
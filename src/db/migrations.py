@@ -0,0 +1,288 @@
+"""
+Versioned schema migrations.
+
+Each migration is an async function registered with ``@migration(version,
+name)``; versions are consecutive integers and a migration is never edited
+once released - schema changes go into a new one. ``migrate`` applies the
+pending ones in order, each in its own transaction together with its row in
+``schema_version``, while holding a Postgres advisory lock so that replicas
+starting at the same time don't race. When the database is already current
+startup costs one SELECT.
+
+Migrations registered with ``transactional=False`` (e.g. CREATE INDEX
+CONCURRENTLY) run on a separate autocommit connection before their version
+row is written, so they must be safe to run again after an interruption.
+
+Migrations 1-5 reproduce what ``create_all`` and the ad-hoc column checks
+used to do, written so that they also apply cleanly on databases created
+that way (IF NOT EXISTS throughout).
+"""
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from constants.locations import LOCATION_BITS
+from db.dal import ALL_HOURS_MASK
+
+log = logging.getLogger("db.migrations")
+
+# Arbitrary application-wide key for pg_advisory_lock.
+MIGRATION_LOCK_KEY = 0x0D2B0710
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    apply: Callable[[AsyncConnection], Awaitable[None]]
+    transactional: bool = True
+
+
+MIGRATIONS: list[Migration] = []
+
+
+def migration(version: int, name: str, *, transactional: bool = True):
+    def register(fn: Callable[[AsyncConnection], Awaitable[None]]):
+        expected = len(MIGRATIONS) + 1
+        if version != expected:
+            raise RuntimeError(f"Migration {name!r} has version {version}, expected {expected}")
+        MIGRATIONS.append(Migration(version, name, fn, transactional))
+        return fn
+    return register
+
+
+async def _execute(conn: AsyncConnection, *statements: str) -> None:
+    for sql in statements:
+        await conn.execute(text(sql))
+
+
+# ----------------------------- Migrations ------------------------------------
+
+@migration(1, "initial")
+async def _initial(conn: AsyncConnection) -> None:
+    await _execute(
+        conn,
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id BIGSERIAL PRIMARY KEY,
+            notifications_enabled BOOLEAN NOT NULL DEFAULT TRUE,
+            allowed_start_hour SMALLINT NOT NULL DEFAULT 0,
+            allowed_end_hour SMALLINT NOT NULL DEFAULT 24,
+            language_code VARCHAR(8) NOT NULL DEFAULT 'ru',
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            CONSTRAINT chk_users_start_hour CHECK (allowed_start_hour >= 0 AND allowed_start_hour <= 24),
+            CONSTRAINT chk_users_end_hour CHECK (allowed_end_hour >= 0 AND allowed_end_hour <= 24)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_locations (
+            user_id BIGINT NOT NULL REFERENCES users (user_id) ON DELETE CASCADE,
+            location_code VARCHAR(32) NOT NULL,
+            PRIMARY KEY (user_id, location_code),
+            CONSTRAINT uq_user_location UNIQUE (user_id, location_code)
+        )
+        """,
+        # Databases from before migrations have the single-column form of
+        # this index; migration 5 replaces it there.
+        "CREATE INDEX IF NOT EXISTS idx_user_locations_location ON user_locations (location_code, user_id)",
+    )
+
+
+@migration(2, "notification outbox")
+async def _outbox(conn: AsyncConnection) -> None:
+    await _execute(
+        conn,
+        """
+        CREATE TABLE IF NOT EXISTS notification_outbox (
+            id BIGSERIAL PRIMARY KEY,
+            zone_hour TIMESTAMPTZ NOT NULL,
+            user_id BIGINT NOT NULL REFERENCES users (user_id) ON DELETE CASCADE,
+            location_code VARCHAR(32) NOT NULL,
+            status VARCHAR(16) NOT NULL DEFAULT 'pending',
+            attempts SMALLINT NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            CONSTRAINT uq_outbox_zone_hour_user UNIQUE (zone_hour, user_id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_outbox_due ON notification_outbox (status, next_attempt_at)",
+        """
+        CREATE TABLE IF NOT EXISTS broadcast_runs (
+            zone_hour TIMESTAMPTZ PRIMARY KEY,
+            location_code VARCHAR(32) NOT NULL,
+            queued INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            throttled INTEGER NOT NULL DEFAULT 0,
+            enqueue_done BOOLEAN NOT NULL DEFAULT FALSE,
+            started_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            completed_at TIMESTAMPTZ
+        )
+        """,
+    )
+
+
+@migration(3, "subscription masks")
+async def _subscription_masks(conn: AsyncConnection) -> None:
+    has_masks = (await conn.execute(text(
+        "SELECT 1 FROM information_schema.columns "
+        "WHERE table_name = 'users' AND column_name = 'location_mask'"
+    ))).first()
+    if has_masks:
+        return
+
+    await conn.execute(text("ALTER TABLE users ADD COLUMN location_mask BIGINT NOT NULL DEFAULT 0"))
+    await conn.execute(text(f"ALTER TABLE users ADD COLUMN hours_mask INTEGER NOT NULL DEFAULT {ALL_HOURS_MASK}"))
+    bits_values = ", ".join(f"('{code}', {bit})" for code, bit in LOCATION_BITS.items())
+    await conn.execute(text(f"""
+        UPDATE users u SET
+            location_mask = COALESCE((
+                SELECT bit_or(1::bigint << b.bit)
+                FROM user_locations ul
+                JOIN (VALUES {bits_values}) AS b(code, bit) ON b.code = ul.location_code
+                WHERE ul.user_id = u.user_id
+            ), 0),
+            hours_mask = COALESCE((
+                SELECT sum(1 << h)::int
+                FROM generate_series(0, 23) AS h
+                WHERE (u.allowed_start_hour = u.allowed_end_hour AND h = u.allowed_start_hour)
+                   OR (u.allowed_start_hour < u.allowed_end_hour AND h >= u.allowed_start_hour AND h < u.allowed_end_hour)
+                   OR (u.allowed_start_hour > u.allowed_end_hour AND (h >= u.allowed_start_hour OR h < u.allowed_end_hour))
+            ), 0)
+    """))
+
+
+@migration(4, "reachability and delivery ledger")
+async def _reachability(conn: AsyncConnection) -> None:
+    await _execute(
+        conn,
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS unreachable_at TIMESTAMPTZ",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS last_delivered_key INTEGER",
+        "DROP INDEX IF EXISTS idx_users_notify_masks",
+        "CREATE INDEX IF NOT EXISTS idx_users_recipients ON users (user_id) "
+        "INCLUDE (location_mask, hours_mask) WHERE notifications_enabled AND unreachable_at IS NULL",
+    )
+
+
+_INDEX_COLUMNS_SQL = """
+    SELECT i.indisvalid, array_agg(a.attname::text ORDER BY k.ord)
+    FROM pg_index i
+    CROSS JOIN LATERAL unnest(i.indkey) WITH ORDINALITY AS k(attnum, ord)
+    JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+    WHERE i.indexrelid = to_regclass(:name)
+    GROUP BY i.indisvalid
+"""
+
+
+async def _index_columns(conn: AsyncConnection, name: str) -> Optional[list[str]]:
+    """Key columns of a valid index, or None if it is missing or invalid (a failed concurrent build)."""
+    row = (await conn.execute(text(_INDEX_COLUMNS_SQL), {"name": name})).first()
+    if row is None or not row[0]:
+        return None
+    return list(row[1])
+
+
+@migration(5, "keyset index on user_locations", transactional=False)
+async def _keyset_index(conn: AsyncConnection) -> None:
+    # create_all never replaced the original single-column index on
+    # databases that predate the (location_code, user_id) one. Built
+    # concurrently under a temporary name so that neither reads nor writes
+    # of user_locations are blocked on a large table.
+    if await _index_columns(conn, "idx_user_locations_location") == ["location_code", "user_id"]:
+        return
+    await _execute(
+        conn,
+        "DROP INDEX CONCURRENTLY IF EXISTS idx_user_locations_location_new",
+        "CREATE INDEX CONCURRENTLY idx_user_locations_location_new ON user_locations (location_code, user_id)",
+        "DROP INDEX CONCURRENTLY IF EXISTS idx_user_locations_location",
+        "ALTER INDEX idx_user_locations_location_new RENAME TO idx_user_locations_location",
+    )
+
+
+@migration(6, "broadcast senders")
+async def _broadcast_senders(conn: AsyncConnection) -> None:
+    await _execute(
+        conn,
+        """
+        CREATE TABLE IF NOT EXISTS broadcast_senders (
+            sender_id VARCHAR(128) PRIMARY KEY,
+            seen_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+        """,
+    )
+
+
+# ----------------------------- Runner ----------------------------------------
+
+LATEST_VERSION = len(MIGRATIONS)
+
+_VERSION_SQL = "SELECT coalesce(max(version), 0) FROM schema_version"
+
+
+async def schema_version(engine: AsyncEngine) -> int:
+    """Version of the database schema; 0 when it has never been migrated."""
+    async with engine.connect() as conn:
+        try:
+            return int((await conn.execute(text(_VERSION_SQL))).scalar_one())
+        except ProgrammingError:
+            # schema_version doesn't exist yet.
+            return 0
+
+
+async def _apply_autocommit(engine: AsyncEngine, m: Migration) -> None:
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await m.apply(conn)
+
+
+async def migrate(engine: AsyncEngine) -> int:
+    """Brings the schema up to ``LATEST_VERSION``; returns the number of migrations applied."""
+    current = await schema_version(engine)
+    if current >= LATEST_VERSION:
+        if current > LATEST_VERSION:
+            log.warning("Database schema version %d is newer than this build (%d)", current, LATEST_VERSION)
+        return 0
+
+    applied = 0
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        await conn.commit()
+        try:
+            await conn.execute(text(
+                "CREATE TABLE IF NOT EXISTS schema_version ("
+                "version INTEGER PRIMARY KEY, name TEXT NOT NULL, "
+                "applied_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+            ))
+            await conn.commit()
+            # Another replica may have migrated while we waited for the lock.
+            current = int((await conn.execute(text(_VERSION_SQL))).scalar_one())
+            for m in MIGRATIONS[current:]:
+                log.info("Applying schema migration %d: %s", m.version, m.name)
+                try:
+                    if m.transactional:
+                        await m.apply(conn)
+                    else:
+                        await _apply_autocommit(engine, m)
+                    await conn.execute(
+                        text("INSERT INTO schema_version (version, name) VALUES (:v, :n)"),
+                        {"v": m.version, "n": m.name},
+                    )
+                    await conn.commit()
+                except Exception:
+                    await conn.rollback()
+                    raise
+                applied += 1
+        finally:
+            await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+            await conn.commit()
+    if applied:
+        log.info("Database schema at version %d (%d migrations applied)", LATEST_VERSION, applied)
+    return applied
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+
+log = logging.getLogger("db.replica")
+
+_PRIMARY_LSN_SQL = text("SELECT pg_current_wal_lsn()::text")
+
+# Lag in seconds behind the primary WAL position read just before:
+#   0 when the DSN points at a primary, or the replica has replayed up to
+#     that position (an idle primary writes nothing, so the last replay
+#     timestamp alone would look old);
+#   NULL when no WAL receiver is running (streaming broke, so the replica
+#     would silently stop advancing) or nothing was ever replayed;
+#   otherwise the age of the last replayed transaction.
+_LAG_SQL = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver) THEN NULL
+        WHEN pg_last_wal_replay_lsn() >= CAST(CAST(:primary_lsn AS text) AS pg_lsn) THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+""")
+
+# Recently written users are remembered at most this many at a time; past
+# that the oldest are dropped early (their reads may then see the replica
+# before it caught up, which the lag bound already limits).
+_MAX_RECENT_WRITES = 10_000
+
+
+@dataclass
+class ReplicaStats:
+    replica_reads: int = 0
+    primary_reads: int = 0
+    errors: int = 0
+    lag_seconds: Optional[float] = None
+
+    def as_log_str(self) -> str:
+        lag = f"{self.lag_seconds:.2f}s" if self.lag_seconds is not None else "unknown"
+        return (
+            f"replica_reads={self.replica_reads} primary_reads={self.primary_reads} "
+            f"errors={self.errors} lag={lag}"
+        )
+
+
+class ReplicaRouter:
+    """
+    Decides whether a read-only DAL query may go to the read replica.
+
+    Attached to the primary session factory under ``db.dal.READ_REPLICA_KEY``.
+    The replica is used while its measured lag is at most ``max_lag_seconds``;
+    ``refresh`` re-measures it against the WAL position of ``primary`` and is
+    run periodically. Reads about a user
+    who wrote through this process within the last ``max_lag_seconds`` stay on
+    the primary, so a menu never shows the state from before the user's tap.
+    """
+
+    def __init__(self, engine: AsyncEngine, *, primary: AsyncEngine, max_lag_seconds: float = 5.0) -> None:
+        self.engine = engine
+        self.primary = primary
+        self.session = async_sessionmaker(engine, expire_on_commit=False)
+        self.max_lag_seconds = max_lag_seconds
+        self.stats = ReplicaStats()
+        self._healthy = False
+        self._recent_writes: dict[int, float] = {}
+
+    @property
+    def healthy(self) -> bool:
+        return self._healthy
+
+    async def refresh(self, *, timeout: float = 5.0) -> Optional[float]:
+        """Measures replica lag; the replica is unused until this succeeds."""
+        try:
+            async with self.primary.connect() as conn:
+                primary_lsn = await asyncio.wait_for(conn.scalar(_PRIMARY_LSN_SQL), timeout)
+            async with self.engine.connect() as conn:
+                lag = await asyncio.wait_for(conn.scalar(_LAG_SQL, {"primary_lsn": primary_lsn}), timeout)
+        except Exception as e:
+            self.mark_failed(e)
+            return None
+        lag = float(lag) if lag is not None else None
+        self.stats.lag_seconds = lag
+        healthy = lag is not None and lag <= self.max_lag_seconds
+        if healthy != self._healthy:
+            log.info(
+                "Read replica %s (lag %s)",
+                "in use" if healthy else "bypassed",
+                f"{lag:.2f}s" if lag is not None else "unknown",
+            )
+        self._healthy = healthy
+        return lag
+
+    def mark_failed(self, error: BaseException) -> None:
+        self.stats.errors += 1
+        if self._healthy:
+            log.warning("Read replica bypassed until the next lag check: %s", error)
+        self._healthy = False
+
+    def usable(self, user_id: Optional[int] = None) -> bool:
+        ok = self._healthy
+        if ok and user_id is not None:
+            until = self._recent_writes.get(user_id)
+            if until is not None:
+                if time.monotonic() < until:
+                    ok = False
+                else:
+                    del self._recent_writes[user_id]
+        if ok:
+            self.stats.replica_reads += 1
+        else:
+            self.stats.primary_reads += 1
+        return ok
+
+    def note_write(self, user_id: int) -> None:
+        recent = self._recent_writes
+        recent.pop(user_id, None)
+        recent[user_id] = time.monotonic() + self.max_lag_seconds
+        if len(recent) > _MAX_RECENT_WRITES:
+            del recent[next(iter(recent))]
@@ -1,13 +1,21 @@
 from __future__ import annotations
 
 import asyncio
+import importlib.util
+import json
+import logging
+import random
+import time
 from dataclasses import dataclass
-from typing import Any, Optional
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Any, Optional, Sequence
 
 import httpx
 
 from utils.config import get_settings, Settings
 
+log = logging.getLogger("services.d2_api")
 
 # ---------------------------- Public datatypes ---------------------------------
 
@@ -16,26 +24,391 @@ class TerrorZone:
     name: str
     act: Optional[str] = None
     code: Optional[str] = None
+    # Upcoming zone, when the provider announces it ahead of the hour.
+    next: Optional["TerrorZone"] = None
 
 
 class D2ApiError(RuntimeError):
     """Network or server-side error when contacting the D2 API."""
 
+    def __init__(self, message: str, *, retry_after: Optional[float] = None) -> None:
+        super().__init__(message)
+        # Seconds the upstream asked us to wait (Retry-After), if it did.
+        self.retry_after = retry_after
+
+
+class D2CircuitOpenError(D2ApiError):
+    """The upstream has been failing; the request was not sent."""
+
 
 class D2ParseError(RuntimeError):
     """Response JSON structure doesn't contain a recognizable terror zone."""
 
 
+# ---------------------------- Payload decoding ---------------------------------
+
+try:
+    import orjson as _orjson
+except Exception:
+    _orjson = None
+
+JSON_BACKEND = "orjson" if _orjson is not None else "json"
+
+
+def loads(raw: bytes) -> Any:
+    """Parses a response body straight from bytes, with orjson when it is installed."""
+    if _orjson is not None:
+        return _orjson.loads(raw)
+    return json.loads(raw)
+
+
+def _get_str(d: Any, *path: str) -> Optional[str]:
+    cur = d
+    for key in path:
+        if not isinstance(cur, dict):
+            return None
+        cur = cur.get(key)
+    if isinstance(cur, str):
+        s = cur.strip()
+        return s if s else None
+    return None
+
+
+@dataclass(frozen=True)
+class ZoneLayout:
+    """Where one upstream layout keeps the zone name and act."""
+
+    name: str
+    zone: tuple[str, ...]
+    acts: tuple[tuple[str, ...], ...] = ()
+    reject_unknown: bool = False
+
+    def match(self, payload: dict) -> Optional[TerrorZone]:
+        name = _get_str(payload, *self.zone)
+        if not name or (self.reject_unknown and name.lower() == "unknown"):
+            return None
+        act = None
+        for path in self.acts:
+            act = _get_str(payload, *path)
+            if act:
+                break
+        return TerrorZone(name=name, act=act)
+
+
+# In priority order: the first layout that matches wins.
+CURRENT_LAYOUTS: tuple[ZoneLayout, ...] = (
+    ZoneLayout("currentTerrorZone", ("currentTerrorZone", "zone"), (("currentTerrorZone", "act"),)),
+    ZoneLayout(
+        "terrorZone.reportedZones", ("terrorZone", "reportedZones", "zone"),
+        (("terrorZone", "reportedZones", "act"), ("terrorZone", "act")),
+    ),
+    ZoneLayout("terrorZone", ("terrorZone", "zone"), (("terrorZone", "act"),), reject_unknown=True),
+    ZoneLayout("current_terror_zone", ("current_terror_zone", "zone"), (("current_terror_zone", "act"),)),
+    ZoneLayout(
+        "terror_zone.reported_zones", ("terror_zone", "reported_zones", "zone"),
+        (("terror_zone", "reported_zones", "act"), ("terror_zone", "act")),
+    ),
+    ZoneLayout("terror_zone", ("terror_zone", "zone"), (("terror_zone", "act"),)),
+    ZoneLayout("zone", ("zone",)),
+)
+
+NEXT_LAYOUTS: tuple[ZoneLayout, ...] = tuple(
+    ZoneLayout(".".join(path), (*path, "zone"), ((*path, "act"),), reject_unknown=True)
+    for path in (
+        ("nextTerrorZone",),
+        ("terrorZone", "nextTerrorZone"),
+        ("terrorZone", "next"),
+        ("next_terror_zone",),
+        ("terror_zone", "next_terror_zone"),
+        ("terror_zone", "next"),
+    )
+)
+
+
+@dataclass
+class DecoderStats:
+    decoded: int = 0
+    memo_hits: int = 0
+    scans: int = 0
+    failures: int = 0
+
+    def as_log_str(self) -> str:
+        return (
+            f"decoded={self.decoded} memo_hits={self.memo_hits} "
+            f"scans={self.scans} failures={self.failures}"
+        )
+
+
+class ZoneDecoder:
+    """
+    Turns a response payload into a TerrorZone by trying ``layouts`` in order.
+
+    A provider answers with the same layout every time, so the layout that
+    matched last is tried first. The shortcut never changes the result of
+    the in-order scan: it is taken only when no earlier layout can match,
+    i.e. their top-level key is absent, or they share the remembered
+    layout's top-level key and are tried just before it.
+    """
+
+    def __init__(
+        self,
+        layouts: Sequence[ZoneLayout] = CURRENT_LAYOUTS,
+        next_layouts: Sequence[ZoneLayout] = NEXT_LAYOUTS,
+    ) -> None:
+        self._layouts = tuple(layouts)
+        self._next_layouts = tuple(next_layouts)
+        self._plans = [self._plan(self._layouts, i) for i in range(len(self._layouts))]
+        self._next_plans = [self._plan(self._next_layouts, i) for i in range(len(self._next_layouts))]
+        self._last: Optional[int] = None
+        self._last_next: Optional[int] = None
+        self.stats = DecoderStats()
+
+    def decode(self, raw: bytes) -> Optional[TerrorZone]:
+        return self.extract(loads(raw))
+
+    def extract(self, payload: Any) -> Optional[TerrorZone]:
+        if not isinstance(payload, dict):
+            self.stats.failures += 1
+            return None
+
+        idx, tz, memo = self._match(payload, self._layouts, self._plans, self._last)
+        if tz is None:
+            self.stats.failures += 1
+            return None
+        self._last = idx
+        self.stats.decoded += 1
+        if memo:
+            self.stats.memo_hits += 1
+        else:
+            self.stats.scans += 1
+
+        idx, upcoming, _ = self._match(payload, self._next_layouts, self._next_plans, self._last_next)
+        if upcoming is not None:
+            self._last_next = idx
+            tz = TerrorZone(name=tz.name, act=tz.act, next=upcoming)
+        return tz
+
+    @staticmethod
+    def _plan(layouts: tuple[ZoneLayout, ...], i: int) -> tuple[frozenset[str], tuple[int, ...]]:
+        # (top-level keys that rule the shortcut out, layouts to try in order)
+        root = layouts[i].zone[0]
+        foreign = frozenset(lay.zone[0] for lay in layouts[:i] if lay.zone[0] != root)
+        same_root = tuple(j for j in range(i) if layouts[j].zone[0] == root)
+        return foreign, same_root + (i,)
+
+    @staticmethod
+    def _match(
+        payload: dict,
+        layouts: tuple[ZoneLayout, ...],
+        plans: list[tuple[frozenset[str], tuple[int, ...]]],
+        last: Optional[int],
+    ) -> tuple[Optional[int], Optional[TerrorZone], bool]:
+        if last is not None:
+            foreign, order = plans[last]
+            if foreign.isdisjoint(payload.keys()):
+                for j in order:
+                    tz = layouts[j].match(payload)
+                    if tz is not None:
+                        return j, tz, True
+        for j, layout in enumerate(layouts):
+            tz = layout.match(payload)
+            if tz is not None:
+                return j, tz, False
+        return None, None, False
+
+
+# ---------------------------- Providers -----------------------------------------
+
+@dataclass(frozen=True)
+class UpstreamProvider:
+    name: str
+    url: str
+    token: Optional[str] = None
+    layouts: tuple[ZoneLayout, ...] = CURRENT_LAYOUTS
+
+
+@dataclass
+class ProviderStats:
+    requests: int = 0
+    successes: int = 0
+    errors: int = 0
+    hedged: int = 0
+    wins: int = 0
+    consecutive_errors: int = 0
+    latency_ewma: Optional[float] = None
+
+    def observe_latency(self, seconds: float, *, alpha: float = 0.3) -> None:
+        if self.latency_ewma is None:
+            self.latency_ewma = seconds
+        else:
+            self.latency_ewma += alpha * (seconds - self.latency_ewma)
+
+    def as_log_str(self) -> str:
+        latency = "n/a" if self.latency_ewma is None else f"{self.latency_ewma * 1000:.0f}ms"
+        return (
+            f"requests={self.requests} ok={self.successes} errors={self.errors} "
+            f"hedged={self.hedged} wins={self.wins} latency={latency}"
+        )
+
+
+# ---------------------------- Conditional requests -----------------------------
+
+@dataclass(frozen=True)
+class _CachedResponse:
+    zone: TerrorZone
+    etag: Optional[str]
+    last_modified: Optional[str]
+    body_bytes: int
+    full_seconds: float  # round trip + decode of the full response
+
+
+@dataclass
+class TransferStats:
+    """Traffic for one UTC hour; what 304 answers saved over full responses."""
+
+    hour: Optional[datetime] = None
+    requests: int = 0
+    not_modified: int = 0
+    bytes_received: int = 0
+    bytes_saved: int = 0
+    seconds_saved: float = 0.0
+
+    def as_log_str(self) -> str:
+        return (
+            f"requests={self.requests} not_modified={self.not_modified} "
+            f"bytes_received={self.bytes_received} bytes_saved={self.bytes_saved} "
+            f"time_saved={self.seconds_saved:.2f}s"
+        )
+
+
+# ---------------------------- Circuit breaker ----------------------------------
+
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_CAP_SECONDS = 8.0
+
+BREAKER_CLOSED = "closed"
+BREAKER_OPEN = "open"
+BREAKER_HALF_OPEN = "half_open"
+
+
+@dataclass
+class BreakerStats:
+    opened: int = 0
+    rejected: int = 0
+    probes: int = 0
+
+    def as_log_str(self) -> str:
+        return f"opened={self.opened} rejected={self.rejected} probes={self.probes}"
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast while the upstream is down.
+
+    ``failure_threshold`` failed calls in a row open the breaker for
+    ``reset_timeout`` seconds (longer if the upstream sent Retry-After); a
+    failed call with Retry-After opens it for that long on its own.
+    After that a single probe call is let through: success closes the
+    breaker, failure opens it again. Only the call that ``allow`` made the
+    probe frees the probe slot, so a call started before the breaker opened
+    can't let a second probe through by finishing.
+    """
+
+    def __init__(self, *, failure_threshold: int = 3, reset_timeout: float = 30.0) -> None:
+        self._threshold = max(1, failure_threshold)
+        self._reset_timeout = reset_timeout
+        self._state = BREAKER_CLOSED
+        self._failures = 0
+        self._open_until = 0.0
+        self._probe_inflight = False
+        self.stats = BreakerStats()
+
+    @property
+    def state(self) -> str:
+        if self._state == BREAKER_OPEN and time.monotonic() >= self._open_until:
+            return BREAKER_HALF_OPEN
+        return self._state
+
+    def retry_in(self) -> float:
+        if self.state != BREAKER_OPEN:
+            return 0.0
+        return max(0.0, self._open_until - time.monotonic())
+
+    def allow(self) -> tuple[bool, bool]:
+        """
+        Returns (allowed, probe). A call that got ``probe`` must hand the slot
+        back with ``release(probe=True)`` however it ends.
+        """
+        state = self.state
+        if state == BREAKER_CLOSED:
+            return True, False
+        if state == BREAKER_HALF_OPEN and not self._probe_inflight:
+            self._state = BREAKER_HALF_OPEN
+            self._probe_inflight = True
+            self.stats.probes += 1
+            return True, True
+        self.stats.rejected += 1
+        return False, False
+
+    def record_success(self) -> None:
+        self._state = BREAKER_CLOSED
+        self._failures = 0
+
+    def record_failure(self, *, retry_after: Optional[float] = None) -> None:
+        self._failures += 1
+        if self._state == BREAKER_HALF_OPEN or self._failures >= self._threshold:
+            self._open(max(self._reset_timeout, retry_after or 0.0))
+        elif retry_after:
+            # The upstream said when to come back; no point asking before.
+            self._open(retry_after)
+
+    def _open(self, seconds: float) -> None:
+        self._state = BREAKER_OPEN
+        self._open_until = time.monotonic() + seconds
+        self.stats.opened += 1
+
+    def release(self, *, probe: bool) -> None:
+        """Frees the probe slot once the probe call has ended, whatever its outcome."""
+        if probe:
+            self._probe_inflight = False
+
+
 # ---------------------------- Client implementation ----------------------------
 
 class D2ApiClient:
-    def __init__(self, settings: Optional[Settings] = None, *, client: Optional[httpx.AsyncClient] = None) -> None:
+    """
+    Terror zone client over one or more upstream providers.
+
+    Providers are ordered by health: ones without recent errors first, then
+    by observed latency. A request goes to the first; if it has not answered
+    within the hedge budget (or fails sooner), the next one is started as
+    well, and the first response that parses wins. The whole round is
+    retried with backoff only when every provider failed.
+
+    Failed calls feed a circuit breaker; while it is open, calls raise
+    D2CircuitOpenError at once instead of waiting out timeouts and retries.
+    """
+
+    def __init__(
+        self,
+        settings: Optional[Settings] = None,
+        *,
+        client: Optional[httpx.AsyncClient] = None,
+        providers: Optional[Sequence[UpstreamProvider]] = None,
+    ) -> None:
         self._settings = settings or get_settings()
+        self._providers = list(providers) if providers else self._providers_from_settings()
         self._own_client = client is None
-        self._client = client or httpx.AsyncClient(
-            timeout=self._settings.http_timeout_seconds,
-            headers=self._build_headers(),
+        self._client = client or self._build_client()
+        self._hedge_delay = max(0, self._settings.d2_api_hedge_ms) / 1000.0
+        self.provider_stats: dict[str, ProviderStats] = {p.name: ProviderStats() for p in self._providers}
+        self._decoders: dict[str, ZoneDecoder] = {p.name: ZoneDecoder(p.layouts) for p in self._providers}
+        self.breaker = CircuitBreaker(
+            failure_threshold=self._settings.d2_breaker_failure_threshold,
+            reset_timeout=self._settings.d2_breaker_reset_seconds,
         )
+        self._cached: dict[str, _CachedResponse] = {}
+        self.transfer_stats = TransferStats()
 
     # -------- lifecycle --------
 
@@ -52,41 +425,225 @@ class D2ApiClient:
     # -------- public API --------
 
     async def get_current_terror_zone(self) -> TerrorZone:
-        url = self._settings.d2_api_url
-        token = self._settings.d2_api_token
-
-        last_err: Optional[Exception] = None
-        retries = max(0, int(self._settings.http_retries))
-
-        for attempt in range(retries + 1):
-            try:
-                resp = await self._client.get(url, params={"token": token})
-                # Retry on certain status codes
-                if resp.status_code >= 500 or resp.status_code == 429:
-                    raise D2ApiError(f"Upstream returned HTTP {resp.status_code}")
-
-                resp.raise_for_status()
-                data = resp.json()
-                tz = self._extract_current(data)
-                if tz is None or not tz.name:
-                    raise D2ParseError(
-                        f"Missing terror zone name in response JSON. Top-level keys: {list(data) if isinstance(data, dict) else type(data)}"
-                    )
-                return tz
-
-            except (httpx.TimeoutException, httpx.TransportError, D2ApiError) as e:
-                last_err = e
-                if attempt < retries:
-                    await asyncio.sleep(self._backoff_delay(attempt))
+        allowed, probe = self.breaker.allow()
+        if not allowed:
+            wait = self.breaker.retry_in()
+            raise D2CircuitOpenError(f"D2 API circuit open; next try in {wait:.0f}s", retry_after=wait)
+
+        # A half-open probe gets one attempt: its job is to find out, not to wait.
+        retries = 0 if probe else max(0, int(self._settings.http_retries))
+        last_err: Optional[D2ApiError] = None
+        delay = BACKOFF_BASE_SECONDS
+        attempt = 0
+        try:
+            for attempt in range(retries + 1):
+                try:
+                    tz = await self._hedged_fetch()
+                except D2ApiError as e:
+                    last_err = e
+                    if attempt >= retries:
+                        break
+                    delay = self._backoff_delay(delay, e.retry_after)
+                    if delay is None:
+                        break
+                    await asyncio.sleep(delay)
+                except D2ParseError:
+                    # The upstream answered; it is reachable even if we can't read it.
+                    self.breaker.record_success()
+                    raise
                 else:
-                    raise D2ApiError(f"D2 API request failed after {attempt+1} attempts: {e}") from e
-            except (ValueError, D2ParseError) as e:
-                raise D2ParseError(f"Unable to parse D2 API response: {e}") from e
-
-        raise D2ApiError(f"D2 API request failed: {last_err}")
+                    self.breaker.record_success()
+                    return tz
+        finally:
+            self.breaker.release(probe=probe)
+
+        retry_after = last_err.retry_after if last_err is not None else None
+        self.breaker.record_failure(retry_after=retry_after)
+        raise D2ApiError(
+            f"D2 API request failed after {attempt+1} attempts: {last_err}", retry_after=retry_after
+        ) from last_err
+
+    @property
+    def breaker_state(self) -> str:
+        return self.breaker.state
+
+    def providers_by_health(self) -> list[UpstreamProvider]:
+        def key(p: UpstreamProvider) -> tuple[int, float]:
+            st = self.provider_stats[p.name]
+            # Untried providers keep their configured place behind measured ones.
+            latency = st.latency_ewma if st.latency_ewma is not None else float("inf")
+            return (min(st.consecutive_errors, 3), latency)
+
+        # sorted() is stable: configuration order breaks ties.
+        return sorted(self._providers, key=key)
+
+    def stats_as_log_str(self) -> str:
+        return "; ".join(
+            f"{name}: {st.as_log_str()} {self._decoders[name].stats.as_log_str()}"
+            for name, st in self.provider_stats.items()
+        )
 
     # -------- internals --------
 
+    def _providers_from_settings(self) -> list[UpstreamProvider]:
+        st = self._settings
+        providers = [UpstreamProvider(name="primary", url=st.d2_api_url, token=st.d2_api_token)]
+        for name, url in st.d2_api_providers:
+            providers.append(UpstreamProvider(name=name, url=url, layouts=PROVIDER_LAYOUTS.get(name, CURRENT_LAYOUTS)))
+        return providers
+
+    async def _hedged_fetch(self) -> TerrorZone:
+        """One round over the providers; raises D2ParseError only if no provider had a transport error."""
+        queue = self.providers_by_health()
+        running: dict[asyncio.Task, UpstreamProvider] = {}
+        errors: list[Exception] = []
+
+        def launch() -> None:
+            provider = queue.pop(0)
+            if running:
+                self.provider_stats[provider.name].hedged += 1
+            task = asyncio.create_task(self._fetch_one(provider), name=f"d2-fetch-{provider.name}")
+            running[task] = provider
+
+        launch()
+        try:
+            while running:
+                timeout = self._hedge_delay if queue else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    launch()
+                    continue
+                for task in done:
+                    provider = running.pop(task)
+                    err = task.exception()
+                    if err is None:
+                        self.provider_stats[provider.name].wins += 1
+                        return task.result()
+                    errors.append(err)
+                if queue:
+                    # A failure is as good as a timeout for starting the next one.
+                    launch()
+        finally:
+            for task in running:
+                task.cancel()
+
+        if all(isinstance(e, D2ParseError) for e in errors):
+            raise D2ParseError("; ".join(str(e) for e in errors))
+        # Only worth waiting for if every provider asked us to.
+        waits = [getattr(e, "retry_after", None) for e in errors]
+        retry_after = min(waits) if waits and None not in waits else None
+        raise D2ApiError("; ".join(str(e) for e in errors), retry_after=retry_after)
+
+    async def _fetch_one(self, provider: UpstreamProvider) -> TerrorZone:
+        st = self.provider_stats[provider.name]
+        st.requests += 1
+        started = time.monotonic()
+        try:
+            tz = await self._request(provider)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            st.errors += 1
+            st.consecutive_errors += 1
+            # Count the time spent failing, so a provider that hangs sinks in the order.
+            st.observe_latency(time.monotonic() - started)
+            raise
+        st.successes += 1
+        st.consecutive_errors = 0
+        st.observe_latency(time.monotonic() - started)
+        return tz
+
+    async def _request(self, provider: UpstreamProvider) -> TerrorZone:
+        params = {"token": provider.token} if provider.token else None
+        cached = self._cached.get(provider.name)
+        started = time.monotonic()
+        try:
+            resp = await self._client.get(provider.url, params=params, headers=self._conditional_headers(cached))
+        except (httpx.TimeoutException, httpx.TransportError) as e:
+            raise D2ApiError(f"{provider.name}: {e!r}") from e
+
+        if resp.status_code == 304 and cached is not None:
+            self._account(received=0, cached=cached, seconds=time.monotonic() - started)
+            return cached.zone
+        if resp.status_code >= 500 or resp.status_code == 429:
+            raise D2ApiError(
+                f"{provider.name}: upstream returned HTTP {resp.status_code}",
+                retry_after=self._retry_after(resp),
+            )
+        try:
+            resp.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            raise D2ApiError(f"{provider.name}: {e}") from e
+
+        body = resp.content
+        try:
+            data = loads(body)
+        except ValueError as e:
+            raise D2ParseError(f"{provider.name}: unable to parse D2 API response: {e}") from e
+        tz = self._decoders[provider.name].extract(data)
+        if tz is None or not tz.name:
+            raise D2ParseError(
+                f"{provider.name}: missing terror zone name in response JSON. "
+                f"Top-level keys: {list(data) if isinstance(data, dict) else type(data)}"
+            )
+
+        etag = resp.headers.get("ETag")
+        last_modified = resp.headers.get("Last-Modified")
+        if etag or last_modified:
+            self._cached[provider.name] = _CachedResponse(
+                zone=tz, etag=etag, last_modified=last_modified,
+                body_bytes=len(body), full_seconds=time.monotonic() - started,
+            )
+        else:
+            self._cached.pop(provider.name, None)
+        self._account(received=len(body))
+        return tz
+
+    @staticmethod
+    def _conditional_headers(cached: Optional[_CachedResponse]) -> Optional[dict[str, str]]:
+        if cached is None:
+            return None
+        headers: dict[str, str] = {}
+        if cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+        return headers
+
+    def _account(self, *, received: int, cached: Optional[_CachedResponse] = None, seconds: float = 0.0) -> None:
+        hour = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        st = self.transfer_stats
+        if st.hour != hour:
+            if st.hour is not None and st.requests:
+                log.info("Upstream traffic for %s: %s", st.hour.isoformat(), st.as_log_str())
+            st = self.transfer_stats = TransferStats(hour=hour)
+        st.requests += 1
+        st.bytes_received += received
+        if cached is not None:
+            st.not_modified += 1
+            st.bytes_saved += cached.body_bytes
+            st.seconds_saved += max(0.0, cached.full_seconds - seconds)
+
+    def _build_client(self) -> httpx.AsyncClient:
+        st = self._settings
+        http2 = st.d2_http2
+        if http2 and importlib.util.find_spec("h2") is None:
+            log.warning("D2_HTTP2 is set but the h2 package is not installed; using HTTP/1.1")
+            http2 = False
+        # Polling near the hour reuses the same few connections; keep them
+        # open between polls instead of paying a TLS handshake each time.
+        keepalive = max(2, 2 * len(self._providers))
+        return httpx.AsyncClient(
+            timeout=st.http_timeout_seconds,
+            headers=self._build_headers(),
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=keepalive * 2,
+                max_keepalive_connections=keepalive,
+                keepalive_expiry=st.d2_keepalive_seconds,
+            ),
+        )
+
     def _build_headers(self) -> dict[str, str]:
         headers = {
             "User-Agent": "diablo-terror-bot/1.0 (+telegram)",
@@ -96,62 +653,44 @@ class D2ApiClient:
         return headers
 
     @staticmethod
-    def _get_str(d: Any, *path: str) -> Optional[str]:
-        cur = d
-        for key in path:
-            if not isinstance(cur, dict):
-                return None
-            cur = cur.get(key)
-        if isinstance(cur, str):
-            s = cur.strip()
-            return s if s else None
-        return None
+    def _retry_after(resp: httpx.Response) -> Optional[float]:
+        raw = resp.headers.get("Retry-After")
+        if not raw:
+            return None
+        raw = raw.strip()
+        if raw.isdigit():
+            return float(raw)
+        try:
+            when = parsedate_to_datetime(raw)
+        except (TypeError, ValueError):
+            return None
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
 
     @staticmethod
-    def _extract_current(payload: Any) -> Optional[TerrorZone]:
-        if not isinstance(payload, dict):
+    def _backoff_delay(previous: float, retry_after: Optional[float] = None) -> Optional[float]:
+        """
+        Decorrelated jitter: a random delay between the base and three times
+        the previous one, capped. Retry-After is a floor; if it is beyond the
+        cap, returns None and the call gives up (the breaker then stays open
+        for that long).
+        """
+        if retry_after is not None and retry_after > BACKOFF_CAP_SECONDS:
             return None
+        delay = min(BACKOFF_CAP_SECONDS, random.uniform(BACKOFF_BASE_SECONDS, previous * 3))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
 
-        name = D2ApiClient._get_str(payload, "currentTerrorZone", "zone")
-        if name:
-            act = D2ApiClient._get_str(payload, "currentTerrorZone", "act")
-            return TerrorZone(name=name, act=act)
 
-        name = D2ApiClient._get_str(payload, "terrorZone", "reportedZones", "zone")
-        if name:
-            act = D2ApiClient._get_str(payload, "terrorZone", "reportedZones", "act") or D2ApiClient._get_str(payload, "terrorZone", "act")
-            return TerrorZone(name=name, act=act)
+# ---------------------------- Provider layouts ---------------------------------
 
-        name = D2ApiClient._get_str(payload, "terrorZone", "zone")
-        if name and name.lower() != "unknown":
-            act = D2ApiClient._get_str(payload, "terrorZone", "act")
-            return TerrorZone(name=name, act=act)
-
-        name = D2ApiClient._get_str(payload, "current_terror_zone", "zone")
-        if name:
-            act = D2ApiClient._get_str(payload, "current_terror_zone", "act")
-            return TerrorZone(name=name, act=act)
-
-        name = D2ApiClient._get_str(payload, "terror_zone", "reported_zones", "zone")
-        if name:
-            act = D2ApiClient._get_str(payload, "terror_zone", "reported_zones", "act") or D2ApiClient._get_str(payload, "terror_zone", "act")
-            return TerrorZone(name=name, act=act)
-
-        name = D2ApiClient._get_str(payload, "terror_zone", "zone")
-        if name:
-            act = D2ApiClient._get_str(payload, "terror_zone", "act")
-            return TerrorZone(name=name, act=act)
-
-        name = D2ApiClient._get_str(payload, "zone")
-        if name:
-            return TerrorZone(name=name)
-
-        return None
-
-    @staticmethod
-    def _backoff_delay(attempt: int) -> float:
-        base = 0.5 * (2 ** attempt)
-        return base + 0.05 * attempt
+# Layouts by provider name (D2_API_PROVIDERS); other names use CURRENT_LAYOUTS.
+# d2runewizard.com puts the zone straight under "terrorZone".
+PROVIDER_LAYOUTS: dict[str, tuple[ZoneLayout, ...]] = {
+    "d2runewizard": (CURRENT_LAYOUTS[2],) + tuple(lay for i, lay in enumerate(CURRENT_LAYOUTS) if i != 2),
+}
 
 
 # ---------------------------- Convenience factory ------------------------------
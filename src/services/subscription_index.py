@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+import logging
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from db.dal import load_subscription_snapshot, window_hours_mask
+
+log = logging.getLogger("services.subscription_index")
+
+_ALL_HOURS = window_hours_mask(0, 24)
+
+
+@dataclass
+class _UserEntry:
+    enabled: bool = True
+    reachable: bool = True
+    hours_mask: int = _ALL_HOURS
+    codes: frozenset[str] = frozenset()
+
+    @property
+    def alert_hours(self) -> int:
+        """Hours in which this user gets alerts for any of their locations."""
+        return self.hours_mask if self.enabled and self.reachable else 0
+
+
+@dataclass
+class IndexStats:
+    users: int = 0
+    subscriptions: int = 0
+    lookups: int = 0
+    slot_rebuilds: int = 0
+    slot_updates: int = 0
+    resyncs: int = 0
+
+
+class SubscriptionIndex:
+    """
+    In-process copy of the subscription tables, shaped for recipient lookup.
+
+    location_code -> 24 hour slots -> sorted array of user ids. The database
+    stays the source of truth: the DAL write functions push each change here
+    after commit, and ``replace`` swaps in a fresh snapshot on resync.
+
+    Updates insert or remove the one user id in the affected slot arrays, so
+    a lookup at the hour boundary never has to rebuild anything. Slots are
+    built in full only by ``build_slots``: at startup, and on resync before
+    the fresh snapshot is swapped in (both off the hour boundary).
+
+    While a resync snapshot is being read, updates are also journaled so
+    they can be replayed onto the snapshot before it is swapped in.
+    """
+
+    def __init__(self) -> None:
+        self._users: dict[int, _UserEntry] = {}
+        self._subscribers: dict[str, set[int]] = {}
+        self._slots: dict[str, list[array]] = {}
+        self._slots_built = False
+        self._journal: Optional[list[tuple[str, tuple]]] = None
+        self.stats = IndexStats()
+
+    # -------- bulk load --------
+
+    @classmethod
+    def from_snapshot(
+        cls,
+        users: Iterable[tuple[int, bool, bool, int, int]],
+        locations: Iterable[tuple[int, str]],
+    ) -> "SubscriptionIndex":
+        index = cls()
+        codes_by_user: dict[int, set[str]] = {}
+        for uid, code in locations:
+            codes_by_user.setdefault(uid, set()).add(code)
+            index._subscribers.setdefault(code, set()).add(uid)
+        for uid, enabled, reachable, start, end in users:
+            index._users[uid] = _UserEntry(
+                enabled=enabled,
+                reachable=reachable,
+                hours_mask=window_hours_mask(start, end),
+                codes=frozenset(codes_by_user.get(uid, ())),
+            )
+        index._refresh_counts()
+        return index
+
+    def build_slots(self) -> None:
+        self._slots = {}
+        for code in self._subscribers:
+            self._build_location(code)
+        self._slots_built = True
+
+    def replace(self, other: "SubscriptionIndex") -> None:
+        if not other._slots_built:
+            other.build_slots()
+        self._users = other._users
+        self._subscribers = other._subscribers
+        self._slots = other._slots
+        self._slots_built = True
+        self.stats.resyncs += 1
+        self._refresh_counts()
+
+    def start_journal(self) -> None:
+        self._journal = []
+
+    def stop_journal(self) -> list[tuple[str, tuple]]:
+        journal, self._journal = self._journal or [], None
+        return journal
+
+    def replay(self, journal: Iterable[tuple[str, tuple]]) -> None:
+        # Every update sets absolute state, so replaying one the snapshot
+        # already reflects is harmless.
+        for method, args in journal:
+            getattr(self, method)(*args)
+
+    # -------- incremental updates --------
+
+    def set_enabled(self, user_id: int, enabled: bool) -> None:
+        if self._journal is not None:
+            self._journal.append(("set_enabled", (user_id, enabled)))
+        entry = self._users.setdefault(user_id, _UserEntry())
+        if entry.enabled != enabled:
+            before = entry.alert_hours
+            entry.enabled = enabled
+            self._update_slots(user_id, entry.codes, before, entry.alert_hours)
+
+    def set_reachable(self, user_id: int, reachable: bool) -> None:
+        if self._journal is not None:
+            self._journal.append(("set_reachable", (user_id, reachable)))
+        entry = self._users.get(user_id)
+        if entry is not None and entry.reachable != reachable:
+            before = entry.alert_hours
+            entry.reachable = reachable
+            self._update_slots(user_id, entry.codes, before, entry.alert_hours)
+
+    def set_window(self, user_id: int, start_hour: int, end_hour: int) -> None:
+        if self._journal is not None:
+            self._journal.append(("set_window", (user_id, start_hour, end_hour)))
+        entry = self._users.setdefault(user_id, _UserEntry())
+        mask = window_hours_mask(start_hour, end_hour)
+        if entry.hours_mask != mask:
+            before = entry.alert_hours
+            entry.hours_mask = mask
+            self._update_slots(user_id, entry.codes, before, entry.alert_hours)
+
+    def add_location(self, user_id: int, location_code: str) -> None:
+        if self._journal is not None:
+            self._journal.append(("add_location", (user_id, location_code)))
+        entry = self._users.setdefault(user_id, _UserEntry())
+        if location_code not in entry.codes:
+            entry.codes = entry.codes | {location_code}
+            self._subscribers.setdefault(location_code, set()).add(user_id)
+            self._update_slots(user_id, (location_code,), 0, entry.alert_hours)
+            self.stats.subscriptions += 1
+
+    def remove_location(self, user_id: int, location_code: str) -> None:
+        if self._journal is not None:
+            self._journal.append(("remove_location", (user_id, location_code)))
+        entry = self._users.get(user_id)
+        if entry is None or location_code not in entry.codes:
+            return
+        entry.codes = entry.codes - {location_code}
+        self._subscribers.get(location_code, set()).discard(user_id)
+        self._update_slots(user_id, (location_code,), entry.alert_hours, 0)
+        self.stats.subscriptions -= 1
+
+    # -------- lookup --------
+
+    def recipients(self, location_code: str, hour: int) -> array:
+        self.stats.lookups += 1
+        if not self._slots_built:
+            self.build_slots()
+        slots = self._slots.get(location_code)
+        if slots is None:
+            return array("q")
+        return slots[hour]
+
+    def fingerprint(self) -> tuple[int, int, int]:
+        """Cheap order-independent summary used to compare against a fresh snapshot."""
+        acc = 0
+        users = 0
+        subs = 0
+        for uid, entry in self._users.items():
+            if not entry.codes:
+                continue
+            users += 1
+            subs += len(entry.codes)
+            acc ^= hash((uid, entry.enabled, entry.reachable, entry.hours_mask, entry.codes))
+        return users, subs, acc
+
+    # -------- internals --------
+
+    def _build_location(self, location_code: str) -> None:
+        users = self._users
+        masks = [
+            (uid, users[uid].alert_hours if uid in users else 0)
+            for uid in sorted(self._subscribers.get(location_code, ()))
+        ]
+        self._slots[location_code] = [
+            array("q", [uid for uid, mask in masks if mask >> hour & 1]) for hour in range(24)
+        ]
+        self.stats.slot_rebuilds += 1
+
+    def _update_slots(self, user_id: int, codes: Iterable[str], before: int, after: int) -> None:
+        # Until the slots are first built there is nothing to keep in sync.
+        if not self._slots_built or before == after:
+            return
+        for code in codes:
+            slots = self._slots.get(code)
+            if slots is None:
+                slots = self._slots[code] = [array("q") for _ in range(24)]
+            for hour in range(24):
+                bit = 1 << hour
+                if (before ^ after) & bit:
+                    slot = slots[hour]
+                    i = bisect_left(slot, user_id)
+                    present = i < len(slot) and slot[i] == user_id
+                    if after & bit and not present:
+                        slot.insert(i, user_id)
+                    elif not after & bit and present:
+                        del slot[i]
+        self.stats.slot_updates += 1
+
+    def _refresh_counts(self) -> None:
+        self.stats.users = len(self._users)
+        self.stats.subscriptions = sum(len(e.codes) for e in self._users.values())
+
+
+async def build_subscription_index(session_factory) -> SubscriptionIndex:
+    async with session_factory() as session:
+        users, locations = await load_subscription_snapshot(session)
+    index = SubscriptionIndex.from_snapshot(users, locations)
+    index.build_slots()
+    log.info(
+        "Subscription index built: %d users, %d subscriptions",
+        index.stats.users, index.stats.subscriptions,
+    )
+    return index
+
+
+async def verify_subscription_index(session_factory, index: SubscriptionIndex) -> bool:
+    """
+    Compares the live index with a fresh DB snapshot and swaps the snapshot in
+    on mismatch (e.g. writes made by another replica). Updates that reach the
+    live index while the snapshot is read are replayed onto it first, so the
+    swap never drops them. Returns True if the index was already consistent.
+    """
+    index.start_journal()
+    try:
+        async with session_factory() as session:
+            users, locations = await load_subscription_snapshot(session)
+    finally:
+        journal = index.stop_journal()
+    fresh = SubscriptionIndex.from_snapshot(users, locations)
+    fresh.replay(journal)
+    if fresh.fingerprint() == index.fingerprint():
+        return True
+    log.warning("Subscription index drifted from the database; resynced")
+    # Slots are only built for a snapshot that is actually swapped in.
+    index.replace(fresh)
+    return False
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Iterable, Optional
+
+from db.dal import UserSettings
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    expired: int = 0
+    evictions: int = 0
+    updates: int = 0
+    invalidations: int = 0
+    stale_loads: int = 0
+
+    def as_log_str(self) -> str:
+        total = self.hits + self.misses
+        ratio = f"{self.hits / total:.1%}" if total else "n/a"
+        return (
+            f"hits={self.hits} misses={self.misses} hit_ratio={ratio} expired={self.expired} "
+            f"evictions={self.evictions} updates={self.updates} invalidations={self.invalidations} "
+            f"stale_loads={self.stale_loads}"
+        )
+
+
+class UserSettingsCache:
+    """
+    Bounded LRU of per-user settings in front of the DAL, for menu rendering.
+
+    Reads go through ``db.dal.get_user_settings``, which fills the cache on
+    a miss. The DAL write functions update cached entries after commit, so
+    entries stay current for writes made by this process; ``ttl_seconds``
+    bounds how long a change made elsewhere (another process, a manual
+    UPDATE) can go unnoticed.
+    """
+
+    def __init__(self, *, max_entries: int = 100_000, ttl_seconds: float = 300.0) -> None:
+        self._max = max(1, max_entries)
+        self._ttl = ttl_seconds
+        self._entries: OrderedDict[int, tuple[UserSettings, float]] = OrderedDict()
+        # Bumped by every write; a load that started before a write must not
+        # be stored, it may have read the row before the change.
+        self._writes = 0
+        self.stats = CacheStats()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # -------- read-through --------
+
+    def get(self, user_id: int) -> Optional[UserSettings]:
+        item = self._entries.get(user_id)
+        if item is None:
+            self.stats.misses += 1
+            return None
+        settings, expires = item
+        if time.monotonic() >= expires:
+            del self._entries[user_id]
+            self.stats.expired += 1
+            self.stats.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.stats.hits += 1
+        return settings
+
+    def load_token(self) -> int:
+        return self._writes
+
+    def put(self, settings: UserSettings, *, token: int) -> None:
+        if token != self._writes:
+            self.stats.stale_loads += 1
+            return
+        self._store(settings)
+
+    # -------- write hooks (called by the DAL after commit) --------
+
+    def update(self, user_id: int, **fields) -> None:
+        self._writes += 1
+        item = self._entries.get(user_id)
+        if item is None:
+            return
+        self._store(replace(item[0], **fields))
+        self.stats.updates += 1
+
+    def add_locations(self, user_id: int, codes: Iterable[str]) -> None:
+        item = self._entries.get(user_id)
+        self.update(user_id, **({"locations": item[0].locations | frozenset(codes)} if item else {}))
+
+    def remove_locations(self, user_id: int, codes: Iterable[str]) -> None:
+        item = self._entries.get(user_id)
+        self.update(user_id, **({"locations": item[0].locations - frozenset(codes)} if item else {}))
+
+    def invalidate(self, user_id: int) -> None:
+        self._writes += 1
+        if self._entries.pop(user_id, None) is not None:
+            self.stats.invalidations += 1
+
+    def clear(self) -> None:
+        self._writes += 1
+        self._entries.clear()
+
+    # -------- internals --------
+
+    def _store(self, settings: UserSettings) -> None:
+        self._entries[settings.user_id] = (settings, time.monotonic() + self._ttl)
+        self._entries.move_to_end(settings.user_id)
+        while len(self._entries) > self._max:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
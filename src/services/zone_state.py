@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from services.d2_api import BREAKER_OPEN, D2ApiClient, D2ApiError, TerrorZone
+
+log = logging.getLogger("services.zone_state")
+
+
+@dataclass
+class ZoneStateStats:
+    hits: int = 0
+    stale_hits: int = 0
+    misses: int = 0
+    coalesced: int = 0
+    fetches: int = 0
+    errors: int = 0
+    last_known: int = 0
+
+    def as_log_str(self) -> str:
+        return (
+            f"hits={self.hits} stale_hits={self.stale_hits} misses={self.misses} "
+            f"coalesced={self.coalesced} fetches={self.fetches} errors={self.errors} "
+            f"last_known={self.last_known}"
+        )
+
+
+class ZoneStateService:
+    """
+    Current terror zone, shared by the command handlers and the scheduler.
+
+    Freshness is tied to the hour boundary, because that is when the zone
+    rotates:
+      * a value fetched in a previous hour is never served;
+      * in the first ``boundary_minutes`` of an hour the upstream may still
+        report the old zone, so a value stays fresh for only
+        ``boundary_fresh_seconds``;
+      * otherwise a value stays fresh for ``fresh_seconds``.
+
+    Concurrent callers share one in-flight upstream request. ``get`` serves
+    a stale value from the current hour immediately and revalidates in the
+    background; ``get_fresh`` waits for a fresh value.
+    """
+
+    def __init__(
+        self,
+        client: D2ApiClient,
+        *,
+        fresh_seconds: int = 600,
+        boundary_minutes: int = 5,
+        boundary_fresh_seconds: int = 30,
+    ) -> None:
+        self._client = client
+        self._fresh = timedelta(seconds=fresh_seconds)
+        self._boundary = timedelta(minutes=boundary_minutes)
+        self._boundary_fresh = timedelta(seconds=boundary_fresh_seconds)
+        self._zone: Optional[TerrorZone] = None
+        self._fetched_at: Optional[datetime] = None
+        self._inflight: Optional[asyncio.Task] = None
+        self.stats = ZoneStateStats()
+
+    # -------- public API --------
+
+    def peek(self) -> Optional[TerrorZone]:
+        """Last known zone, whatever its age."""
+        return self._zone
+
+    async def get(self) -> TerrorZone:
+        now = datetime.now(timezone.utc)
+        if self._is_fresh(now):
+            self.stats.hits += 1
+            return self._zone
+        if self._is_current_hour(now):
+            self.stats.stale_hits += 1
+            self._revalidate()
+            return self._zone
+        self.stats.misses += 1
+        return await self._fetch()
+
+    async def get_fresh(self) -> TerrorZone:
+        now = datetime.now(timezone.utc)
+        if self._is_fresh(now):
+            self.stats.hits += 1
+            return self._zone
+        self.stats.misses += 1
+        return await self._fetch()
+
+    async def get_or_last_known(self) -> tuple[TerrorZone, bool]:
+        """
+        For user-facing answers: like ``get``, but while the upstream is down
+        returns the last known zone at once instead of waiting or raising.
+        The flag is True when that zone is from an earlier hour and may no
+        longer be current.
+        """
+        if self._zone is not None and self._client.breaker_state == BREAKER_OPEN:
+            self.stats.last_known += 1
+            return self._zone, not self._is_current_hour(datetime.now(timezone.utc))
+        try:
+            return await self.get(), False
+        except D2ApiError:
+            if self._zone is None:
+                raise
+            self.stats.last_known += 1
+            return self._zone, True
+
+    async def refresh(self) -> TerrorZone:
+        """Always asks the upstream (joining an in-flight request if any)."""
+        return await self._fetch()
+
+    # -------- internals --------
+
+    def _is_current_hour(self, now: datetime) -> bool:
+        if self._zone is None or self._fetched_at is None:
+            return False
+        hour_start = now.replace(minute=0, second=0, microsecond=0)
+        return self._fetched_at >= hour_start
+
+    def _is_fresh(self, now: datetime) -> bool:
+        if not self._is_current_hour(now):
+            return False
+        hour_start = now.replace(minute=0, second=0, microsecond=0)
+        in_boundary = self._fetched_at < hour_start + self._boundary
+        ttl = self._boundary_fresh if in_boundary else self._fresh
+        return now - self._fetched_at <= ttl
+
+    def _revalidate(self) -> None:
+        if self._inflight is not None and not self._inflight.done():
+            return
+        task = self._start_fetch()
+        task.add_done_callback(self._log_background_error)
+
+    async def _fetch(self) -> TerrorZone:
+        if self._inflight is not None and not self._inflight.done():
+            self.stats.coalesced += 1
+            task = self._inflight
+        else:
+            task = self._start_fetch()
+        # Shield: one caller being cancelled must not cancel the shared fetch.
+        return await asyncio.shield(task)
+
+    def _start_fetch(self) -> asyncio.Task:
+        self.stats.fetches += 1
+        self._inflight = asyncio.create_task(self._do_fetch(), name="zone-state-fetch")
+        return self._inflight
+
+    async def _do_fetch(self) -> TerrorZone:
+        # Stamp with the request start: a response that straddles the hour
+        # boundary may still describe the previous hour.
+        started = datetime.now(timezone.utc)
+        try:
+            zone = await self._client.get_current_terror_zone()
+        except Exception:
+            self.stats.errors += 1
+            raise
+        self._zone = zone
+        self._fetched_at = started
+        return zone
+
+    @staticmethod
+    def _log_background_error(task: asyncio.Task) -> None:
+        if task.cancelled():
+            return
+        err = task.exception()
+        if err is not None:
+            log.warning("Background zone refresh failed: %s", err)
@@ -46,15 +46,35 @@ def _env_bool(key: str, default: Optional[bool] = None) -> Optional[bool]:
     raise RuntimeError(f"Invalid bool for {key}: {raw!r}")
 
 
+def _parse_provider(entry: str) -> tuple[str, str]:
+    # "name=url"; a bare URL is named after its host.
+    name, sep, url = entry.partition("=")
+    if not sep or "://" in name:
+        url = entry
+        name = entry.split("://", 1)[-1].split("/", 1)[0]
+    if not url.strip():
+        raise RuntimeError(f"Invalid D2_API_PROVIDERS entry: {entry!r}")
+    return name.strip(), url.strip()
+
+
 @dataclass(frozen=True)
 class Settings:
     bot_token: str
 
     d2_api_token: str
+    # e.g. a self-hosted Bot API server: "http://127.0.0.1:8081/bot"
+    telegram_api_base_url: Optional[str] = None
     d2_api_url: str = "https://d2runewizard.com/api/terror-zone"
     d2_api_contact: Optional[str] = None
     d2_api_platform: Optional[str] = "Telegram"
     d2_api_repo: Optional[str] = None
+    # Extra upstreams as (name, url); tried after D2_API_URL when it is slow or failing.
+    d2_api_providers: tuple[tuple[str, str], ...] = ()
+    d2_api_hedge_ms: int = 1500
+    d2_breaker_failure_threshold: int = 3
+    d2_breaker_reset_seconds: int = 30
+    d2_http2: bool = False
+    d2_keepalive_seconds: int = 120
 
     db_dsn: Optional[str] = None
     db_host: str = "localhost"
@@ -63,11 +83,51 @@ class Settings:
     db_password: str = "postgres"
     db_name: str = "diablo_bot"
 
+    # Connection pool of the asyncpg engine (see db.dal.create_engine).
+    db_pool_size: int = 10
+    db_max_overflow: int = 10
+    db_pool_timeout_seconds: int = 30
+    db_pool_recycle_seconds: int = 0  # 0 = never recycle
+    db_pool_pre_ping: bool = False
+    db_pool_prewarm: int = 4
+    db_pool_stats_log_seconds: int = 900  # 0 = don't log
+    # Prepared statements cached per connection; 0 behind pgbouncer in transaction mode.
+    db_statement_cache_size: int = 100
+
+    # Optional streaming replica for read-only queries (menus, recipient scans).
+    db_replica_dsn: Optional[str] = None
+    db_replica_max_lag_seconds: int = 5
+    db_replica_check_seconds: int = 10
+
     notify_interval_seconds: int = 3600
     notify_align_minute: int = 2
+    notify_poll_enabled: bool = True
+    notify_poll_initial_seconds: int = 5
+    notify_poll_max_seconds: int = 60
+    notify_poll_deadline_minutes: int = 15
+    notify_poll_unpredicted_deadline_minutes: int = 3
+    notify_prestage_enabled: bool = True
     http_timeout_seconds: int = 10
     http_retries: int = 2
 
+    broadcast_workers: int = 16
+    # Per bot token: split between all processes sending alerts.
+    broadcast_rate_per_second: int = 30
+    broadcast_max_retries: int = 3
+
+    recipient_batch_size: int = 1000
+    outbox_batch_size: int = 500
+    outbox_max_attempts: int = 5
+    outbox_drain_interval_seconds: int = 30
+    worker_poll_seconds: int = 2
+
+    subscription_index_enabled: bool = True
+    subscription_index_check_seconds: int = 900
+
+    # Per-user settings cache for menu rendering; 0 entries disables it.
+    user_settings_cache_size: int = 100_000
+    user_settings_cache_ttl_seconds: int = 300
+
     default_language: str = "ru"
     supported_languages: tuple[str, ...] = ("ru",)
 
@@ -84,6 +144,16 @@ class Settings:
         name = self.db_name
         return f"postgresql://{user}:{pw}@{host}:{port}/{name}"
 
+    def db_engine_options(self) -> dict:
+        return {
+            "pool_size": self.db_pool_size,
+            "max_overflow": self.db_max_overflow,
+            "pool_timeout": self.db_pool_timeout_seconds,
+            "pool_recycle": self.db_pool_recycle_seconds or -1,
+            "pool_pre_ping": self.db_pool_pre_ping,
+            "statement_cache_size": self.db_statement_cache_size,
+        }
+
     def d2_request_headers(self) -> dict[str, str]:
         headers: dict[str, str] = {}
         if self.d2_api_contact:
@@ -100,12 +170,22 @@ def get_settings() -> Settings:
     _maybe_load_dotenv()
 
     bot_token = _env_str("BOT_TOKEN", required=True)
+    telegram_api_base_url = _env_str("TELEGRAM_API_BASE_URL", default=None) or None
     d2_api_token = _env_str("D2_API_TOKEN", required=True)
 
     d2_api_url = _env_str("D2_API_URL", default="https://d2runewizard.com/api/terror-zone")
     d2_api_contact = _env_str("D2_API_CONTACT", default=None)
     d2_api_platform = _env_str("D2_API_PLATFORM", default="Telegram")
     d2_api_repo = _env_str("D2_API_REPO", default=None)
+    d2_api_providers_raw = _env_str("D2_API_PROVIDERS", default="") or ""
+    d2_api_providers = tuple(
+        _parse_provider(x.strip()) for x in d2_api_providers_raw.split(",") if x.strip()
+    )
+    d2_api_hedge_ms = _env_int("D2_API_HEDGE_MS", default=1500) or 1500
+    d2_breaker_failure_threshold = _env_int("D2_BREAKER_FAILURE_THRESHOLD", default=3) or 3
+    d2_breaker_reset_seconds = _env_int("D2_BREAKER_RESET_SECONDS", default=30) or 30
+    d2_http2 = _env_bool("D2_HTTP2", default=False)
+    d2_keepalive_seconds = _env_int("D2_KEEPALIVE_SECONDS", default=120) or 120
 
     db_dsn = _env_str("DB_DSN", default=None)
     db_host = _env_str("DB_HOST", default="localhost") or "localhost"
@@ -114,11 +194,46 @@ def get_settings() -> Settings:
     db_password = _env_str("DB_PASSWORD", default="postgres") or "postgres"
     db_name = _env_str("DB_NAME", default="diablo_bot") or "diablo_bot"
 
+    db_pool_size = _env_int("DB_POOL_SIZE", default=10) or 10
+    db_max_overflow = _env_int("DB_MAX_OVERFLOW", default=10)
+    db_pool_timeout_seconds = _env_int("DB_POOL_TIMEOUT_SECONDS", default=30) or 30
+    db_pool_recycle_seconds = _env_int("DB_POOL_RECYCLE_SECONDS", default=0)
+    db_pool_pre_ping = _env_bool("DB_POOL_PRE_PING", default=False)
+    db_pool_prewarm = _env_int("DB_POOL_PREWARM", default=4)
+    db_pool_stats_log_seconds = _env_int("DB_POOL_STATS_LOG_SECONDS", default=900)
+    db_statement_cache_size = _env_int("DB_STATEMENT_CACHE_SIZE", default=100)
+
+    db_replica_dsn = _env_str("DB_REPLICA_DSN", default=None) or None
+    db_replica_max_lag_seconds = _env_int("DB_REPLICA_MAX_LAG_SECONDS", default=5)
+    db_replica_check_seconds = _env_int("DB_REPLICA_CHECK_SECONDS", default=10) or 10
+
     notify_interval_seconds = _env_int("NOTIFY_INTERVAL_SECONDS", default=3600) or 3600
     notify_align_minute = _env_int("NOTIFY_ALIGN_MINUTE", default=2) or 2
+    notify_poll_enabled = _env_bool("NOTIFY_POLL_ENABLED", default=True)
+    notify_poll_initial_seconds = _env_int("NOTIFY_POLL_INITIAL_SECONDS", default=5) or 5
+    notify_poll_max_seconds = _env_int("NOTIFY_POLL_MAX_SECONDS", default=60) or 60
+    notify_poll_deadline_minutes = _env_int("NOTIFY_POLL_DEADLINE_MINUTES", default=15) or 15
+    notify_poll_unpredicted_deadline_minutes = _env_int("NOTIFY_POLL_UNPREDICTED_DEADLINE_MINUTES", default=3) or 3
+    notify_prestage_enabled = _env_bool("NOTIFY_PRESTAGE_ENABLED", default=True)
     http_timeout_seconds = _env_int("HTTP_TIMEOUT_SECONDS", default=10) or 10
     http_retries = _env_int("HTTP_RETRIES", default=2) or 2
 
+    broadcast_workers = _env_int("BROADCAST_WORKERS", default=16) or 16
+    broadcast_rate_per_second = _env_int("BROADCAST_RATE_PER_SECOND", default=30) or 30
+    broadcast_max_retries = _env_int("BROADCAST_MAX_RETRIES", default=3) or 3
+
+    recipient_batch_size = _env_int("RECIPIENT_BATCH_SIZE", default=1000) or 1000
+    outbox_batch_size = _env_int("OUTBOX_BATCH_SIZE", default=500) or 500
+    outbox_max_attempts = _env_int("OUTBOX_MAX_ATTEMPTS", default=5) or 5
+    outbox_drain_interval_seconds = _env_int("OUTBOX_DRAIN_INTERVAL_SECONDS", default=30) or 30
+    worker_poll_seconds = _env_int("WORKER_POLL_SECONDS", default=2) or 2
+
+    subscription_index_enabled = _env_bool("SUBSCRIPTION_INDEX_ENABLED", default=True)
+    subscription_index_check_seconds = _env_int("SUBSCRIPTION_INDEX_CHECK_SECONDS", default=900) or 900
+
+    user_settings_cache_size = _env_int("USER_SETTINGS_CACHE_SIZE", default=100_000)
+    user_settings_cache_ttl_seconds = _env_int("USER_SETTINGS_CACHE_TTL_SECONDS", default=300) or 300
+
     default_language = _env_str("DEFAULT_LANGUAGE", default="ru") or "ru"
     supported_languages_raw = _env_str("SUPPORTED_LANGUAGES", default="ru") or "ru"
     supported_languages = tuple(
@@ -129,21 +244,57 @@ def get_settings() -> Settings:
 
     return Settings(
         bot_token=bot_token,
+        telegram_api_base_url=telegram_api_base_url,
         d2_api_token=d2_api_token,
         d2_api_url=d2_api_url or "https://d2runewizard.com/api/terror-zone",
         d2_api_contact=d2_api_contact,
         d2_api_platform=d2_api_platform,
         d2_api_repo=d2_api_repo,
+        d2_api_providers=d2_api_providers,
+        d2_api_hedge_ms=d2_api_hedge_ms,
+        d2_breaker_failure_threshold=d2_breaker_failure_threshold,
+        d2_breaker_reset_seconds=d2_breaker_reset_seconds,
+        d2_http2=bool(d2_http2),
+        d2_keepalive_seconds=d2_keepalive_seconds,
         db_dsn=db_dsn,
         db_host=db_host,
         db_port=db_port,
         db_user=db_user,
         db_password=db_password,
         db_name=db_name,
+        db_pool_size=db_pool_size,
+        db_max_overflow=max(0, db_max_overflow),
+        db_pool_timeout_seconds=db_pool_timeout_seconds,
+        db_pool_recycle_seconds=max(0, db_pool_recycle_seconds),
+        db_pool_pre_ping=bool(db_pool_pre_ping),
+        db_pool_prewarm=max(0, db_pool_prewarm),
+        db_pool_stats_log_seconds=max(0, db_pool_stats_log_seconds),
+        db_statement_cache_size=max(0, db_statement_cache_size),
+        db_replica_dsn=db_replica_dsn,
+        db_replica_max_lag_seconds=max(0, db_replica_max_lag_seconds),
+        db_replica_check_seconds=db_replica_check_seconds,
         notify_interval_seconds=notify_interval_seconds,
         notify_align_minute=notify_align_minute,
+        notify_poll_enabled=bool(notify_poll_enabled),
+        notify_poll_initial_seconds=notify_poll_initial_seconds,
+        notify_poll_max_seconds=notify_poll_max_seconds,
+        notify_poll_deadline_minutes=notify_poll_deadline_minutes,
+        notify_poll_unpredicted_deadline_minutes=notify_poll_unpredicted_deadline_minutes,
+        notify_prestage_enabled=bool(notify_prestage_enabled),
         http_timeout_seconds=http_timeout_seconds,
         http_retries=http_retries,
+        broadcast_workers=broadcast_workers,
+        broadcast_rate_per_second=broadcast_rate_per_second,
+        broadcast_max_retries=broadcast_max_retries,
+        recipient_batch_size=recipient_batch_size,
+        outbox_batch_size=outbox_batch_size,
+        outbox_max_attempts=outbox_max_attempts,
+        outbox_drain_interval_seconds=outbox_drain_interval_seconds,
+        worker_poll_seconds=worker_poll_seconds,
+        subscription_index_enabled=bool(subscription_index_enabled),
+        subscription_index_check_seconds=subscription_index_check_seconds,
+        user_settings_cache_size=max(0, user_settings_cache_size),
+        user_settings_cache_ttl_seconds=user_settings_cache_ttl_seconds,
         default_language=default_language,
         supported_languages=supported_languages,
         log_level=log_level,